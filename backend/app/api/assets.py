@@ -2,19 +2,311 @@
 资源相关 API
 处理文件访问和下载
 """
-from fastapi import APIRouter, Depends, HTTPException, Path, Query
-from fastapi.responses import Response
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import Optional
+from starlette.background import BackgroundTask
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import hashlib
 import logging
+import os
+import time
 
+from app.config import settings
 from app.database import get_db
+from app.models.gen_log import GenLog
 from app.models.log_asset import LogAsset
-from app.services.rustfs_client import rustfs_client
+from app.services.rustfs_client import CircuitBreaker, rustfs_client, RangeNotSatisfiable, StorageUnavailable
+from app.services.rendition_store import rendition_store
+from app.services.image_executor import ImageExecutorBusy
+from app.services.similarity_index import similarity_index, MAX_DISTANCE
+from app.utils.image_processor import (
+    FORMAT_CONTENT_TYPES, SPRITE_SIZE, is_rendition_size, negotiate_output_format, width_size_label
+)
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# 原图 ETag 缓存（存储键 -> ETag），304 判断时不必查询数据库；按条数做 LRU 淘汰，内存占用有上限
+ETAG_CACHE_SECONDS = 3600
+ETAG_CACHE_MAX_ENTRIES = 10000
+_etag_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # 存储键 -> (ETag, 过期时间)
+
+# 已打开文件的描述符路径（Linux），打开该路径得到同一个文件，即使原路径已被删除
+FD_PATH_DIR = "/proc/self/fd"
+
+
+def _guess_content_type(file_key: str) -> str:
+    """根据文件扩展名推断图片的 Content-Type"""
+    if file_key.endswith('.png'):
+        return "image/png"
+    elif file_key.endswith('.webp'):
+        return "image/webp"
+    elif file_key.endswith('.gif'):
+        return "image/gif"
+    return "image/jpeg"  # 默认
+
+
+def _guess_download_content_type(filename: str) -> str:
+    """根据文件扩展名推断下载文件的 Content-Type"""
+    if filename.endswith(('.jpg', '.jpeg')):
+        return "image/jpeg"
+    elif filename.endswith('.png'):
+        return "image/png"
+    elif filename.endswith('.webp'):
+        return "image/webp"
+    elif filename.endswith('.gif'):
+        return "image/gif"
+    return "application/octet-stream"
+
+
+def _storage_unavailable(retry_after: float = None) -> HTTPException:
+    """存储服务熔断期间的 503 响应（快速失败，不等待对象存储超时）"""
+    if retry_after is None:
+        retry_after = rustfs_client.breaker.retry_after()
+    return HTTPException(
+        status_code=503,
+        detail="存储服务暂不可用，请稍后重试",
+        headers={"Retry-After": str(max(int(retry_after), 1))}
+    )
+
+
+def _rendition_headers(file_key: str, size: str, output_format: str) -> Dict[str, str]:
+    """
+    衍生图响应头
+    ETag 由衍生图存储键（包含原图键、尺寸、格式和编码版本）计算，所有进程和重启后保持一致
+    """
+    rendition_key = rendition_store.build_key(file_key, size, output_format)
+    return {
+        "Cache-Control": "public, max-age=31536000",  # 衍生图缓存1年
+        "ETag": f'"{hashlib.sha1(rendition_key.encode("utf-8")).hexdigest()}"',
+        "Vary": "Accept",  # 输出格式随 Accept 头变化，缓存需区分
+    }
+
+
+def _original_headers(etag: str) -> Dict[str, str]:
+    """原图响应头（原图缓存1小时）"""
+    return {
+        "Cache-Control": "public, max-age=3600",
+        "ETag": etag,
+    }
+
+
+def _redirect_enabled() -> bool:
+    """是否以 302 跳转到对象存储的方式提供图片（ASSET_SERVING_MODE=redirect）"""
+    return settings.ASSET_SERVING_MODE == "redirect"
+
+
+def _redirect_to_object(object_key: str, content_type: str, vary_accept: bool = False) -> RedirectResponse:
+    """
+    302 跳转到对象的预签名 URL，图片内容由浏览器直接从对象存储读取，不经过 API 进程
+    跳转响应只在该预签名 URL 还会被复用的时间内缓存，避免浏览器拿到已过期的地址
+    """
+    url, ttl = rustfs_client.presign_get(object_key, settings.ASSET_PRESIGN_EXPIRE_SECONDS, content_type)
+    headers = {"Cache-Control": f"private, max-age={ttl}"}
+    if vary_accept:
+        headers["Vary"] = "Accept"  # 跳转目标（输出格式）随 Accept 头变化
+    return RedirectResponse(url, status_code=302, headers=headers)
+
+
+def _original_etag(asset: LogAsset) -> str:
+    """
+    原图 ETag：上传时计算的内容哈希；旧数据没有内容哈希时使用存储键的哈希（存储键对应的内容不会改变）
+    计算结果按存储键缓存，后续重新验证请求不必查询数据库
+    """
+    if asset.content_hash:
+        etag = f'"{asset.content_hash}"'
+    else:
+        etag = f'"{hashlib.sha1(asset.file_key.encode("utf-8")).hexdigest()}"'
+    _etag_cache[asset.file_key] = (etag, time.monotonic() + ETAG_CACHE_SECONDS)
+    _etag_cache.move_to_end(asset.file_key)
+    while len(_etag_cache) > ETAG_CACHE_MAX_ENTRIES:
+        _etag_cache.popitem(last=False)
+    return etag
+
+
+def _cached_original_etag(file_key: str) -> Optional[str]:
+    """读取缓存的原图 ETag（过期的记录删除后返回 None）"""
+    cached = _etag_cache.get(file_key)
+    if cached is None:
+        return None
+    etag, expires_at = cached
+    if expires_at <= time.monotonic():
+        del _etag_cache[file_key]
+        return None
+    _etag_cache.move_to_end(file_key)
+    return etag
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否与 ETag 匹配（弱比较，支持多个值和 *）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def _parse_range(request: Request, etag: Optional[str] = None) -> Optional[str]:
+    """
+    解析请求的 Range 头，返回转发给对象存储的 Range 值
+    
+    只支持单个字节区间（bytes=start-end、bytes=start-、bytes=-suffix）；
+    多区间、格式无效或 If-Range 与当前 ETag 不一致时返回 None，按完整内容响应
+    """
+    value = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if not value or (if_range and if_range.strip() != etag):
+        return None
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start, sep, end = spec.strip().partition("-")
+    start, end = start.strip(), end.strip()
+    if not sep or (start and not start.isdigit()) or (end and not end.isdigit()):
+        return None
+    if not start:
+        # 后缀区间：最后 N 个字节
+        return f"bytes=-{int(end)}" if end and int(end) > 0 else None
+    if end and int(end) < int(start):
+        return None
+    return f"bytes={int(start)}-{int(end) if end else ''}"
+
+
+async def _stream_original(
+    file_key: str,
+    media_type: str,
+    headers: dict,
+    byte_range: Optional[str] = None
+) -> StreamingResponse:
+    """
+    流式返回原图（边从对象存储读取边发送，内存占用以块大小为上限）
+    
+    Args:
+        file_key: 文件标识符
+        media_type: Content-Type
+        headers: 响应头
+        byte_range: 请求的字节区间，指定时转为对象存储的范围读取并返回 206
+    
+    Raises:
+        HTTPException: 文件不存在或无法访问（404），请求范围无效（416），存储服务熔断（503）
+    """
+    headers["Accept-Ranges"] = "bytes"
+    try:
+        stream = await rustfs_client.open_stream(file_key, byte_range=byte_range)
+    except StorageUnavailable as e:
+        raise _storage_unavailable(e.retry_after)
+    except RangeNotSatisfiable as e:
+        range_headers = {"Accept-Ranges": "bytes"}
+        if e.object_size is not None:
+            range_headers["Content-Range"] = f"bytes */{e.object_size}"
+        raise HTTPException(status_code=416, detail="请求范围无效", headers=range_headers)
+    if not stream:
+        raise HTTPException(status_code=404, detail="文件不存在或无法访问")
+    
+    status_code = 200
+    if byte_range and stream.content_range:
+        status_code = 206
+        headers["Content-Range"] = stream.content_range
+    if stream.content_length is not None:
+        headers["Content-Length"] = str(stream.content_length)
+    return StreamingResponse(stream.iter_chunks(), status_code=status_code, media_type=media_type, headers=headers)
+
+
+def _cached_file_response(cached, headers: dict) -> FileResponse:
+    """
+    返回本机磁盘缓存中的衍生图（FileResponse：支持 Range，服务器支持 pathsend 扩展时由服务器零拷贝发送）
+    
+    文件在查询缓存时已打开，按描述符路径发送，之后被淘汰或删除也不影响发送（不会因文件消失返回 500）；
+    没有描述符路径的系统按原路径发送。响应发送完成后关闭文件
+    """
+    f, content_type = cached
+    path = os.path.join(FD_PATH_DIR, str(f.fileno())) if os.path.isdir(FD_PATH_DIR) else f.name
+    return FileResponse(
+        path,
+        media_type=content_type,
+        headers=headers,
+        stat_result=os.fstat(f.fileno()),
+        background=BackgroundTask(f.close)
+    )
+
+
+async def _head_original(file_key: str, media_type: str, headers: dict) -> Response:
+    """
+    根据对象存储元数据返回原图的响应头（不传输内容）
+    
+    Raises:
+        HTTPException: 文件不存在或无法访问
+    """
+    info = await rustfs_client.get_object_info(file_key)
+    if not info:
+        raise HTTPException(status_code=404, detail="文件不存在或无法访问")
+    headers["Accept-Ranges"] = "bytes"
+    headers["Content-Length"] = str(info['content_length'])
+    return Response(media_type=media_type, headers=headers)
+
+
+@router.get("/sprites/{log_id}")
+async def stream_sprite(
+    request: Request,
+    log_id: int,
+    v: Optional[str] = Query(None, pattern="^[0-9a-f]{40}$", description="拼图版本（组成图片存储键的摘要）"),
+    db: Session = Depends(get_db)
+):
+    """
+    获取记录的列表卡片拼图（前 4 张输出图片合成一张，图块坐标见列表接口的 sprite 字段）
+    
+    - **log_id**: 记录ID
+    - **v**: 拼图版本，与当前输出图片不一致（或未指定）时重定向到当前版本
+    
+    输出格式根据 Accept 头协商，响应带 `Vary: Accept`；带版本的地址内容不变，缓存1年
+    """
+    from app.api.logs import get_sprite_file_keys, get_sprite_url
+    try:
+        output_format = negotiate_output_format(request.headers.get("accept"))
+        
+        if v:
+            # 拼图内容只由版本决定，可以在查询数据库之前判断是否未修改或命中本机磁盘缓存
+            source_key = rendition_store.sprite_source_key(v)
+            sprite_headers = _rendition_headers(source_key, SPRITE_SIZE, output_format)
+            if _etag_matches(request.headers.get("if-none-match"), sprite_headers["ETag"]):
+                return Response(status_code=304, headers=sprite_headers)
+            cached = None if _redirect_enabled() else rendition_store.open_cached(source_key, SPRITE_SIZE, output_format)
+            if cached:
+                return _cached_file_response(cached, sprite_headers)
+        
+        file_keys = get_sprite_file_keys(db, log_id)
+        if not file_keys:
+            raise HTTPException(status_code=404, detail="记录不存在或没有输出图片")
+        
+        if v != rendition_store.sprite_digest(file_keys):
+            # 输出图片已变化：重定向到当前版本，避免旧地址缓存新内容
+            return RedirectResponse(get_sprite_url(log_id, file_keys), status_code=302, headers={"Cache-Control": "no-cache"})
+        
+        if _redirect_enabled():
+            # 已生成的拼图跳转到对象存储，未生成时本次生成并直接返回内容
+            rendition = rendition_store.lookup(db, rendition_store.sprite_source_key(v), SPRITE_SIZE, output_format)
+            if rendition:
+                return _redirect_to_object(rendition.rendition_key, rendition.content_type, vary_accept=True)
+        
+        try:
+            sprite = await rendition_store.get_or_create_sprite(db, file_keys, output_format)
+        except ImageExecutorBusy:
+            raise HTTPException(status_code=503, detail="图片处理繁忙，请稍后重试", headers={"Retry-After": "1"})
+        if not sprite:
+            raise HTTPException(status_code=404, detail="文件不存在或无法访问")
+        
+        content, content_type = sprite
+        sprite_headers["Content-Length"] = str(len(content))
+        return Response(content=content, media_type=content_type, headers=sprite_headers)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取拼图失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"获取拼图失败: {str(e)}")
+
 
 @router.get("/{file_key:path}/url")
 async def get_file_url(
@@ -53,10 +345,88 @@ async def get_file_url(
         raise HTTPException(status_code=500, detail=f"获取文件 URL 失败: {str(e)}")
 
 
+@router.get("/{file_key:path}/similar")
+async def get_similar_assets(
+    file_key: str = Path(..., description="文件标识符（可能包含 / 字符）"),
+    max_distance: int = Query(10, ge=0, le=MAX_DISTANCE, description="最大汉明距离，越小越相似"),
+    limit: int = Query(20, ge=1, le=100, description="返回数量"),
+    db: Session = Depends(get_db)
+):
+    """
+    查找与指定图片近似重复的输出图片（按感知哈希的汉明距离，从近到远排列）
+    
+    - **file_key**: 文件标识符（可能包含 / 字符）
+    - **max_distance**: 最大汉明距离（0-16），0 表示视觉上几乎相同
+    - **limit**: 返回数量
+    
+    使用同一原图（相同存储键）的资源视为图片本身，不出现在结果中
+    """
+    from app.api.logs import get_proxy_url, get_asset_metadata
+    try:
+        assets = db.query(LogAsset).filter(LogAsset.file_key == file_key).all()
+        if not assets:
+            raise HTTPException(status_code=404, detail="文件不存在")
+        phash = next((asset.phash for asset in assets if asset.phash is not None), None)
+        if phash is None:
+            raise HTTPException(status_code=409, detail="图片尚未计算感知哈希，请稍后重试")
+        if not similarity_index.ready:
+            raise HTTPException(status_code=503, detail="相似图片索引加载中，请稍后重试", headers={"Retry-After": "5"})
+        
+        matches = similarity_index.search(
+            phash,
+            max_distance,
+            limit,
+            exclude_ids=tuple(asset.id for asset in assets)
+        )
+        
+        # 索引可能包含已删除的图片（下次重建时移出），以数据库为准
+        rows = {}
+        if matches:
+            rows = {
+                asset.id: (asset, log)
+                for asset, log in db.query(LogAsset, GenLog).join(GenLog, LogAsset.log_id == GenLog.id).filter(
+                    LogAsset.id.in_([asset_id for asset_id, _ in matches])
+                ).all()
+            }
+        
+        items = []
+        for asset_id, distance in matches:
+            if asset_id not in rows:
+                continue
+            asset, log = rows[asset_id]
+            if asset.file_key == file_key:
+                continue
+            items.append({
+                "id": asset.id,
+                "log_id": log.id,
+                "log_title": log.title,
+                "is_nsfw": log.is_nsfw == 'true' if log.is_nsfw else False,
+                "file_key": asset.file_key,
+                "distance": distance,
+                "url": get_proxy_url(asset.file_key),
+                "thumb_url": get_proxy_url(asset.file_key, "thumb"),
+                **get_asset_metadata(asset)
+            })
+        
+        return {
+            "file_key": file_key,
+            "max_distance": max_distance,
+            "items": items
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"查找相似图片失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"查找相似图片失败: {str(e)}")
+
+
 @router.get("/{file_key:path}/stream")
 async def stream_file(
+    request: Request,
     file_key: str = Path(..., description="文件标识符（可能包含 / 字符）"),
     size: Optional[str] = Query(None, description="图片尺寸：'thumb'（缩略图）、'medium'（中等尺寸）、'original'（原图，默认）"),
+    w: Optional[int] = Query(None, ge=1, description="目标宽度（像素），向上取整到宽度档位，用于 srcset"),
     db: Session = Depends(get_db)
 ):
     """
@@ -65,86 +435,84 @@ async def stream_file(
     
     - **file_key**: 文件标识符（可能包含 / 字符，如 2024/12/13/uuid-filename.jpg）
     - **size**: 图片尺寸，可选值：'thumb'（缩略图）、'medium'（中等尺寸）、'original'（原图，默认）
+    - **w**: 目标宽度，向上取整到 RENDITION_WIDTH_LADDER 中的档位（优先于 size）
+    
+    缩略图和中等尺寸的输出格式根据 Accept 头协商（AVIF / WebP / JPEG），响应带 `Vary: Accept`；
+    原图支持 `Range` 请求（单个字节区间），返回 206 和 `Content-Range`。
+    `If-None-Match` 与 ETag 匹配时返回 304，不查询数据库和对象存储。
+    ASSET_SERVING_MODE=redirect 时原图和已生成的衍生图返回 302，跳转到对象存储的预签名 URL
     """
     try:
+        # 宽度参数取整到档位，避免任意宽度造成渲染和缓存碎片
+        if w is not None:
+            size = width_size_label(w)
+        
+        if_none_match = request.headers.get("if-none-match")
+        is_rendition = is_rendition_size(size)
+        if is_rendition:
+            # 衍生图的 ETag 只由请求参数决定，可以在查询数据库之前判断是否未修改
+            output_format = negotiate_output_format(request.headers.get("accept"))
+            rendition_headers = _rendition_headers(file_key, size, output_format)
+            if _etag_matches(if_none_match, rendition_headers["ETag"]):
+                return Response(status_code=304, headers=rendition_headers)
+        else:
+            cached_etag = _cached_original_etag(file_key)
+            if cached_etag and _etag_matches(if_none_match, cached_etag):
+                return Response(status_code=304, headers=_original_headers(cached_etag))
+        
         # FastAPI 会自动解码路径参数，所以这里不需要手动解码
         # 验证文件是否存在（检查数据库）
         asset = db.query(LogAsset).filter(LogAsset.file_key == file_key).first()
         if not asset:
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 根据 size 参数选择文件
-        if size == 'thumb':
-            # 使用缩略图（如果存在）
-            # 缩略图 key 格式：thumb_原文件名 或从原 key 推导
-            # 这里简化处理，直接使用原图生成缩略图
-            file_content = await rustfs_client.download_file(file_key)
-            if not file_content:
-                raise HTTPException(status_code=404, detail="文件不存在或无法访问")
+        if is_rendition:
+            # 缩略图和中等尺寸：优先读取已持久化的衍生图，未命中时渲染一次并写回存储
+            # 每种输出格式单独渲染和持久化
             
-            from app.utils.image_processor import generate_thumbnail
-            try:
-                file_content, content_type = generate_thumbnail(file_content)
-            except Exception as e:
-                logger.warning(f"生成缩略图失败，使用原图: {e}")
-                # 如果生成缩略图失败，使用原图
-                content_type = "image/jpeg"
-                if asset.file_key.endswith('.png'):
-                    content_type = "image/png"
-                elif asset.file_key.endswith('.webp'):
-                    content_type = "image/webp"
-                elif asset.file_key.endswith('.gif'):
-                    content_type = "image/gif"
-        elif size == 'medium':
-            # 使用中等尺寸（压缩后的图片）
-            file_content = await rustfs_client.download_file(file_key)
-            if not file_content:
-                raise HTTPException(status_code=404, detail="文件不存在或无法访问")
+            if _redirect_enabled():
+                # 已登记的衍生图跳转到对象存储；未生成时本次渲染并直接返回内容，之后的请求再跳转
+                rendition = rendition_store.lookup(db, file_key, size, output_format)
+                if rendition:
+                    return _redirect_to_object(rendition.rendition_key, rendition.content_type, vary_accept=True)
+            
+            # 本机磁盘缓存命中时直接返回文件（不经过对象存储和 Python 内存）
+            cached = None if _redirect_enabled() else rendition_store.open_cached(file_key, size, output_format)
+            if cached:
+                return _cached_file_response(cached, rendition_headers)
             
-            from app.utils.image_processor import compress_image
             try:
-                file_content, content_type = compress_image(file_content, max_width=1920, max_height=1920, quality=85)
+                rendition = await rendition_store.get_or_create(db, file_key, size, output_format)
+            except ImageExecutorBusy:
+                # 进程池繁忙时不回退到原图，避免在高负载下放大传输量
+                raise HTTPException(status_code=503, detail="图片处理繁忙，请稍后重试", headers={"Retry-After": "1"})
             except Exception as e:
-                logger.warning(f"压缩图片失败，使用原图: {e}")
-                # 如果压缩失败，使用原图
-                content_type = "image/jpeg"
-                if asset.file_key.endswith('.png'):
-                    content_type = "image/png"
-                elif asset.file_key.endswith('.webp'):
-                    content_type = "image/webp"
-                elif asset.file_key.endswith('.gif'):
-                    content_type = "image/gif"
-        else:
-            # 使用原图
-            file_content = await rustfs_client.download_file(file_key)
-            if not file_content:
-                raise HTTPException(status_code=404, detail="文件不存在或无法访问")
-            
-            # 确定内容类型
-            content_type = "image/jpeg"  # 默认
-            if asset.file_key.endswith('.png'):
-                content_type = "image/png"
-            elif asset.file_key.endswith('.webp'):
-                content_type = "image/webp"
-            elif asset.file_key.endswith('.gif'):
-                content_type = "image/gif"
-        
-        # 返回流式响应（优化缓存策略和传输）
-        cache_max_age = 31536000 if size in ('thumb', 'medium') else 3600  # 缩略图和中等尺寸缓存1年，原图缓存1小时
-        
-        headers = {
-            "Cache-Control": f"public, max-age={cache_max_age}",
-            "ETag": f'"{hash(file_key + str(size))}"',  # ETag 包含 size 参数
-        }
-        
-        # 如果压缩了图片，添加 Content-Length 头（有助于浏览器优化）
-        if size in ('thumb', 'medium'):
-            headers["Content-Length"] = str(len(file_content))
+                logger.warning(f"生成衍生图失败（{size}），使用原图: {e}")
+            else:
+                if not rendition:
+                    if rustfs_client.breaker.state == CircuitBreaker.OPEN:
+                        raise _storage_unavailable()
+                    raise HTTPException(status_code=404, detail="文件不存在或无法访问")
+                file_content, content_type = rendition
+                rendition_headers["Content-Length"] = str(len(file_content))
+                return Response(
+                    content=file_content,
+                    media_type=content_type,
+                    headers=rendition_headers
+                )
         
-        return Response(
-            content=file_content,
-            media_type=content_type,
-            headers=headers
+        # 使用原图：流式转发对象存储的响应体，不把整个文件读入内存（原图缓存1小时）
+        etag = _original_etag(asset)
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=_original_headers(etag))
+        if _redirect_enabled():
+            # Range 请求跟随跳转后由对象存储直接处理
+            return _redirect_to_object(file_key, _guess_content_type(asset.file_key))
+        return await _stream_original(
+            file_key,
+            _guess_content_type(asset.file_key),
+            _original_headers(etag),
+            _parse_range(request, etag)
         )
         
     except HTTPException:
@@ -156,6 +524,7 @@ async def stream_file(
 
 @router.get("/{file_key:path}/download")
 async def download_file(
+    request: Request,
     file_key: str = Path(..., description="文件标识符（可能包含 / 字符）"),
     db: Session = Depends(get_db)
 ):
@@ -164,6 +533,8 @@ async def download_file(
     通过后端 API 代理访问 RustFS，这样外网可以通过 web 端口下载
     
     - **file_key**: 文件标识符（可能包含 / 字符，如 2024/12/13/uuid-filename.jpg）
+    
+    支持 `Range` 请求（单个字节区间），返回 206 和 `Content-Range`，可用于断点续传
     """
     try:
         # FastAPI 会自动解码路径参数，所以这里不需要手动解码
@@ -172,32 +543,23 @@ async def download_file(
         if not asset:
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 从 RustFS 下载文件
-        file_content = await rustfs_client.download_file(file_key)
-        if not file_content:
-            raise HTTPException(status_code=404, detail="文件不存在或无法访问")
-        
         # 确定文件名
         filename = asset.file_key.split('/')[-1] if '/' in asset.file_key else asset.file_key
         
-        # 确定内容类型
-        content_type = "application/octet-stream"
-        if filename.endswith(('.jpg', '.jpeg')):
-            content_type = "image/jpeg"
-        elif filename.endswith('.png'):
-            content_type = "image/png"
-        elif filename.endswith('.webp'):
-            content_type = "image/webp"
-        elif filename.endswith('.gif'):
-            content_type = "image/gif"
-        
-        # 返回下载响应
-        return Response(
-            content=file_content,
-            media_type=content_type,
-            headers={
-                "Content-Disposition": f'attachment; filename="{filename}"',
-            }
+        etag = _original_etag(asset)
+        headers = {
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "ETag": etag,
+        }
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        
+        # 流式返回下载响应（边从 RustFS 读取边发送，支持 Range 断点续传）
+        return await _stream_original(
+            file_key,
+            _guess_download_content_type(filename),
+            headers,
+            _parse_range(request, etag)
         )
         
     except HTTPException:
@@ -206,3 +568,83 @@ async def download_file(
         logger.error(f"下载文件失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"下载文件失败: {str(e)}")
 
+
+@router.head("/{file_key:path}/stream")
+async def head_stream_file(
+    request: Request,
+    file_key: str = Path(..., description="文件标识符（可能包含 / 字符）"),
+    size: Optional[str] = Query(None, description="图片尺寸：'thumb'（缩略图）、'medium'（中等尺寸）、'original'（原图，默认）"),
+    w: Optional[int] = Query(None, ge=1, description="目标宽度（像素），向上取整到宽度档位"),
+    db: Session = Depends(get_db)
+):
+    """
+    查询文件元数据（不传输内容）
+    原图根据对象存储元数据返回，衍生图根据本机磁盘缓存或衍生图登记表返回；
+    衍生图尚未生成时不渲染，返回与 GET 相同的 Content-Type 和 ETag，不返回 Content-Length
+    """
+    try:
+        asset = db.query(LogAsset).filter(LogAsset.file_key == file_key).first()
+        if not asset:
+            raise HTTPException(status_code=404, detail="文件不存在")
+        
+        if w is not None:
+            size = width_size_label(w)
+        
+        if is_rendition_size(size):
+            output_format = negotiate_output_format(request.headers.get("accept"))
+            headers = _rendition_headers(file_key, size, output_format)
+            byte_size = None
+            cached = rendition_store.open_cached(file_key, size, output_format)
+            if cached:
+                with cached[0] as f:
+                    byte_size = os.fstat(f.fileno()).st_size
+            else:
+                rendition = rendition_store.lookup(db, file_key, size, output_format)
+                if rendition:
+                    byte_size = rendition.byte_size
+            if byte_size is not None:
+                headers["Content-Length"] = str(byte_size)
+                return Response(media_type=FORMAT_CONTENT_TYPES[output_format], headers=headers)
+            # 衍生图尚未生成：不为 HEAD 请求渲染（渲染由 GET 请求或后台任务完成），大小未知，不返回 Content-Length
+            response = Response(media_type=FORMAT_CONTENT_TYPES[output_format], headers=headers)
+            del response.headers["content-length"]
+            return response
+        
+        return await _head_original(file_key, _guess_content_type(asset.file_key), _original_headers(_original_etag(asset)))
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"查询文件元数据失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"查询文件元数据失败: {str(e)}")
+
+
+@router.head("/{file_key:path}/download")
+async def head_download_file(
+    file_key: str = Path(..., description="文件标识符（可能包含 / 字符）"),
+    db: Session = Depends(get_db)
+):
+    """
+    查询下载文件的元数据（不传输内容），下载工具可据此获取文件大小并断点续传
+    """
+    try:
+        asset = db.query(LogAsset).filter(LogAsset.file_key == file_key).first()
+        if not asset:
+            raise HTTPException(status_code=404, detail="文件不存在")
+        
+        filename = asset.file_key.split('/')[-1] if '/' in asset.file_key else asset.file_key
+        return await _head_original(
+            file_key,
+            _guess_download_content_type(filename),
+            {
+                "Content-Disposition": f'attachment; filename="{filename}"',
+                "ETag": _original_etag(asset),
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"查询文件元数据失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"查询文件元数据失败: {str(e)}")
+
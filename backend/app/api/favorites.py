@@ -15,7 +15,7 @@ from app.models.gen_log import GenLog
 from app.models.log_asset import LogAsset
 from app.models.output_group import OutputGroup
 from app.utils.auth import get_current_user
-from app.api.logs import get_proxy_url
+from app.api.logs import get_proxy_url, get_asset_metadata
 
 router = APIRouter()
 
@@ -170,12 +170,13 @@ async def get_favorites(
         elif log.assets:
             cover_url = get_proxy_url(log.assets[0].file_key, size='medium')
         
-        # 获取预览图列表
-        preview_urls = []
-        if output_assets:
-            preview_urls = [get_proxy_url(asset.file_key, size='medium') for asset in output_assets[:3]]
-        elif log.assets:
-            preview_urls = [get_proxy_url(asset.file_key, size='medium') for asset in log.assets[:3]]
+        # 获取预览图列表（附带宽高和占位图，前端无需下载图片即可布局）
+        preview_assets = output_assets[:3] if output_assets else log.assets[:3]
+        preview_urls = [get_proxy_url(asset.file_key, size='medium') for asset in preview_assets]
+        previews = [
+            {"url": url, **get_asset_metadata(asset)}
+            for url, asset in zip(preview_urls, preview_assets)
+        ]
         
         result.append({
             "id": favorite.id,
@@ -191,6 +192,7 @@ async def get_favorites(
                 "is_nsfw": log.is_nsfw == 'true',
                 "cover_url": cover_url,
                 "preview_urls": preview_urls,
+                "previews": previews,
                 "created_at": log.created_at.isoformat()
             }
         })
@@ -4,9 +4,12 @@
 """
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
 from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from typing import List, Optional, Union
+from sqlalchemy import desc, text
+from typing import Any, Dict, List, Optional, Tuple, Union
+import asyncio
+import hashlib
 import logging
 
 from app.database import get_db
@@ -14,8 +17,12 @@ from app.models.gen_log import GenLog
 from app.models.log_asset import LogAsset
 from app.models.output_group import OutputGroup
 from app.models.user import User
-from app.services.rustfs_client import rustfs_client
-from app.utils.image_processor import generate_thumbnail, validate_image
+from app.services.blob_store import blob_store
+from app.services.direct_upload import direct_upload, DirectUploadError
+from app.services.image_executor import image_executor, ImageExecutorBusy, ImageTaskTimeout
+from app.services.rendition_worker import rendition_worker, STATUS_PENDING
+from app.services.rendition_store import rendition_store
+from app.utils.image_processor import SPRITE_MAX_TILES, validate_image, get_image_info, snap_width, sprite_layout
 from app.utils.cache import cache
 from app.utils.auth import require_permission, get_current_user_optional
 from app.config import settings
@@ -24,8 +31,55 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 读取上传文件时每次读取的字节数
+UPLOAD_READ_CHUNK_SIZE = 1024 * 1024
 
-def get_proxy_url(file_key: str, size: str = None) -> str:
+
+class PlannedFile(BaseModel):
+    """直传计划中的文件"""
+    filename: str
+    content_type: str
+    size: int  # 文件大小（字节）
+
+
+class UploadPlanRequest(BaseModel):
+    """申请直传上传计划"""
+    files: List[PlannedFile]
+
+
+class CommitPart(BaseModel):
+    """已上传的分片"""
+    part_number: int
+    etag: str  # 上传分片时响应头中的 ETag
+
+
+class CommitInput(BaseModel):
+    """输入图片"""
+    file: int  # 上传计划中的文件序号
+    note: str = ''
+
+
+class CommitOutputGroup(BaseModel):
+    """输出组"""
+    tools: List[str] = []
+    models: List[str] = []
+    files: List[int]  # 上传计划中的文件序号，按显示顺序
+
+
+class CommitLogRequest(BaseModel):
+    """提交直传的上传计划并创建记录"""
+    plan_token: str
+    title: str
+    log_type: str
+    prompt: Optional[str] = None
+    params_note: Optional[str] = None
+    is_nsfw: bool = False
+    inputs: List[CommitInput] = []
+    output_groups: List[CommitOutputGroup]
+    parts: Dict[int, List[CommitPart]] = {}  # 文件序号 -> 分片（分片上传的文件）
+
+
+def get_proxy_url(file_key: str, size: str = None, width: int = None) -> str:
     """
     生成通过 API 代理的文件访问 URL
     这样外网可以通过 web 端口访问，而不需要暴露 RustFS 端口
@@ -33,6 +87,7 @@ def get_proxy_url(file_key: str, size: str = None) -> str:
     Args:
         file_key: 文件标识符
         size: 图片尺寸，可选值：'thumb'（缩略图）、'medium'（中等尺寸）、None（原图）
+        width: 目标宽度（像素，会被取整到宽度档位），指定时忽略 size
         
     Returns:
         通过 API 代理的 URL
@@ -41,11 +96,328 @@ def get_proxy_url(file_key: str, size: str = None) -> str:
     # URL 编码 file_key，确保特殊字符（如 /、% 等）被正确编码
     encoded_file_key = quote(file_key, safe='')
     url = f"/api/assets/{encoded_file_key}/stream"
-    if size:
+    if width:
+        url += f"?w={snap_width(width)}"
+    elif size:
         url += f"?size={size}"
     return url
 
 
+def get_srcset(file_key: str, max_width: int = None) -> str:
+    """
+    生成 srcset 属性值（每个宽度档位一项，如 "/api/assets/x/stream?w=320 320w, ..."）
+    
+    Args:
+        file_key: 文件标识符
+        max_width: 原图宽度（已知时不生成超过原图宽度的档位）
+        
+    Returns:
+        srcset 字符串
+    """
+    ladder = settings.RENDITION_WIDTH_LADDER
+    entries = [(w, w) for w in ladder if not max_width or w <= max_width]
+    if max_width and len(entries) < len(ladder) and max_width not in ladder:
+        # 原图宽度不在档位上时，补充覆盖原图宽度的档位（不放大，实际宽度即原图宽度）
+        entries.append((snap_width(max_width), max_width))
+    return ", ".join(f"{get_proxy_url(file_key, width=w)} {descriptor}w" for w, descriptor in entries)
+
+
+def get_sprite_url(log_id: int, file_keys: List[str]) -> str:
+    """
+    生成列表卡片拼图的 URL（带版本，输出图片变化后版本随之变化）
+    
+    Args:
+        log_id: 记录ID
+        file_keys: 拼图的组成图片存储键（按显示顺序）
+        
+    Returns:
+        通过 API 代理的拼图 URL
+    """
+    return f"/api/assets/sprites/{log_id}?v={rendition_store.sprite_digest(file_keys)}"
+
+
+def get_sprite_file_keys(db: Session, log_id: int) -> List[str]:
+    """
+    查询记录拼图的组成图片（拼图接口使用的输出图片及顺序）
+    
+    Args:
+        db: 数据库会话
+        log_id: 记录ID
+        
+    Returns:
+        组成图片的存储键（按显示顺序，最多 SPRITE_MAX_TILES 张）
+    """
+    return [
+        row[0] for row in db.query(LogAsset.file_key).filter(
+            LogAsset.log_id == log_id,
+            LogAsset.asset_type == 'output'
+        ).order_by(LogAsset.sort_order, LogAsset.id).limit(SPRITE_MAX_TILES).all()
+    ]
+
+
+def _sprite_digest(db: Session, log_id: int) -> Optional[str]:
+    """记录当前拼图的摘要，没有输出图片返回 None"""
+    file_keys = get_sprite_file_keys(db, log_id)
+    return rendition_store.sprite_digest(file_keys) if file_keys else None
+
+
+def _release_stale_sprite(db: Session, log_id: int, previous_digest: Optional[str]) -> List[str]:
+    """
+    输出图片变化后删除旧拼图的登记（在提交事务前调用，登记随事务删除）
+    
+    拼图按组成图片摘要持久化，摘要变化后旧拼图不再被引用，不删除会一直占用存储
+    
+    Returns:
+        提交事务后需要删除的拼图对象存储键
+    """
+    if previous_digest is None:
+        return []
+    db.flush()
+    if _sprite_digest(db, log_id) == previous_digest:
+        return []
+    return rendition_store.release_sprite(db, previous_digest)
+
+
+def get_asset_metadata(asset: LogAsset) -> Dict[str, Any]:
+    """
+    资源图片元数据（前端据此预留布局空间并显示占位图，无需先下载图片）
+    
+    Args:
+        asset: 资源记录
+        
+    Returns:
+        {width, height, byte_size, format, content_hash, lqip}，旧数据未回填的字段为 None
+    """
+    return {
+        "width": asset.width,
+        "height": asset.height,
+        "byte_size": asset.byte_size,
+        "format": asset.format,
+        "content_hash": asset.content_hash,
+        "lqip": asset.lqip,
+    }
+
+
+async def _validate_upload(content: bytes, filename: str) -> Tuple[bool, Optional[str]]:
+    """
+    在图片处理进程池中验证上传的图片
+    
+    Raises:
+        HTTPException: 进程池繁忙（503）或处理超时（504）
+    """
+    try:
+        return await image_executor.run(validate_image, content, filename)
+    except ImageExecutorBusy:
+        raise HTTPException(status_code=503, detail="图片处理繁忙，请稍后重试", headers={"Retry-After": "5"})
+    except ImageTaskTimeout:
+        raise HTTPException(status_code=504, detail=f"图片处理超时: {filename}")
+
+
+async def _read_upload(file: UploadFile, label: str) -> Tuple[bytes, str]:
+    """
+    分块读取上传文件，读取的同时计算 SHA-256，超出大小限制时立即停止
+    
+    Returns:
+        (文件内容, 内容 SHA-256)
+    """
+    hasher = hashlib.sha256()
+    chunks = []
+    total = 0
+    while True:
+        chunk = await file.read(UPLOAD_READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > settings.MAX_UPLOAD_SIZE:
+            max_mb = settings.MAX_UPLOAD_SIZE / (1024 * 1024)
+            raise HTTPException(status_code=400, detail=f"{label}验证失败 ({file.filename}): 文件过大，最大允许 {max_mb}MB")
+        hasher.update(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks), hasher.hexdigest()
+
+
+async def _store_original(file: UploadFile, label: str, acquired: List[str]) -> Dict[str, Any]:
+    """
+    读取、验证并按内容寻址存储原图（衍生图由后台任务生成）
+    相同内容的原图只保存一份，每次调用为存储对象增加一个引用
+    
+    Args:
+        file: 上传的文件
+        label: 错误信息中的文件类别，如 '输入图片'、'输出图片'
+        acquired: 已登记引用的存储键列表（成功后追加，资源记录写入失败时由调用方释放）
+        
+    Returns:
+        原图字段（可直接作为 LogAsset 的列值）：file_key、content_hash、width、height、byte_size、format
+    """
+    content, content_hash = await _read_upload(file, label)
+    
+    # 验证图片
+    is_valid, error_msg = await _validate_upload(content, file.filename)
+    if not is_valid:
+        raise HTTPException(status_code=400, detail=f"{label}验证失败 ({file.filename}): {error_msg}")
+    
+    # 宽高和格式只读取图片头部，不解码像素
+    info = get_image_info(content)
+    image_format = info['format'] if info['format'] != 'unknown' else None
+    
+    # 上传原图（内容已存在时只增加引用）
+    original_key = await blob_store.acquire(
+        content,
+        content_hash,
+        file.filename,
+        file.content_type
+    )
+    if not original_key:
+        raise HTTPException(status_code=500, detail=f"上传{label}失败: {file.filename}")
+    acquired.append(original_key)
+    return {
+        "file_key": original_key,
+        "content_hash": content_hash,
+        "width": info['width'] or None,
+        "height": info['height'] or None,
+        "byte_size": len(content),
+        "format": image_format.lower() if image_format else None,
+    }
+
+
+async def _store_originals(files: List[UploadFile], label: str, acquired: List[str]) -> List[Dict[str, Any]]:
+    """
+    并发读取、验证并存储多个原图（同时处理的文件数不超过 UPLOAD_CONCURRENCY），结果按文件顺序返回
+    
+    任一文件失败后不再开始新的文件，等待已开始的文件结束后抛出第一个错误；
+    已登记的引用都记录在 acquired 中，由调用方释放
+    
+    Args:
+        files: 上传的文件（按排列顺序）
+        label: 错误信息中的文件类别
+        acquired: 已登记引用的存储键列表
+        
+    Returns:
+        每个文件的原图字段，顺序与 files 一致
+    """
+    semaphore = asyncio.Semaphore(max(settings.UPLOAD_CONCURRENCY, 1))
+    failed = False
+    
+    async def store(file: UploadFile) -> Optional[Dict[str, Any]]:
+        nonlocal failed
+        async with semaphore:
+            if failed:
+                return None
+            try:
+                return await _store_original(file, label, acquired)
+            except Exception:
+                failed = True
+                raise
+    
+    # 不取消进行中的文件：已登记引用但尚未记录到 acquired 的存储对象无法释放
+    results = await asyncio.gather(*(store(file) for file in files), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+def _create_log_records(
+    db: Session,
+    title: str,
+    log_type: str,
+    prompt: Optional[str],
+    params_note: Optional[str],
+    is_nsfw: str,
+    inputs: List[Tuple[Dict[str, Any], str]],
+    groups: List[Tuple[List[str], List[str], List[Dict[str, Any]]]]
+) -> Tuple[GenLog, List[LogAsset]]:
+    """
+    写入记录、输出组和资源（不提交事务）
+    
+    Args:
+        inputs: 输入图片 [(原图字段, 备注)]
+        groups: 输出组 [(工具, 模型, [原图字段])]
+        
+    Returns:
+        (记录, 新建的资源)
+    """
+    # 创建日志记录（不再存储tools和models，因为现在在output_groups中）
+    log = GenLog(
+        title=title,
+        log_type=log_type,
+        tools=None,  # 不再在主表存储
+        models=None,  # 不再在主表存储
+        prompt=prompt,
+        params_note=params_note,
+        comparison_group_id=None,  # 不再使用对比组功能
+        is_nsfw=is_nsfw
+    )
+    db.add(log)
+    db.flush()  # 获取 ID
+    
+    new_assets = []
+    
+    # 创建输入资源记录（仅 img2img 模式）
+    for idx, (original, note) in enumerate(inputs):
+        asset = LogAsset(
+            log_id=log.id,
+            **original,
+            asset_type='input',
+            note=note,
+            sort_order=idx,
+            rendition_status=STATUS_PENDING
+        )
+        db.add(asset)
+        new_assets.append(asset)
+        logger.info(f"已添加输入资源记录: file_key={original['file_key']}, note={note}, sort_order={idx}")
+    
+    # 处理输出组和输出文件
+    for group_idx, (group_tools, group_models, group_originals) in enumerate(groups):
+        # 创建输出组
+        output_group = OutputGroup(
+            log_id=log.id,
+            tools=group_tools if group_tools else None,
+            models=group_models if group_models else None,
+            sort_order=group_idx
+        )
+        db.add(output_group)
+        db.flush()  # 获取组ID
+        
+        # 创建该组的输出资源记录，关联到输出组
+        for file_offset, original in enumerate(group_originals):
+            asset = LogAsset(
+                log_id=log.id,
+                **original,
+                asset_type='output',
+                output_group_id=output_group.id,
+                sort_order=file_offset,
+                rendition_status=STATUS_PENDING
+            )
+            db.add(asset)
+            new_assets.append(asset)
+    
+    return log, new_assets
+
+
+def _log_created(db: Session, log: GenLog, new_assets: List[LogAsset]) -> Dict[str, Any]:
+    """记录提交后：衍生图加入后台生成队列、清除缓存，返回创建结果"""
+    db.refresh(log)
+    
+    # 衍生图加入后台生成队列
+    rendition_worker.enqueue(asset.id for asset in new_assets)
+    
+    logger.info(f"创建记录成功: ID={log.id}, title={log.title}")
+    
+    # 清除相关缓存
+    cache.clear("tags:")  # 清除标签相关缓存
+    cache.clear("logs_")  # 清除列表缓存
+    
+    return {
+        "id": log.id,
+        "title": log.title,
+        "log_type": log.log_type,
+        "comparison_group_id": log.comparison_group_id,  # 返回对比组ID，用于后续记录加入
+        "created_at": log.created_at.isoformat(),
+        "is_nsfw": log.is_nsfw == 'true' if log.is_nsfw else False  # 转换为布尔值
+    }
+
+
 @router.post("/")
 async def create_log(
     request: Request,
@@ -73,6 +445,7 @@ async def create_log(
     - **output_groups**: 输出组JSON（必填），每个组包含工具、模型和文件数量
     - **output_files**: 输出图片（必填），按组的顺序排列
     """
+    acquired: List[str] = []  # 本次请求登记的存储对象引用，失败时释放
     try:
         # 验证类型
         if log_type not in ('txt2img', 'img2img'):
@@ -139,159 +512,184 @@ async def create_log(
         if is_nsfw and is_nsfw.lower() == 'true':
             is_nsfw_value = 'true'
         
-        # 创建日志记录（不再存储tools和models，因为现在在output_groups中）
-        log = GenLog(
-            title=title,
-            log_type=log_type,
-            tools=None,  # 不再在主表存储
-            models=None,  # 不再在主表存储
-            prompt=prompt,
-            params_note=params_note,
-            comparison_group_id=None,  # 不再使用对比组功能
-            is_nsfw=is_nsfw_value
-        )
-        db.add(log)
-        db.flush()  # 获取 ID
+        # 结束鉴权查询开启的事务，上传原图期间不占用数据库连接
+        db.commit()
         
-        # 处理输入文件（仅 img2img 模式）
+        # 先上传原图（衍生图由后台任务生成，不阻塞请求）
         logger.info(f"创建记录 - log_type: {log_type}, input_files数量: {len(input_files) if input_files else 0}, input_files类型: {type(input_files)}")
+        input_originals = []
         if log_type == 'img2img' and input_files:
             logger.info(f"开始处理输入文件，数量: {len(input_files)}")
-            for idx, file in enumerate(input_files):
-                # 读取文件内容
-                content = await file.read()
-                
-                # 验证图片
-                is_valid, error_msg = validate_image(content, file.filename)
-                if not is_valid:
-                    raise HTTPException(status_code=400, detail=f"输入图片验证失败 ({file.filename}): {error_msg}")
-                
-                # 上传原图
-                original_key = await rustfs_client.upload_file(
-                    content,
-                    file.filename,
-                    file.content_type
-                )
-                if not original_key:
-                    raise HTTPException(status_code=500, detail=f"上传输入图片失败: {file.filename}")
-                
-                # 生成并上传缩略图
-                try:
-                    thumbnail_content, thumbnail_content_type = generate_thumbnail(content)
-                    thumbnail_key = await rustfs_client.upload_file(
-                        thumbnail_content,
-                        f"thumb_{file.filename}",
-                        thumbnail_content_type
-                    )
-                except Exception as e:
-                    logger.warning(f"生成缩略图失败: {e}，使用原图")
-                    thumbnail_key = original_key
-                
-                # 获取备注（如果有）
-                note = input_notes_dict.get(file.filename, '')
-                
-                # 创建资源记录
-                asset = LogAsset(
-                    log_id=log.id,
-                    file_key=original_key,
-                    asset_type='input',
-                    note=note,
-                    sort_order=idx
-                )
-                db.add(asset)
-                logger.info(f"已添加输入资源记录: file_key={original_key}, note={note}, sort_order={idx}")
+            input_originals = await _store_originals(input_files, "输入图片", acquired)
+        
+        output_originals = await _store_originals(output_files, "输出图片", acquired)
         
-        # 处理输出组和输出文件
+        # 按组的顺序把输出文件分配到各输出组
+        groups = []
         file_index = 0
         for group_idx, group_data in enumerate(output_groups_list):
-            # 解析组的工具和模型
-            group_tools = group_data.get('tools', [])
-            group_models = group_data.get('models', [])
             file_count = group_data.get('file_count', 0)
-            
-            # 创建输出组
-            output_group = OutputGroup(
-                log_id=log.id,
-                tools=group_tools if group_tools else None,
-                models=group_models if group_models else None,
-                sort_order=group_idx
-            )
-            db.add(output_group)
-            db.flush()  # 获取组ID
-            
-            # 处理该组的输出文件
-            for file_offset in range(file_count):
-                if file_index >= len(output_files):
-                    raise HTTPException(status_code=400, detail=f"输出文件数量不足：组 {group_idx + 1} 需要 {file_count} 个文件")
-                
-                file = output_files[file_index]
-                file_index += 1
-                
-                # 读取文件内容
-                content = await file.read()
-                
-                # 验证图片
-                is_valid, error_msg = validate_image(content, file.filename)
-                if not is_valid:
-                    raise HTTPException(status_code=400, detail=f"输出图片验证失败 ({file.filename}): {error_msg}")
-                
-                # 上传原图
-                original_key = await rustfs_client.upload_file(
-                    content,
-                    file.filename,
-                    file.content_type
-                )
-                if not original_key:
-                    raise HTTPException(status_code=500, detail=f"上传输出图片失败: {file.filename}")
-                
-                # 生成并上传缩略图
-                try:
-                    thumbnail_content, thumbnail_content_type = generate_thumbnail(content)
-                    thumbnail_key = await rustfs_client.upload_file(
-                        thumbnail_content,
-                        f"thumb_{file.filename}",
-                        thumbnail_content_type
-                    )
-                except Exception as e:
-                    logger.warning(f"生成缩略图失败: {e}，使用原图")
-                    thumbnail_key = original_key
-                
-                # 创建资源记录，关联到输出组
-                asset = LogAsset(
-                    log_id=log.id,
-                    file_key=original_key,
-                    asset_type='output',
-                    output_group_id=output_group.id,
-                    sort_order=file_offset
-                )
-                db.add(asset)
+            group_originals = output_originals[file_index:file_index + file_count]
+            if len(group_originals) < file_count:
+                raise HTTPException(status_code=400, detail=f"输出文件数量不足：组 {group_idx + 1} 需要 {file_count} 个文件")
+            file_index += file_count
+            groups.append((group_data.get('tools', []), group_data.get('models', []), group_originals))
+        
+        log, new_assets = _create_log_records(
+            db,
+            title=title,
+            log_type=log_type,
+            prompt=prompt,
+            params_note=params_note,
+            is_nsfw=is_nsfw_value,
+            inputs=[(original, input_notes_dict.get(file.filename, '')) for file, original in zip(input_files, input_originals)],
+            groups=groups
+        )
         
         # 提交事务
         db.commit()
-        db.refresh(log)
-        
-        logger.info(f"创建记录成功: ID={log.id}, title={title}")
-        
-        # 清除相关缓存
-        cache.clear("tags:")  # 清除标签相关缓存
-        cache.clear("logs_")  # 清除列表缓存
-        
-        return {
-            "id": log.id,
-            "title": log.title,
-            "log_type": log.log_type,
-            "comparison_group_id": log.comparison_group_id,  # 返回对比组ID，用于后续记录加入
-            "created_at": log.created_at.isoformat(),
-            "is_nsfw": log.is_nsfw == 'true' if log.is_nsfw else False  # 转换为布尔值
-        }
+        acquired.clear()
+        return _log_created(db, log, new_assets)
         
     except HTTPException:
         db.rollback()
+        await blob_store.discard(acquired)
+        raise
+    except Exception as e:
+        db.rollback()
+        await blob_store.discard(acquired)
+        logger.error(f"创建记录失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"创建记录失败: {str(e)}")
+
+
+@router.post("/uploads")
+async def plan_uploads(
+    body: UploadPlanRequest,
+    current_user: User = Depends(require_permission("log.create"))
+):
+    """
+    申请直传上传计划（两阶段上传的第一阶段）
+    
+    返回每个文件的预签名 POST 表单，或分片上传的每个分片的预签名 PUT URL，
+    浏览器把文件直接上传到对象存储，完成后调用 POST /commit 创建记录
+    """
+    try:
+        return await direct_upload.plan([file.model_dump() for file in body.files], current_user.id)
+    except DirectUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"生成上传计划失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"生成上传计划失败: {str(e)}")
+
+
+def _lock_plan(db: Session, planned: List[Dict[str, Any]]) -> None:
+    """
+    在当前事务中获取上传计划锁（PostgreSQL 事务级 advisory lock，事务结束时释放）
+
+    同一计划的并发提交在"检查是否已提交 + 创建记录"和"清理已上传文件"上互斥；
+    数据库不支持时不加锁
+    """
+    if db.get_bind().dialect.name != 'postgresql':
+        return
+    plan_id = '\n'.join(entry['k'] for entry in planned)
+    lock_id = int.from_bytes(hashlib.sha1(plan_id.encode('utf-8')).digest()[:8], 'big', signed=True)
+    db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": lock_id})
+
+
+def _plan_committed(db: Session, planned: List[Dict[str, Any]]) -> bool:
+    """计划中的文件是否已被记录引用（直传的对象只被一个资源引用）"""
+    return db.query(LogAsset.id).filter(LogAsset.file_key.in_([entry['k'] for entry in planned])).first() is not None
+
+
+async def _discard_plan(db: Session, planned: List[Dict[str, Any]]) -> None:
+    """
+    提交失败时删除计划中已上传的文件
+
+    持有计划锁检查并删除：同一计划的并发提交已成功时，文件已被其记录引用，不删除
+    """
+    try:
+        await asyncio.to_thread(_lock_plan, db, planned)
+        if _plan_committed(db, planned):
+            logger.info("上传计划已被并发请求提交，保留已上传的文件")
+            return
+        await direct_upload.discard(planned)
+    finally:
+        db.rollback()
+
+
+@router.post("/commit")
+async def commit_log(
+    body: CommitLogRequest,
+    current_user: User = Depends(require_permission("log.create")),
+    db: Session = Depends(get_db)
+):
+    """
+    提交直传的上传计划并创建记录（两阶段上传的第二阶段）
+    
+    服务端完成分片上传，通过 HEAD 核对文件大小并读取文件开头验证格式，不下载完整文件；
+    每个计划只能提交一次（计划锁内检查并创建记录，并发提交只有一个成功），
+    验证失败时删除计划中已上传的文件，需要重新申请计划
+    """
+    if body.log_type not in ('txt2img', 'img2img'):
+        raise HTTPException(status_code=400, detail="log_type 必须是 'txt2img' 或 'img2img'")
+    if not body.output_groups:
+        raise HTTPException(status_code=400, detail="至少需要一个输出组")
+    try:
+        planned = direct_upload.parse_token(body.plan_token, current_user.id)
+    except DirectUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # 对于 txt2img，忽略输入图片
+    inputs = body.inputs if body.log_type == 'img2img' else []
+    used = [item.file for item in inputs] + [index for group in body.output_groups for index in group.files]
+    if sorted(used) != list(range(len(planned))):
+        raise HTTPException(status_code=400, detail="上传计划中的每个文件必须且只能使用一次")
+    
+    # 同一计划只能提交一次（快速检查，创建记录前在计划锁内再次检查）
+    if _plan_committed(db, planned):
+        raise HTTPException(status_code=409, detail="上传计划已提交")
+    
+    # 结束查询事务，验证文件期间不占用数据库连接
+    db.commit()
+    
+    try:
+        originals = await direct_upload.verify(
+            planned,
+            {index: [part.model_dump() for part in parts] for index, parts in body.parts.items()}
+        )
+    except DirectUploadError as e:
+        await _discard_plan(db, planned)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await _discard_plan(db, planned)
+        logger.error(f"验证直传文件失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"验证上传文件失败: {str(e)}")
+    
+    try:
+        # 计划锁在提交后释放，并发提交等待后看到已创建的记录
+        await asyncio.to_thread(_lock_plan, db, planned)
+        if _plan_committed(db, planned):
+            db.rollback()
+            raise HTTPException(status_code=409, detail="上传计划已提交")
+        log, new_assets = _create_log_records(
+            db,
+            title=body.title,
+            log_type=body.log_type,
+            prompt=body.prompt,
+            params_note=body.params_note,
+            is_nsfw='true' if body.is_nsfw else 'false',
+            inputs=[(originals[item.file], item.note) for item in inputs],
+            groups=[(group.tools, group.models, [originals[index] for index in group.files]) for group in body.output_groups]
+        )
+        db.commit()
+    except HTTPException:
         raise
     except Exception as e:
         db.rollback()
+        await _discard_plan(db, planned)
         logger.error(f"创建记录失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"创建记录失败: {str(e)}")
+    return _log_created(db, log, new_assets)
 
 
 @router.get("/")
@@ -302,6 +700,7 @@ async def list_logs(
     log_type: Optional[str] = None,
     tool: Optional[str] = None,
     model: Optional[str] = None,
+    srcset: bool = False,
     db: Session = Depends(get_db)
 ):
     """
@@ -313,10 +712,11 @@ async def list_logs(
     - **log_type**: 筛选类型
     - **tool**: 筛选工具标签
     - **model**: 筛选模型标签
+    - **srcset**: 是否返回预览图的 srcset（按宽度档位，供前端响应式加载）
     """
     try:
         # 构建缓存键
-        cache_key = f"logs_list_{page}_{page_size}_{search or ''}_{log_type or ''}_{tool or ''}_{model or ''}"
+        cache_key = f"logs_list_{page}_{page_size}_{search or ''}_{log_type or ''}_{tool or ''}_{model or ''}_{int(srcset)}"
         
         # 尝试从缓存获取（缓存1分钟）
         cached_result = cache.get(cache_key)
@@ -385,7 +785,7 @@ async def list_logs(
         all_output_assets = db.query(LogAsset).filter(
             LogAsset.log_id.in_(log_ids),
             LogAsset.asset_type == 'output'
-        ).order_by(LogAsset.sort_order).all()
+        ).order_by(LogAsset.sort_order, LogAsset.id).all()
         
         # 按 log_id 分组
         assets_by_log_id: dict[int, list] = {}
@@ -431,6 +831,8 @@ async def list_logs(
             # 生成封面图 URL（第一张图片）和多张图片的预览 URL
             cover_url = None
             preview_urls: list[str] = []
+            previews: list[dict] = []
+            preview_srcsets: list[str] = []
             
             # 获取前几张图片的 URL（最多4张，用于预览）
             # 使用 API 代理 URL，这样外网可以通过 web 端口访问
@@ -438,10 +840,13 @@ async def list_logs(
             for asset in output_assets[:4]:
                 url = get_proxy_url(asset.file_key, size='medium')  # 使用中等尺寸，减少传输量
                 preview_urls.append(url)
+                previews.append({"url": url, **get_asset_metadata(asset)})
+                if srcset:
+                    preview_srcsets.append(get_srcset(asset.file_key, asset.width))
                 if not cover_url:  # 第一张作为封面
                     cover_url = url
             
-            result.append({
+            item = {
                 "id": log.id,
                 "title": log.title,
                 "log_type": log.log_type,
@@ -450,9 +855,20 @@ async def list_logs(
                 "cover_url": cover_url,
                 "output_count": len(output_assets),  # 输出图片总数
                 "preview_urls": preview_urls,  # 前几张预览图（最多4张）
+                "previews": previews,  # 预览图的宽高、大小和占位图，与 preview_urls 一一对应
                 "created_at": log.created_at.isoformat(),
                 "is_nsfw": log.is_nsfw == 'true' if log.is_nsfw else False  # 转换为布尔值
-            })
+            }
+            # 多张预览图合成一张拼图，前端一次请求即可显示网格预览（tiles 与 preview_urls 一一对应）
+            if len(preview_urls) > 1:
+                sprite_keys = [asset.file_key for asset in output_assets[:SPRITE_MAX_TILES]]
+                item["sprite"] = {"url": get_sprite_url(log.id, sprite_keys), **sprite_layout(len(sprite_keys))}
+            else:
+                item["sprite"] = None
+            if srcset:
+                item["cover_srcset"] = preview_srcsets[0] if preview_srcsets else None
+                item["preview_srcsets"] = preview_srcsets  # 与 preview_urls 一一对应
+            result.append(item)
         
         result_data = {
             "total": total,
@@ -502,7 +918,9 @@ async def get_log(log_id: int, db: Session = Depends(get_db)):
                     "file_key": asset.file_key,
                     "url": asset_url,
                     "note": asset.note,
-                    "sort_order": asset.sort_order
+                    "sort_order": asset.sort_order,
+                    "rendition_status": asset.rendition_status,  # 衍生图生成状态
+                    **get_asset_metadata(asset)
                 })
         
         # 获取输出组并按组组织输出图片
@@ -528,7 +946,9 @@ async def get_log(log_id: int, db: Session = Depends(get_db)):
                     "id": asset.id,
                     "file_key": asset.file_key,
                     "url": asset_url,
-                    "sort_order": asset.sort_order
+                    "sort_order": asset.sort_order,
+                    "rendition_status": asset.rendition_status,
+                    **get_asset_metadata(asset)
                 })
             
             output_groups_data.append({
@@ -555,7 +975,9 @@ async def get_log(log_id: int, db: Session = Depends(get_db)):
                         "id": asset.id,
                         "file_key": asset.file_key,
                         "url": asset_url,
-                        "sort_order": asset.sort_order
+                        "sort_order": asset.sort_order,
+                        "rendition_status": asset.rendition_status,
+                        **get_asset_metadata(asset)
                     })
                 
                 # 从主表获取工具和模型（兼容旧数据）
@@ -671,28 +1093,16 @@ async def delete_log(
         
         # 获取所有关联的资源
         assets = db.query(LogAsset).filter(LogAsset.log_id == log_id).all()
+        sprite_digest = _sprite_digest(db, log_id)
         
-        # 删除 S3 中的文件（包括原图和缩略图）
-        deleted_files = []
-        failed_files = []
-        
-        for asset in assets:
-            # 删除原图
-            if asset.file_key:
-                success = await rustfs_client.delete_file(asset.file_key)
-                if success:
-                    deleted_files.append(asset.file_key)
-                else:
-                    failed_files.append(asset.file_key)
-            
-            # 尝试删除缩略图（缩略图 key 格式可能是 thumb_xxx 或从原图 key 推导）
-            # 这里我们需要知道缩略图的 key，但当前设计中缩略图是单独存储的
-            # 为了简化，我们只删除原图，缩略图可以后续清理
-            # TODO: 如果需要精确删除缩略图，需要在 LogAsset 中添加 thumbnail_key 字段
+        # 释放原图引用，不再被其他资源引用的对象在提交后从 S3 中删除
+        doomed = blob_store.release(db, [asset.file_key for asset in assets])
         
-        # 删除数据库记录（级联删除 LogAsset）
+        # 删除数据库记录（级联删除 LogAsset），同时删除记录的拼图
         db.delete(log)
+        doomed += _release_stale_sprite(db, log_id, sprite_digest)
         db.commit()
+        deleted_files, failed_files = await blob_store.delete_objects(doomed)
         
         logger.info(f"删除记录成功: ID={log_id}, 删除文件: {len(deleted_files)}, 失败: {len(failed_files)}")
         
@@ -735,6 +1145,7 @@ async def add_output_group(
     - **models**: 模型标签，逗号分隔的字符串
     - **output_files**: 输出图片文件（必填）
     """
+    acquired: List[str] = []  # 本次请求登记的存储对象引用，失败时释放
     try:
         # 查找记录
         log = db.query(GenLog).filter(GenLog.id == log_id).first()
@@ -744,6 +1155,13 @@ async def add_output_group(
         # 解析标签
         tools_list = [t.strip() for t in tools.split(',') if t.strip()] if tools else []
         models_list = [m.strip() for m in models.split(',') if m.strip()] if models else []
+        sprite_digest = _sprite_digest(db, log_id)
+        
+        # 结束查询事务，上传原图期间不占用数据库连接
+        db.commit()
+        
+        # 先上传原图（衍生图由后台任务生成，不阻塞请求）
+        output_originals = await _store_originals(output_files, "输出图片", acquired)
         
         # 获取当前最大的sort_order
         max_sort_order_result = db.query(OutputGroup.sort_order).filter(
@@ -753,7 +1171,7 @@ async def add_output_group(
         
         # 创建输出组
         output_group = OutputGroup(
-            log_id=log.id,
+            log_id=log_id,
             tools=tools_list if tools_list else None,
             models=models_list if models_list else None,
             sort_order=next_sort_order
@@ -761,56 +1179,37 @@ async def add_output_group(
         db.add(output_group)
         db.flush()  # 获取组ID
         
-        # 处理输出文件
-        for idx, file in enumerate(output_files):
-            # 读取文件内容
-            content = await file.read()
-            
-            # 验证图片
-            is_valid, error_msg = validate_image(content, file.filename)
-            if not is_valid:
-                raise HTTPException(status_code=400, detail=f"输出图片验证失败 ({file.filename}): {error_msg}")
-            
-            # 上传原图
-            original_key = await rustfs_client.upload_file(
-                content,
-                file.filename,
-                file.content_type
-            )
-            if not original_key:
-                raise HTTPException(status_code=500, detail=f"上传输出图片失败: {file.filename}")
-            
-            # 生成并上传缩略图
-            try:
-                thumbnail_content, thumbnail_content_type = generate_thumbnail(content)
-                thumbnail_key = await rustfs_client.upload_file(
-                    thumbnail_content,
-                    f"thumb_{file.filename}",
-                    thumbnail_content_type
-                )
-            except Exception as e:
-                logger.warning(f"生成缩略图失败: {e}，使用原图")
-                thumbnail_key = original_key
-            
-            # 创建资源记录，关联到输出组
+        # 创建资源记录，关联到输出组
+        new_assets = []
+        for idx, original in enumerate(output_originals):
             asset = LogAsset(
-                log_id=log.id,
-                file_key=original_key,
+                log_id=log_id,
+                **original,
                 asset_type='output',
                 output_group_id=output_group.id,
-                sort_order=idx
+                sort_order=idx,
+                rendition_status=STATUS_PENDING
             )
             db.add(asset)
+            new_assets.append(asset)
+        
+        # 新图片排在拼图的前几张时旧拼图不再使用
+        doomed = _release_stale_sprite(db, log_id, sprite_digest)
         
         # 提交事务
         db.commit()
+        acquired.clear()
+        await blob_store.delete_objects(doomed)
         db.refresh(output_group)
         
+        # 衍生图加入后台生成队列
+        rendition_worker.enqueue(asset.id for asset in new_assets)
+        
         logger.info(f"添加输出组成功: log_id={log_id}, group_id={output_group.id}")
         
         return {
             "id": output_group.id,
-            "log_id": log.id,
+            "log_id": log_id,
             "tools": output_group.tools or [],
             "models": output_group.models or [],
             "file_count": len(output_files),
@@ -819,9 +1218,11 @@ async def add_output_group(
         
     except HTTPException:
         db.rollback()
+        await blob_store.discard(acquired)
         raise
     except Exception as e:
         db.rollback()
+        await blob_store.discard(acquired)
         logger.error(f"添加输出组失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"添加输出组失败: {str(e)}")
 
@@ -845,6 +1246,7 @@ async def update_output_group(
     - **remove_asset_ids**: 要删除的图片ID列表，JSON格式
     - **output_files**: 新增的输出图片文件（可选）
     """
+    acquired: List[str] = []  # 本次请求登记的存储对象引用，失败时释放
     try:
         # 查找记录和输出组
         log = db.query(GenLog).filter(GenLog.id == log_id).first()
@@ -857,6 +1259,13 @@ async def update_output_group(
         ).first()
         if not output_group:
             raise HTTPException(status_code=404, detail="输出组不存在")
+        sprite_digest = _sprite_digest(db, log_id)
+        
+        # 结束查询事务，上传原图期间不占用数据库连接
+        db.commit()
+        
+        # 先上传新增图片的原图（衍生图由后台任务生成，不阻塞请求）
+        output_originals = await _store_originals(output_files, "输出图片", acquired)
         
         # 更新工具和模型
         if tools is not None:
@@ -873,6 +1282,7 @@ async def update_output_group(
                 output_group.models = models_list if models_list else None
         
         # 删除指定的图片
+        doomed: List[str] = []
         if remove_asset_ids:
             import json
             try:
@@ -884,13 +1294,10 @@ async def update_output_group(
                         LogAsset.log_id == log_id
                     ).all()
                     
+                    # 释放原图引用，不再被其他资源引用的对象在提交后从 S3 中删除
+                    doomed = blob_store.release(db, [asset.file_key for asset in assets_to_remove])
+                    
                     for asset in assets_to_remove:
-                        # 删除S3中的文件
-                        try:
-                            await rustfs_client.delete_file(asset.file_key)
-                        except Exception as e:
-                            logger.warning(f"删除文件失败: {asset.file_key}, {e}")
-                        
                         db.delete(asset)
             except json.JSONDecodeError:
                 raise HTTPException(status_code=400, detail="remove_asset_ids 必须是有效的JSON数组")
@@ -901,44 +1308,30 @@ async def update_output_group(
         ).order_by(LogAsset.sort_order.desc()).first()
         next_sort_order = (current_max_sort[0] + 1) if current_max_sort else 0
         
-        for idx, file in enumerate(output_files):
-            content = await file.read()
-            
-            is_valid, error_msg = validate_image(content, file.filename)
-            if not is_valid:
-                raise HTTPException(status_code=400, detail=f"输出图片验证失败 ({file.filename}): {error_msg}")
-            
-            original_key = await rustfs_client.upload_file(
-                content,
-                file.filename,
-                file.content_type
-            )
-            if not original_key:
-                raise HTTPException(status_code=500, detail=f"上传输出图片失败: {file.filename}")
-            
-            try:
-                thumbnail_content = generate_thumbnail(content)
-                thumbnail_key = await rustfs_client.upload_file(
-                    thumbnail_content,
-                    f"thumb_{file.filename}",
-                    "image/jpeg"
-                )
-            except Exception as e:
-                logger.warning(f"生成缩略图失败: {e}，使用原图")
-                thumbnail_key = original_key
-            
+        new_assets = []
+        for idx, original in enumerate(output_originals):
             asset = LogAsset(
-                log_id=log.id,
-                file_key=original_key,
+                log_id=log_id,
+                **original,
                 asset_type='output',
-                output_group_id=output_group.id,
-                sort_order=next_sort_order + idx
+                output_group_id=group_id,
+                sort_order=next_sort_order + idx,
+                rendition_status=STATUS_PENDING
             )
             db.add(asset)
+            new_assets.append(asset)
+        
+        # 删除或新增图片后拼图的组成图片可能变化
+        doomed += _release_stale_sprite(db, log_id, sprite_digest)
         
         db.commit()
+        acquired.clear()
+        await blob_store.delete_objects(doomed)
         db.refresh(output_group)
         
+        # 衍生图加入后台生成队列
+        rendition_worker.enqueue(asset.id for asset in new_assets)
+        
         logger.info(f"更新输出组成功: log_id={log_id}, group_id={group_id}")
         
         # 清除相关缓存
@@ -947,7 +1340,7 @@ async def update_output_group(
         
         return {
             "id": output_group.id,
-            "log_id": log.id,
+            "log_id": log_id,
             "tools": output_group.tools or [],
             "models": output_group.models or [],
             "created_at": output_group.created_at.isoformat()
@@ -955,9 +1348,11 @@ async def update_output_group(
         
     except HTTPException:
         db.rollback()
+        await blob_store.discard(acquired)
         raise
     except Exception as e:
         db.rollback()
+        await blob_store.discard(acquired)
         logger.error(f"更新输出组失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"更新输出组失败: {str(e)}")
 
@@ -990,17 +1385,19 @@ async def delete_output_group(
             LogAsset.output_group_id == group_id,
             LogAsset.log_id == log_id
         ).all()
+        sprite_digest = _sprite_digest(db, log_id)
         
-        # 删除S3中的文件
-        for asset in assets:
-            try:
-                await rustfs_client.delete_file(asset.file_key)
-            except Exception as e:
-                logger.warning(f"删除文件失败: {asset.file_key}, {e}")
+        # 释放原图引用，不再被其他资源引用的对象在提交后从 S3 中删除
+        doomed = blob_store.release(db, [asset.file_key for asset in assets])
         
-        # 删除输出组（级联删除会同时删除关联的assets）
+        # 删除输出组的资源记录（log_assets.output_group_id 为 ON DELETE SET NULL，关系上也没有级联删除，
+        # 不显式删除会留下仍指向已释放存储键的资源，删除记录时会再次释放同一引用）
+        for asset in assets:
+            db.delete(asset)
         db.delete(output_group)
+        doomed += _release_stale_sprite(db, log_id, sprite_digest)
         db.commit()
+        await blob_store.delete_objects(doomed)
         
         logger.info(f"删除输出组成功: log_id={log_id}, group_id={group_id}")
         
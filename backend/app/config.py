@@ -2,6 +2,7 @@
 应用配置
 """
 import os
+import tempfile
 from pydantic_settings import BaseSettings
 from typing import List, Optional
 
@@ -30,6 +31,28 @@ class Settings(BaseSettings):
     RUSTFS_BUCKET: str = os.getenv("RUSTFS_BUCKET", "aigcvault")
     RUSTFS_REGION: str = os.getenv("RUSTFS_REGION", "us-east-1")  # MinIO 通常使用 us-east-1
     RUSTFS_USE_SSL: bool = os.getenv("RUSTFS_USE_SSL", "false").lower() == "true"
+    # 浏览器访问对象存储的地址（预签名 URL 使用），默认与 RUSTFS_ENDPOINT_URL 相同
+    RUSTFS_PUBLIC_ENDPOINT_URL: str = os.getenv("RUSTFS_PUBLIC_ENDPOINT_URL", "") or RUSTFS_ENDPOINT_URL
+    RUSTFS_STREAM_CHUNK_SIZE: int = int(os.getenv("RUSTFS_STREAM_CHUNK_SIZE", str(256 * 1024)))  # 流式下载每次读取的字节数
+    # 共享 S3 客户端的连接池：最大连接数（包括流式下载占用的连接）、空闲连接保持时间（秒）、连接/读取超时（秒）
+    RUSTFS_MAX_POOL_CONNECTIONS: int = int(os.getenv("RUSTFS_MAX_POOL_CONNECTIONS", "64"))
+    RUSTFS_KEEPALIVE_TIMEOUT: float = float(os.getenv("RUSTFS_KEEPALIVE_TIMEOUT", "60"))
+    RUSTFS_CONNECT_TIMEOUT: float = float(os.getenv("RUSTFS_CONNECT_TIMEOUT", "5"))
+    RUSTFS_READ_TIMEOUT: float = float(os.getenv("RUSTFS_READ_TIMEOUT", "60"))
+    # 单次操作的总超时（秒）：元数据等小请求、整个文件的上传/下载，0 表示不限制；幂等操作失败后的重试次数
+    RUSTFS_OPERATION_TIMEOUT: float = float(os.getenv("RUSTFS_OPERATION_TIMEOUT", "10"))
+    RUSTFS_TRANSFER_TIMEOUT: float = float(os.getenv("RUSTFS_TRANSFER_TIMEOUT", "120"))
+    RUSTFS_RETRIES: int = int(os.getenv("RUSTFS_RETRIES", "2"))
+    # 熔断：连续失败次数达到阈值后直接失败（0 表示不熔断），冷却时间（秒）后放行一个探测请求
+    RUSTFS_BREAKER_FAILURES: int = int(os.getenv("RUSTFS_BREAKER_FAILURES", "5"))
+    RUSTFS_BREAKER_RESET_SECONDS: float = float(os.getenv("RUSTFS_BREAKER_RESET_SECONDS", "30"))
+    # 对冲读取：图片读取超过该时间（毫秒）未返回时再发起一个相同的请求，0 表示不对冲
+    RUSTFS_HEDGE_DELAY_MS: int = int(os.getenv("RUSTFS_HEDGE_DELAY_MS", "0"))
+    # 分片上传：超过阈值（MB）的文件分片并发上传，0 表示不使用分片上传
+    RUSTFS_MULTIPART_THRESHOLD: int = int(float(os.getenv("RUSTFS_MULTIPART_THRESHOLD", "16")) * 1024 * 1024)
+    RUSTFS_MULTIPART_PART_SIZE: int = int(float(os.getenv("RUSTFS_MULTIPART_PART_SIZE", "8")) * 1024 * 1024)  # 分片大小（MB），最小 5MB
+    RUSTFS_MULTIPART_CONCURRENCY: int = int(os.getenv("RUSTFS_MULTIPART_CONCURRENCY", "4"))  # 单个文件同时上传的分片数
+    RUSTFS_MULTIPART_RETRIES: int = int(os.getenv("RUSTFS_MULTIPART_RETRIES", "3"))  # 单个分片失败后的重试次数
     
     # CORS 配置
     CORS_ORIGINS: List[str] = os.getenv(
@@ -39,15 +62,73 @@ class Settings(BaseSettings):
     
     # 文件上传配置
     MAX_UPLOAD_SIZE: int = int(os.getenv("MAX_UPLOAD_SIZE", "50")) * 1024 * 1024  # 默认 50MB
+    UPLOAD_CONCURRENCY: int = int(os.getenv("UPLOAD_CONCURRENCY", "4"))  # 单个请求同时读取、验证和上传的文件数
+    DIRECT_UPLOAD_EXPIRE_SECONDS: int = int(os.getenv("DIRECT_UPLOAD_EXPIRE_SECONDS", "900"))  # 直传上传计划（预签名 URL）的有效期（秒）
     ALLOWED_IMAGE_TYPES: List[str] = ["image/png", "image/jpeg", "image/jpg", "image/webp"]
     
     # 缩略图配置
     THUMBNAIL_SIZE: int = int(os.getenv("THUMBNAIL_SIZE", "300"))
     THUMBNAIL_QUALITY: int = int(os.getenv("THUMBNAIL_QUALITY", "85"))
+
+    # 中等尺寸配置（列表页预览使用）
+    MEDIUM_IMAGE_SIZE: int = int(os.getenv("MEDIUM_IMAGE_SIZE", "1920"))
+    MEDIUM_IMAGE_QUALITY: int = int(os.getenv("MEDIUM_IMAGE_QUALITY", "85"))
     
-    # 图片输出格式配置（'webp' 或 'jpeg'）
+    # 响应式宽度档位（?w= 参数会向上取整到最近的档位，每个档位只渲染一次）
+    RENDITION_WIDTH_LADDER: List[int] = sorted(
+        int(w) for w in os.getenv("RENDITION_WIDTH_LADDER", "160,320,640,960,1280,1920,2560").split(",") if w.strip()
+    )
+
+    # 图片输出格式配置（'avif'、'webp' 或 'jpeg'）
     # WebP 格式可以减少 25-35% 的文件大小，同时保持相似质量
-    IMAGE_OUTPUT_FORMAT: str = os.getenv("IMAGE_OUTPUT_FORMAT", "webp").lower()  # 默认使用 WebP
+    IMAGE_OUTPUT_FORMAT: str = os.getenv("IMAGE_OUTPUT_FORMAT", "webp").lower()  # 默认使用 WebP（后台预生成的格式）
+    
+    # 按请求 Accept 头协商的输出格式（按优先级排列），客户端都不支持时使用 JPEG
+    IMAGE_NEGOTIATED_FORMATS: List[str] = [
+        f.strip().lower() for f in os.getenv("IMAGE_NEGOTIATED_FORMATS", "avif,webp,jpeg").split(",") if f.strip()
+    ]
+    
+    # 图片处理进程池配置（Pillow 解码/缩放/编码在进程池中执行，不阻塞事件循环）
+    # 进程数，0 表示不使用进程池（退化为线程池）
+    IMAGE_PROCESS_WORKERS: int = int(os.getenv("IMAGE_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+    IMAGE_QUEUE_MAX: int = int(os.getenv("IMAGE_QUEUE_MAX", "32"))  # 最大排队任务数，超出后返回 503
+    IMAGE_TASK_TIMEOUT: float = float(os.getenv("IMAGE_TASK_TIMEOUT", "60"))  # 单个任务超时（秒），0 表示不限制
+    # 解码像素预算（单位：百万像素）：单张图片上限，以及本进程同时解码的像素总量上限（0 表示不限制）
+    IMAGE_MAX_PIXELS: int = int(float(os.getenv("IMAGE_MAX_PIXELS", "100")) * 1000 * 1000)
+    IMAGE_DECODE_BUDGET_PIXELS: int = int(float(os.getenv("IMAGE_DECODE_BUDGET_PIXELS", "256")) * 1000 * 1000)
+    # 超过单张上限的 JPEG 在解码阶段按 1/2、1/4、1/8 缩小后处理（关闭则直接拒绝）
+    IMAGE_OVERSIZE_DRAFT: bool = os.getenv("IMAGE_OVERSIZE_DRAFT", "true").lower() == "true"
+    
+    # 衍生图后台生成配置
+    RENDITION_WORKER_CONCURRENCY: int = int(os.getenv("RENDITION_WORKER_CONCURRENCY", "2"))  # 同时处理的图片数
+    # 后台预生成的输出格式（逗号分隔），其他格式在首次请求时生成并持久化
+    RENDITION_PREGENERATE_FORMATS: List[str] = [
+        f.strip().lower() for f in os.getenv("RENDITION_PREGENERATE_FORMATS", os.getenv("IMAGE_OUTPUT_FORMAT", "webp")).split(",") if f.strip()
+    ]
+    RENDITION_STALE_SECONDS: int = int(os.getenv("RENDITION_STALE_SECONDS", "600"))  # 超过该时间仍在生成中的任务视为中断，重新认领（同时是定期恢复的间隔）
+    # 按需渲染的跨进程锁：等待其他进程渲染同一衍生图的最长时间（秒），超时后自行渲染，0 表示不使用跨进程锁
+    RENDITION_LOCK_TIMEOUT: float = float(os.getenv("RENDITION_LOCK_TIMEOUT", "30"))
+    
+    # 衍生图本地磁盘缓存（命中时直接返回本机文件，不访问对象存储）
+    RENDITION_DISK_CACHE_DIR: str = os.getenv("RENDITION_DISK_CACHE_DIR", os.path.join(tempfile.gettempdir(), "aigc_vault_renditions"))
+    RENDITION_DISK_CACHE_MAX_MB: int = int(os.getenv("RENDITION_DISK_CACHE_MAX_MB", "1024"))  # 每个进程的字节预算（MB），0 表示禁用；N 个 worker 进程最多占用 N 倍磁盘
+    RENDITION_DISK_CACHE_WARM_MAX: int = int(os.getenv("RENDITION_DISK_CACHE_WARM_MAX", "500"))  # 启动时按访问日志预热的最大文件数
+    
+    # 图片访问方式：'proxy'（经 API 转发内容，默认）或 'redirect'（302 跳转到对象存储的预签名 URL，
+    # 浏览器需要能访问 RUSTFS_PUBLIC_ENDPOINT_URL）
+    ASSET_SERVING_MODE: str = os.getenv("ASSET_SERVING_MODE", "proxy").lower()
+    ASSET_PRESIGN_EXPIRE_SECONDS: int = int(os.getenv("ASSET_PRESIGN_EXPIRE_SECONDS", "3600"))  # 跳转使用的预签名 URL 有效期（秒）
+    
+    # 列表卡片拼图（前 4 张输出图片合成一张）：每个图块的边长（像素）和质量
+    SPRITE_TILE_SIZE: int = int(os.getenv("SPRITE_TILE_SIZE", "400"))
+    SPRITE_QUALITY: int = int(os.getenv("SPRITE_QUALITY", "80"))
+    
+    # 近似重复图片索引（感知哈希）全量重建间隔（秒），0 表示只在启动时加载
+    SIMILARITY_INDEX_REFRESH_SECONDS: int = int(os.getenv("SIMILARITY_INDEX_REFRESH_SECONDS", "300"))
+    
+    # 孤立对象清理：未被任何记录引用的对象超过宽限期（小时）后删除；服务进程定期清理的间隔（小时），0 表示只通过脚本执行
+    ORPHAN_GC_GRACE_HOURS: float = float(os.getenv("ORPHAN_GC_GRACE_HOURS", "24"))
+    ORPHAN_GC_INTERVAL_HOURS: float = float(os.getenv("ORPHAN_GC_INTERVAL_HOURS", "0"))
     
     # 编辑密码配置（可选）
     EDIT_PASSWORD: Optional[str] = os.getenv("EDIT_PASSWORD", None)
@@ -140,6 +140,52 @@ async def init_default_admin():
         import logging
         logging.getLogger(__name__).warning(f"默认管理员初始化跳过: {e}")
 
+@app.on_event("startup")
+async def startup_services():
+    """创建共享 S3 客户端，启动图片处理进程池、衍生图后台任务、衍生图磁盘缓存、相似图片索引和孤立对象定期清理"""
+    import asyncio
+    import logging
+    from app.config import settings
+    from app.services.image_executor import image_executor
+    from app.services.orphan_gc import orphan_collector
+    from app.services.rendition_worker import rendition_worker
+    from app.services.rustfs_client import rustfs_client
+    from app.services.similarity_index import similarity_index
+    from app.utils.disk_cache import disk_cache
+    await rustfs_client.start()
+    image_executor.start()
+    await rendition_worker.start()
+    await similarity_index.start()
+    await orphan_collector.start()
+    try:
+        # 重建磁盘缓存索引，并在后台按访问日志预热热点衍生图
+        warm_keys = await asyncio.to_thread(disk_cache.start)
+        if warm_keys and settings.RENDITION_DISK_CACHE_WARM_MAX > 0:
+            app.state.disk_cache_warm_task = asyncio.create_task(
+                disk_cache.warm(warm_keys[:settings.RENDITION_DISK_CACHE_WARM_MAX], rustfs_client.download_file)
+            )
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"初始化衍生图磁盘缓存失败，已禁用: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_services():
+    """停止衍生图后台任务、磁盘缓存预热、相似图片索引、孤立对象清理，关闭图片处理进程池和共享 S3 客户端"""
+    from app.services.image_executor import image_executor
+    from app.services.orphan_gc import orphan_collector
+    from app.services.rendition_worker import rendition_worker
+    from app.services.rustfs_client import rustfs_client
+    from app.services.similarity_index import similarity_index
+    from app.utils.disk_cache import disk_cache
+    warm_task = getattr(app.state, "disk_cache_warm_task", None)
+    if warm_task and not warm_task.done():
+        warm_task.cancel()
+    await rendition_worker.stop()
+    await similarity_index.stop()
+    await orphan_collector.stop()
+    disk_cache.stop()
+    image_executor.shutdown()
+    await rustfs_client.close()
+
 # 配置 CORS
 app.add_middleware(
     CORSMiddleware,
@@ -226,7 +272,7 @@ async def health_check():
     try:
         from sqlalchemy import text
         from app.database import engine
-        from app.services.rustfs_client import rustfs_client
+        from app.services.rustfs_client import CircuitBreaker, rustfs_client
     except Exception as e:
         return JSONResponse({
             "status": "error",
@@ -244,11 +290,16 @@ async def health_check():
     except Exception as e:
         db_status = f"error: {str(e)[:50]}"
     
-    # 检查 RustFS/S3 连接
+    # 检查 RustFS/S3 连接（不经过熔断器，探测结果不影响熔断状态）
     rustfs_status = "disconnected"
     try:
         is_healthy = await rustfs_client.health_check()
-        rustfs_status = "connected" if is_healthy else "unreachable"
+        if is_healthy:
+            rustfs_status = "connected"
+        elif rustfs_client.breaker.state == CircuitBreaker.OPEN:
+            rustfs_status = "circuit_open"
+        else:
+            rustfs_status = "unreachable"
     except Exception as e:
         rustfs_status = f"error: {str(e)[:50]}"
     
@@ -258,6 +309,7 @@ async def health_check():
         "status": overall_status,
         "database": db_status,
         "rustfs": rustfs_status,
+        "rustfs_breaker": {**rustfs_client.breaker.snapshot(), "hedged_reads": rustfs_client.hedged_reads},
         "timestamp": datetime.now().isoformat()
     })
 
@@ -1,6 +1,8 @@
 # Models package
 from app.models.gen_log import GenLog
 from app.models.log_asset import LogAsset
+from app.models.asset_rendition import AssetRendition
+from app.models.storage_blob import StorageBlob
 from app.models.output_group import OutputGroup
 from app.models.user import User
 from app.models.favorite import Favorite
@@ -10,7 +12,7 @@ from app.models.role_permission import RolePermission
 from app.models.user_role import UserRole
 
 __all__ = [
-    "GenLog", "LogAsset", "OutputGroup", "User", "Favorite",
+    "GenLog", "LogAsset", "AssetRendition", "StorageBlob", "OutputGroup", "User", "Favorite",
     "Permission", "Role", "RolePermission", "UserRole"
 ]
 
@@ -0,0 +1,30 @@
+"""
+衍生图数据模型
+记录已持久化到对象存储的缩略图、中等尺寸等衍生图
+"""
+from sqlalchemy import Column, Integer, String, Text, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class AssetRendition(Base):
+    """衍生图模型"""
+    __tablename__ = "asset_renditions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_key = Column(Text, nullable=False, index=True)  # 原图存储键
+    size = Column(String(32), nullable=False)  # 尺寸标识：'thumb'、'medium' 等
+    format = Column(String(10), nullable=False)  # 输出格式：'webp'、'jpeg' 等
+    encoder_version = Column(String(32), nullable=False)  # 编码参数版本，参数变化后旧衍生图自动失效
+    rendition_key = Column(Text, nullable=False, unique=True)  # 衍生图存储键
+    content_type = Column(String(50), nullable=False)
+    byte_size = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    # 唯一约束：同一原图、尺寸、格式、编码版本只渲染一次
+    __table_args__ = (
+        UniqueConstraint('file_key', 'size', 'format', 'encoder_version', name='uq_asset_rendition'),
+    )
+
+    def __repr__(self):
+        return f"<AssetRendition(id={self.id}, file_key='{self.file_key}', size='{self.size}', format='{self.format}')>"
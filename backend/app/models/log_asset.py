@@ -1,7 +1,7 @@
 """
 资源附件数据模型
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -17,6 +17,15 @@ class LogAsset(Base):
     note = Column(Text, nullable=True)
     sort_order = Column(Integer, default=0, nullable=False)
     output_group_id = Column(Integer, ForeignKey("log_output_groups.id", ondelete="SET NULL"), nullable=True, index=True)  # 输出组ID（仅output类型有效）
+    rendition_status = Column(String(20), nullable=True)  # 衍生图生成状态：'pending'、'processing'、'ready'、'failed'，旧数据为空（按需生成）
+    rendition_claimed_at = Column(DateTime, nullable=True)  # 后台任务认领（开始生成）的时间，用于判断 processing 任务是否已中断
+    content_hash = Column(String(64), nullable=True)  # 原图内容 SHA-256（十六进制），用作 ETag，旧数据为空
+    width = Column(Integer, nullable=True)  # 原图宽度（像素）
+    height = Column(Integer, nullable=True)  # 原图高度（像素）
+    byte_size = Column(Integer, nullable=True)  # 原图文件大小（字节）
+    format = Column(String(10), nullable=True)  # 原图格式：'png'、'jpeg'、'webp'、'gif'
+    lqip = Column(Text, nullable=True)  # 低质量占位图 data URI，由衍生图后台任务生成
+    phash = Column(BigInteger, nullable=True)  # 感知哈希（64 位 dHash），用于查找近似重复图片，由衍生图后台任务计算
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     
     # 关联关系
@@ -0,0 +1,22 @@
+"""
+存储对象数据模型
+原图按内容哈希寻址存储，相同内容只保存一份，log_assets 通过 file_key 引用，
+ref_count 记录引用数，最后一个引用删除时才删除对象
+"""
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class StorageBlob(Base):
+    """存储对象模型"""
+    __tablename__ = "storage_blobs"
+
+    content_hash = Column(String(64), primary_key=True)  # 内容 SHA-256（十六进制）
+    file_key = Column(Text, nullable=False, unique=True)  # 对象存储键
+    byte_size = Column(Integer, nullable=False, default=0)
+    ref_count = Column(Integer, nullable=False, default=0)  # 引用该对象的资源数
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<StorageBlob(content_hash='{self.content_hash}', file_key='{self.file_key}', ref_count={self.ref_count})>"
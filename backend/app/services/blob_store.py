@@ -0,0 +1,238 @@
+"""
+内容寻址存储
+原图按内容 SHA-256 存储到固定的键下，相同内容只上传一份；
+storage_blobs.ref_count 记录引用数，最后一个引用释放时才删除对象
+"""
+import base64
+import logging
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.asset_rendition import AssetRendition
+from app.models.storage_blob import StorageBlob
+from app.services.rendition_store import RENDITION_PREFIX
+from app.services.rustfs_client import rustfs_client
+from app.utils.disk_cache import disk_cache
+
+logger = logging.getLogger(__name__)
+
+# 内容寻址对象的键前缀
+BLOB_PREFIX = "blobs"
+
+
+class BlobStore:
+    """内容寻址存储"""
+
+    def build_key(self, content_hash: str, filename: Optional[str] = None) -> str:
+        """
+        生成内容寻址存储键（保留扩展名，便于推断 Content-Type）
+
+        Args:
+            content_hash: 内容 SHA-256（十六进制）
+            filename: 原始文件名
+
+        Returns:
+            存储键，格式: blobs/<哈希前2位>/<哈希次2位>/<哈希>.<扩展名>
+        """
+        ext = Path(filename).suffix.lower() if filename else ''
+        if not ext[1:].isalnum() or len(ext) > 10:
+            ext = ''
+        return f"{BLOB_PREFIX}/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{ext}"
+
+    def _add_ref(self, db: Session, content_hash: str, file_key: str, byte_size: int) -> str:
+        """增加引用计数（不存在时创建），返回对象实际的存储键"""
+        for _ in range(2):
+            # 行锁与 delete_objects 互斥：删除待删除记录的对象期间，重新引用同一内容会等待删除完成后重新上传
+            blob = db.query(StorageBlob).filter(
+                StorageBlob.content_hash == content_hash
+            ).with_for_update().first()
+            if blob:
+                blob.ref_count += 1
+                db.commit()
+                return blob.file_key
+            try:
+                with db.begin_nested():
+                    db.add(StorageBlob(
+                        content_hash=content_hash,
+                        file_key=file_key,
+                        byte_size=byte_size,
+                        ref_count=1
+                    ))
+                db.commit()
+                return file_key
+            except IntegrityError:
+                # 并发请求已创建同一对象，重新读取并增加引用
+                continue
+        raise RuntimeError(f"登记存储对象失败: {content_hash}")
+
+    async def acquire(
+        self,
+        content: bytes,
+        content_hash: str,
+        filename: str,
+        content_type: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        存储原图并增加一个引用（相同内容已存在时只增加引用，不重复上传）
+
+        先在独立的短事务中登记引用，再确认对象存在：引用提交后对象不会被并发的删除操作删除。
+        调用方在资源记录写入失败时需调用 discard 释放引用。
+
+        Args:
+            content: 文件内容（字节）
+            content_hash: 内容 SHA-256（十六进制）
+            filename: 原始文件名
+            content_type: MIME 类型（可选）
+
+        Returns:
+            存储键，失败返回 None
+        """
+        db = SessionLocal()
+        try:
+            file_key = self._add_ref(db, content_hash, self.build_key(content_hash, filename), len(content))
+        finally:
+            db.close()
+
+        if await rustfs_client.file_exists(file_key):
+            logger.info(f"原图内容已存在，复用存储对象: {filename} -> {file_key}")
+            return file_key
+
+        if not content_type:
+            import mimetypes
+            content_type, _ = mimetypes.guess_type(filename)
+            if not content_type:
+                content_type = 'application/octet-stream'
+
+        # S3 metadata 只支持 ASCII 字符，对文件名进行 base64 编码
+        encoded_filename = base64.b64encode(filename.encode('utf-8')).decode('ascii')
+        success = await rustfs_client.put_file(
+            file_key,
+            content,
+            content_type,
+            metadata={
+                'original-filename-encoded': encoded_filename,
+                'upload-time': datetime.now().isoformat()
+            }
+        )
+        if not success:
+            await self.discard([file_key])
+            return None
+
+        logger.info(f"文件上传成功: {filename} -> {file_key}")
+        return file_key
+
+    def release(self, db: Session, file_keys: Iterable[str]) -> List[str]:
+        """
+        释放引用，返回需要在调用方提交事务后删除的对象（不访问对象存储）
+
+        最后一个引用释放时，存储对象记录保留为 ref_count=0 的待删除记录，原图的衍生图登记随事务删除；
+        调用方提交事务后调用 delete_objects 删除对象。事务回滚时记录和对象都保持原样，
+        提交后删除失败（或进程退出）留下的对象由孤立对象清理回收
+
+        Args:
+            db: 数据库会话（调用方负责提交）
+            file_keys: 被删除的资源引用的存储键（同一存储键出现多次表示多个引用）
+
+        Returns:
+            提交后需要删除的对象存储键（原图和衍生图）
+        """
+        doomed = []
+        for file_key, count in Counter(key for key in file_keys if key).items():
+            blob = db.query(StorageBlob).filter(
+                StorageBlob.file_key == file_key
+            ).with_for_update().first()
+            if blob is None:
+                # 旧数据：存储键由 uuid 生成，只被一个资源引用
+                doomed.append(file_key)
+                continue
+            blob.ref_count = max(blob.ref_count - count, 0)
+            if blob.ref_count == 0:
+                doomed.append(file_key)
+        if not doomed:
+            db.flush()
+            return []
+
+        # 衍生图随原图一起删除（登记随事务删除）
+        rendition_keys = [
+            key for (key,) in db.query(AssetRendition.rendition_key).filter(AssetRendition.file_key.in_(doomed))
+        ]
+        db.query(AssetRendition).filter(AssetRendition.file_key.in_(doomed)).delete(synchronize_session=False)
+        db.flush()
+        return doomed + rendition_keys
+
+    async def delete_objects(self, keys: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """
+        删除 release 返回的对象（在调用方提交事务后调用）
+
+        待删除记录在独立的短事务中加行锁后再删除对象：期间重新引用同一内容的上传会等待删除完成后重新上传；
+        删除前已被重新引用（ref_count > 0）的对象保留。原图和衍生图通过批量删除请求（每批 1000 个键）删除
+
+        Args:
+            keys: release 返回的存储键
+
+        Returns:
+            (已删除的存储键, 删除失败的存储键)，删除失败的对象由孤立对象清理回收
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return [], []
+        db = SessionLocal()
+        try:
+            pending = db.query(StorageBlob).filter(StorageBlob.file_key.in_(keys)).with_for_update().all()
+            revived = {blob.file_key for blob in pending if blob.ref_count > 0}
+            if revived:
+                logger.info(f"对象在删除前被重新引用，保留: {len(revived)} 个")
+                keys = [key for key in keys if key not in revived]
+
+            deleted, failed_keys = await rustfs_client.delete_files(keys)
+            for blob in pending:
+                if blob.file_key not in revived:
+                    db.delete(blob)
+            db.commit()
+        except Exception as e:
+            # 资源记录已提交，删除失败不影响请求结果
+            db.rollback()
+            logger.warning(f"删除对象失败（由孤立对象清理回收）: {len(keys)} 个, {e}")
+            return [], keys
+        finally:
+            db.close()
+
+        for key in keys:
+            if key.startswith(f"{RENDITION_PREFIX}/"):
+                disk_cache.delete(key)
+        failed = [key for key in keys if key in failed_keys]
+        if failed:
+            logger.warning(f"部分对象删除失败（由孤立对象清理回收）: {len(failed)} 个")
+        return list(deleted), failed
+
+    async def discard(self, file_keys: Iterable[str]) -> None:
+        """
+        释放已登记但未写入资源记录的引用（请求失败时的补偿，使用独立事务）
+
+        Args:
+            file_keys: acquire 返回的存储键
+        """
+        file_keys = list(file_keys)
+        if not file_keys:
+            return
+        db = SessionLocal()
+        try:
+            doomed = self.release(db, file_keys)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"释放存储对象引用失败: {file_keys}, {e}")
+            return
+        finally:
+            db.close()
+        await self.delete_objects(doomed)
+
+
+# 全局内容寻址存储实例
+blob_store = BlobStore()
@@ -0,0 +1,227 @@
+"""
+浏览器直传对象存储
+两阶段上传：先申请上传计划（预签名 POST 表单或分片上传的预签名 URL），浏览器把文件直接上传到对象存储；
+再提交计划，服务端只读取对象元数据和文件开头的字节进行验证，图片内容不经过 API 进程
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.services.rustfs_client import MULTIPART_MIN_PART_SIZE, rustfs_client
+from app.utils.auth import create_access_token, verify_token
+from app.utils.image_processor import get_image_info, validate_image_header
+
+logger = logging.getLogger(__name__)
+
+# 直传对象的键前缀（非内容寻址，每个对象只被一个资源引用）
+UPLOAD_PREFIX = "uploads"
+
+# 上传计划令牌的用途标识（不含 sub，不能作为登录令牌使用）
+PLAN_TOKEN_PURPOSE = "upload_plan"
+
+# 单个上传计划的最大文件数
+MAX_PLAN_FILES = 100
+
+# 验证时读取的文件开头字节数（需覆盖 EXIF、ICC 等位于图片尺寸信息之前的数据）
+HEADER_READ_BYTES = 512 * 1024
+
+# 支持直传的图片类型
+DIRECT_UPLOAD_TYPES = ('image/png', 'image/jpeg', 'image/webp', 'image/gif')
+
+
+class DirectUploadError(Exception):
+    """上传计划无效或上传的文件未通过验证"""
+
+
+class DirectUploadService:
+    """浏览器直传对象存储"""
+
+    @staticmethod
+    def build_key(filename: str) -> str:
+        """生成直传对象的存储键，格式: uploads/YYYY/MM/DD/<uuid>.<扩展名>"""
+        ext = Path(filename).suffix.lower()
+        if not ext[1:].isalnum() or len(ext) > 10:
+            ext = ''
+        return f"{UPLOAD_PREFIX}/{datetime.now().strftime('%Y/%m/%d')}/{uuid.uuid4().hex}{ext}"
+
+    async def plan(self, files: List[Dict[str, Any]], user_id: int) -> Dict[str, Any]:
+        """
+        生成上传计划
+
+        不超过 RUSTFS_MULTIPART_THRESHOLD 的文件使用预签名 POST 表单（存储服务按策略限制大小和类型），
+        更大的文件创建分片上传并为每个分片生成预签名 PUT URL
+
+        Args:
+            files: [{'filename', 'content_type', 'size'}]
+            user_id: 申请计划的用户ID（提交时必须是同一用户）
+
+        Returns:
+            {'plan_token', 'expires_in', 'files': [每个文件的上传方式]}
+
+        Raises:
+            DirectUploadError: 文件数量、类型或大小不符合要求
+        """
+        if not files:
+            raise DirectUploadError("至少需要一个文件")
+        if len(files) > MAX_PLAN_FILES:
+            raise DirectUploadError(f"单次最多上传 {MAX_PLAN_FILES} 个文件")
+
+        expires_in = settings.DIRECT_UPLOAD_EXPIRE_SECONDS
+        planned, uploads = [], []
+        try:
+            for index, file in enumerate(files):
+                filename = str(file.get('filename') or '').strip()
+                content_type = str(file.get('content_type') or '').lower()
+                size = file.get('size')
+                if not filename:
+                    raise DirectUploadError(f"第 {index + 1} 个文件缺少文件名")
+                if content_type not in DIRECT_UPLOAD_TYPES:
+                    raise DirectUploadError(f"不支持的图片类型 ({filename}): {content_type}，仅支持 PNG, JPEG, WEBP, GIF")
+                if not isinstance(size, int) or size <= 0 or size > settings.MAX_UPLOAD_SIZE:
+                    max_mb = settings.MAX_UPLOAD_SIZE / (1024 * 1024)
+                    raise DirectUploadError(f"文件大小无效 ({filename}): 最大允许 {max_mb}MB")
+
+                file_key = self.build_key(filename)
+                entry = {'k': file_key, 's': size, 't': content_type, 'n': filename}
+                planned.append(entry)
+                threshold = settings.RUSTFS_MULTIPART_THRESHOLD
+                if 0 < threshold < size:
+                    upload_id = await rustfs_client.create_multipart_upload(file_key, content_type)
+                    if not upload_id:
+                        raise RuntimeError(f"创建分片上传失败: {filename}")
+                    entry['u'] = upload_id
+                    part_size = max(settings.RUSTFS_MULTIPART_PART_SIZE, MULTIPART_MIN_PART_SIZE)
+                    part_count = -(-size // part_size)
+                    uploads.append({
+                        'index': index,
+                        'file_key': file_key,
+                        'method': 'multipart',
+                        'part_size': part_size,
+                        'parts': [
+                            {
+                                'part_number': number,
+                                'url': rustfs_client.presign_upload_part(file_key, upload_id, number, expires_in)
+                            }
+                            for number in range(1, part_count + 1)
+                        ],
+                    })
+                else:
+                    form = rustfs_client.presign_post(file_key, content_type, size, expires_in)
+                    uploads.append({
+                        'index': index,
+                        'file_key': file_key,
+                        'method': 'post',
+                        'url': form['url'],
+                        'fields': form['fields'],
+                    })
+        except BaseException:
+            # 已创建的分片上传不会再被使用
+            await self._abort_multipart(planned)
+            raise
+
+        token = create_access_token(
+            {'purpose': PLAN_TOKEN_PURPOSE, 'uid': user_id, 'files': planned},
+            timedelta(seconds=expires_in)
+        )
+        return {'plan_token': token, 'expires_in': expires_in, 'files': uploads}
+
+    def parse_token(self, token: str, user_id: int) -> List[Dict[str, Any]]:
+        """
+        校验上传计划令牌
+
+        Returns:
+            计划中的文件（按申请顺序）
+
+        Raises:
+            DirectUploadError: 令牌无效、已过期或不属于当前用户
+        """
+        payload = verify_token(token or '')
+        if not payload or payload.get('purpose') != PLAN_TOKEN_PURPOSE or payload.get('uid') != user_id:
+            raise DirectUploadError("上传计划无效或已过期，请重新上传")
+        return payload.get('files') or []
+
+    async def verify(
+        self,
+        planned: List[Dict[str, Any]],
+        parts: Optional[Dict[int, List[Dict[str, Any]]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        确认计划中的文件已上传并验证（完成分片上传、HEAD 读取大小、读取文件开头验证格式和像素数）
+
+        Args:
+            planned: parse_token 返回的文件
+            parts: {文件序号: [{'part_number', 'etag'}]}，分片上传的文件需要提供
+
+        Returns:
+            每个文件的原图字段（可直接作为 LogAsset 的列值），顺序与计划一致
+
+        Raises:
+            DirectUploadError: 文件未上传或未通过验证
+        """
+        parts = parts or {}
+        semaphore = asyncio.Semaphore(max(settings.UPLOAD_CONCURRENCY, 1))
+
+        async def verify_file(index: int, entry: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._verify_file(entry, parts.get(index))
+
+        return list(await asyncio.gather(*(verify_file(i, entry) for i, entry in enumerate(planned))))
+
+    async def _verify_file(self, entry: Dict[str, Any], parts: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+        """确认并验证单个文件"""
+        file_key, filename = entry['k'], entry['n']
+        if entry.get('u'):
+            if not parts:
+                raise DirectUploadError(f"缺少分片信息: {filename}")
+            try:
+                completed = [
+                    {'PartNumber': int(part['part_number']), 'ETag': str(part['etag'])}
+                    for part in sorted(parts, key=lambda part: int(part['part_number']))
+                ]
+            except (KeyError, TypeError, ValueError):
+                raise DirectUploadError(f"分片信息格式错误: {filename}")
+            if not await rustfs_client.complete_multipart_upload(file_key, entry['u'], completed):
+                raise DirectUploadError(f"完成分片上传失败: {filename}")
+
+        info = await rustfs_client.get_object_info(file_key)
+        if not info:
+            raise DirectUploadError(f"文件未上传: {filename}")
+        if info['content_length'] != entry['s']:
+            raise DirectUploadError(f"文件大小与计划不一致 ({filename}): {info['content_length']} != {entry['s']}")
+
+        header = await rustfs_client.download_file(file_key, byte_range=f"bytes=0-{HEADER_READ_BYTES - 1}")
+        if not header:
+            raise DirectUploadError(f"读取文件失败: {filename}")
+        is_valid, error_msg = validate_image_header(header)
+        if not is_valid:
+            raise DirectUploadError(f"图片验证失败 ({filename}): {error_msg}")
+
+        image_info = get_image_info(header)
+        return {
+            "file_key": file_key,
+            "content_hash": None,  # 内容未经过服务端，不计算哈希
+            "width": image_info['width'] or None,
+            "height": image_info['height'] or None,
+            "byte_size": entry['s'],
+            "format": image_info['format'].lower(),
+        }
+
+    async def discard(self, planned: List[Dict[str, Any]]) -> None:
+        """删除计划中已上传的对象并中止未完成的分片上传（提交失败时调用）"""
+        await self._abort_multipart(planned)
+        await rustfs_client.delete_files(entry['k'] for entry in planned)
+
+    @staticmethod
+    async def _abort_multipart(planned: List[Dict[str, Any]]) -> None:
+        """中止计划中的分片上传（已完成的分片上传中止失败只记录日志）"""
+        await asyncio.gather(*(
+            rustfs_client.abort_multipart_upload(entry['k'], entry['u']) for entry in planned if entry.get('u')
+        ))
+
+
+# 全局直传服务实例
+direct_upload = DirectUploadService()
@@ -0,0 +1,267 @@
+"""
+图片处理执行器
+将 Pillow 解码/缩放/编码等 CPU 密集型任务放到有界进程池中执行，
+事件循环只负责 I/O，避免一张大图阻塞同一 worker 上的所有请求；
+提交前按图片像素数申请解码预算，限制同时解码占用的内存
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Deque, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ImageExecutorBusy(Exception):
+    """排队任务数已达上限"""
+
+
+class ImageTaskTimeout(Exception):
+    """图片处理任务超时"""
+
+
+class PixelBudget:
+    """
+    按像素数加权的信号量（先到先得）
+    
+    解码内存与像素数成正比：大图占用更多预算，几张大图同时解码时后续任务排队等待，
+    小图不受任务数限制之外的影响
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity  # 预算总量（像素），0 表示不限制
+        self._available = capacity
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+    @property
+    def in_use(self) -> int:
+        """已占用的预算（像素）"""
+        return self.capacity - self._available
+
+    async def acquire(self, pixels: int) -> int:
+        """
+        申请预算，不足时排队等待
+
+        Args:
+            pixels: 解码像素数（超过预算总量时按总量计算，即独占）
+
+        Returns:
+            实际占用的预算，释放时传给 release
+        """
+        if self.capacity <= 0 or pixels <= 0:
+            return 0
+        weight = min(pixels, self.capacity)
+        if not self._waiters and weight <= self._available:
+            self._available -= weight
+            return weight
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (weight, future)
+        self._waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分配预算但等待方被取消（如超时），归还预算
+                self.release(weight)
+            else:
+                self._waiters.remove(waiter)
+                self._wake()
+            raise
+        return weight
+
+    def release(self, weight: int) -> None:
+        """释放预算并唤醒排队的任务"""
+        if weight <= 0:
+            return
+        self._available += weight
+        self._wake()
+
+    def _wake(self) -> None:
+        """按排队顺序分配预算（队首预算不足时后续任务继续等待，避免大图饿死）"""
+        while self._waiters:
+            weight, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if weight > self._available:
+                return
+            self._waiters.popleft()
+            self._available -= weight
+            future.set_result(None)
+
+
+class ImageExecutor:
+    """有界图片处理进程池"""
+
+    def __init__(
+        self,
+        max_workers: int = None,
+        max_queue: int = None,
+        task_timeout: float = None,
+        decode_budget: int = None
+    ):
+        self.max_workers = settings.IMAGE_PROCESS_WORKERS if max_workers is None else max_workers
+        self.max_queue = settings.IMAGE_QUEUE_MAX if max_queue is None else max_queue
+        self.task_timeout = settings.IMAGE_TASK_TIMEOUT if task_timeout is None else task_timeout
+        self._budget = PixelBudget(settings.IMAGE_DECODE_BUDGET_PIXELS if decode_budget is None else decode_budget)
+        self._pool: Optional[Executor] = None
+        self._pool_lock = threading.RLock()
+        self._pending = 0  # 已接收但未完成的任务数（执行中 + 排队中，包括等待解码预算的任务）
+
+    def start(self) -> None:
+        """创建进程池（首次提交任务时也会自动创建）"""
+        with self._pool_lock:
+            self._start()
+
+    def _start(self) -> None:
+        """创建进程池（调用方需持有 _pool_lock）"""
+        if self._pool is not None:
+            return
+        if self.max_workers > 0:
+            # 使用 spawn 启动子进程，避免 fork 继承事件循环和连接池状态
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            logger.info(f"图片处理进程池已启动: workers={self.max_workers}, queue={self.max_queue}")
+        else:
+            # IMAGE_PROCESS_WORKERS=0 时退化为使用线程池（仍不阻塞事件循环）
+            self._pool = ThreadPoolExecutor(thread_name_prefix="image")
+            logger.info("图片处理进程池已禁用，使用线程池执行")
+
+    def shutdown(self) -> None:
+        """关闭进程池"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+                logger.info("图片处理进程池已关闭")
+
+    def _restart(self, broken: Optional[Executor]) -> None:
+        """
+        重建已损坏的进程池（子进程异常退出后进程池不再接受任务）
+
+        同一进程池上同时失败的多个任务只重建一次：进程池已被替换时不做任何事
+        """
+        with self._pool_lock:
+            if broken is None or self._pool is not broken:
+                return
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            logger.warning("图片处理子进程异常退出，重建进程池")
+            self._start()
+
+    @property
+    def pending(self) -> int:
+        """已接收但未完成的任务数"""
+        return self._pending
+
+    @property
+    def budget_in_use(self) -> int:
+        """正在解码的像素数（已占用的解码预算）"""
+        return self._budget.in_use
+
+    async def run(self, func: Callable[..., Any], *args: Any, timeout: float = None, pixels: int = 0) -> Any:
+        """
+        在进程池中执行图片处理函数
+
+        Args:
+            func: 模块级函数（需可被 pickle，如 image_processor 中的函数）
+            *args: 函数参数
+            timeout: 超时时间（秒，包括等待解码预算的时间），默认使用配置值，0 表示不限制
+            pixels: 任务解码的像素数（image_processor.get_decode_pixels），0 表示不占用解码预算
+
+        Returns:
+            函数返回值
+
+        Raises:
+            ImageExecutorBusy: 排队任务数已达上限
+            ImageTaskTimeout: 任务超时
+            BrokenProcessPool: 执行任务的子进程异常退出（进程池已重建，后续任务不受影响）
+        """
+        if self._pending >= max(self.max_workers, 1) + self.max_queue:
+            raise ImageExecutorBusy(f"图片处理任务过多（{self._pending}），请稍后重试")
+
+        if self._pool is None:
+            self.start()
+
+        timeout = self.task_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout if timeout and timeout > 0 else None
+        self._pending += 1
+        try:
+            weight = await asyncio.wait_for(self._budget.acquire(pixels), timeout if deadline else None)
+        except asyncio.TimeoutError:
+            self._pending -= 1
+            logger.warning(f"等待图片解码预算超时: {getattr(func, '__name__', func)}, {pixels} 像素")
+            raise ImageTaskTimeout(f"图片处理超时（{timeout}s）")
+        except BaseException:
+            self._pending -= 1
+            raise
+
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            try:
+                task = pool.submit(func, *args)
+            except BrokenProcessPool:
+                # 之前的任务使子进程异常退出，进程池已损坏：重建后重新提交一次
+                self._restart(pool)
+                pool = self._pool
+                task = pool.submit(func, *args)
+        except BaseException:
+            self._pending -= 1
+            self._budget.release(weight)
+            raise
+        # 子进程中的任务真正结束（包括超时后仍在运行的任务）才释放名额和解码预算：
+        # 回调注册在进程池的 Future 上，而不是 asyncio 包装上（取消包装不代表子进程已停止）
+        task.add_done_callback(functools.partial(self._on_task_done, loop, weight))
+        future = asyncio.wrap_future(task)
+        future.add_done_callback(self._retrieve_exception)
+
+        try:
+            if deadline is None:
+                return await future
+            try:
+                # shield：超时后不取消 asyncio 包装，任务结果仍由回调处理
+                return await asyncio.wait_for(asyncio.shield(future), max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                task.cancel()  # 仅能取消尚未开始执行的任务，正在执行的任务继续占用名额直到结束
+                logger.warning(f"图片处理任务超时: {getattr(func, '__name__', func)}, {timeout}s")
+                raise ImageTaskTimeout(f"图片处理超时（{timeout}s）")
+        except BrokenProcessPool:
+            # 执行本任务时子进程异常退出（名额和解码预算已由完成回调释放），不重试本任务，避免同一张图再次拖垮进程池
+            logger.error(f"图片处理子进程异常退出: {getattr(func, '__name__', func)}")
+            self._restart(pool)
+            raise
+
+    def _on_task_done(self, loop: asyncio.AbstractEventLoop, weight: int, task: Future) -> None:
+        """任务结束回调（在进程池的线程中调用）：回到事件循环释放排队名额和解码预算"""
+        try:
+            loop.call_soon_threadsafe(self._release, weight)
+        except RuntimeError:
+            # 事件循环已关闭（进程退出），无需释放
+            pass
+
+    def _release(self, weight: int) -> None:
+        """释放排队名额和解码预算"""
+        self._pending -= 1
+        self._budget.release(weight)
+
+    @staticmethod
+    def _retrieve_exception(future: asyncio.Future) -> None:
+        """取回被放弃任务（如超时）的异常，避免未处理异常告警"""
+        if not future.cancelled():
+            future.exception()
+
+
+# 全局图片处理执行器实例
+image_executor = ImageExecutor()
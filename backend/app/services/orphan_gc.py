@@ -0,0 +1,222 @@
+"""
+孤立对象清理
+创建记录失败、旧版本上传的缩略图、未提交的直传文件等会在存储桶中留下没有任何记录引用的对象；
+分页列出存储桶中的对象，按批与 log_assets、asset_renditions、storage_blobs 核对，
+超过宽限期仍未被引用的对象批量删除。每次只在内存中保留一页对象和一批待删除的键，
+内存占用与存储桶中的对象总数无关
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.models.asset_rendition import AssetRendition
+from app.models.log_asset import LogAsset
+from app.models.storage_blob import StorageBlob
+from app.services.rendition_store import RENDITION_PREFIX
+from app.services.rustfs_client import DELETE_BATCH_SIZE, rustfs_client
+from app.utils.disk_cache import disk_cache
+
+logger = logging.getLogger(__name__)
+
+# 每页列出的对象数（ListObjectsV2 单页上限）
+LIST_PAGE_SIZE = 1000
+
+# 多个进程同时启用定期清理时，只有获得该 advisory lock 的进程执行
+GC_LOCK_ID = int.from_bytes(hashlib.sha1(b"orphan_gc").digest()[:8], 'big', signed=True)
+
+
+class GCStats:
+    """清理统计"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.scanned = 0            # 列出的对象数
+        self.scanned_bytes = 0
+        self.recent = 0             # 未超过宽限期而跳过的对象数
+        self.orphans = 0            # 超过宽限期且未被引用的对象数
+        self.orphan_bytes = 0
+        self.deleted = 0
+        self.deleted_bytes = 0
+        self.failed = 0             # 删除失败的对象数
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 0.001)
+        return (
+            f"扫描 {self.scanned} 个 ({self.scanned_bytes / 1024 / 1024:.1f} MB), "
+            f"孤立 {self.orphans} 个 ({self.orphan_bytes / 1024 / 1024:.1f} MB), "
+            f"已删除 {self.deleted} 个 ({self.deleted_bytes / 1024 / 1024:.1f} MB), 失败 {self.failed} 个, "
+            f"宽限期内跳过 {self.recent} 个 | {self.scanned / elapsed:.0f} 个/秒"
+        )
+
+
+class OrphanCollector:
+    """孤立对象清理（脚本调用 collect，服务进程可按 ORPHAN_GC_INTERVAL_HOURS 定期执行）"""
+
+    def __init__(self, interval_hours: float = None):
+        self.interval_hours = settings.ORPHAN_GC_INTERVAL_HOURS if interval_hours is None else interval_hours
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """启动定期清理任务（间隔为 0 时不启动）"""
+        if self._task is None and self.interval_hours > 0:
+            self._task = asyncio.create_task(self._run(), name="orphan-gc")
+
+    async def stop(self) -> None:
+        """停止定期清理任务"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        """定期清理主循环（启动后先等待一个间隔，避免重启时集中扫描）"""
+        while True:
+            await asyncio.sleep(self.interval_hours * 3600)
+            try:
+                conn = self._try_lock()
+                if conn is False:
+                    logger.info("其他进程正在清理孤立对象，跳过本次清理")
+                    continue
+                try:
+                    stats = await self.collect()
+                    logger.info(f"孤立对象清理完成: {stats.summary()}")
+                finally:
+                    self._unlock(conn)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"孤立对象清理失败: {e}", exc_info=True)
+
+    @staticmethod
+    def _try_lock():
+        """
+        获取跨进程清理锁（PostgreSQL 会话级 advisory lock，不等待）
+
+        Returns:
+            持有锁的连接；数据库不支持时返回 None（直接清理）；其他进程持有锁时返回 False
+        """
+        if engine.dialect.name != 'postgresql':
+            return None
+        conn = engine.connect()
+        if conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": GC_LOCK_ID}).scalar():
+            return conn
+        conn.close()
+        return False
+
+    @staticmethod
+    def _unlock(conn) -> None:
+        """释放跨进程清理锁（连接异常时服务端随连接断开释放锁）"""
+        if conn is None:
+            return
+        try:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": GC_LOCK_ID})
+            conn.close()
+        except Exception as e:
+            logger.warning(f"释放孤立对象清理锁失败: {e}")
+            conn.invalidate()
+
+    async def collect(
+        self,
+        dry_run: bool = False,
+        grace_hours: float = None,
+        prefix: str = '',
+        on_page: Optional[Callable[[GCStats], None]] = None
+    ) -> GCStats:
+        """
+        扫描存储桶并删除孤立对象
+
+        宽限期覆盖上传对象到写入记录之间的时间（不短于直传上传计划的有效期）；
+        删除前重新核对一次引用，缩小与并发上传之间的竞争窗口
+
+        Args:
+            dry_run: 只统计孤立对象数量和可回收的字节数，不删除
+            grace_hours: 宽限期（小时），默认 ORPHAN_GC_GRACE_HOURS
+            prefix: 只扫描该前缀下的对象
+            on_page: 每处理完一页后调用（用于输出进度）
+
+        Returns:
+            清理统计
+        """
+        grace_hours = settings.ORPHAN_GC_GRACE_HOURS if grace_hours is None else grace_hours
+        grace_seconds = max(grace_hours * 3600, settings.DIRECT_UPLOAD_EXPIRE_SECONDS)
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+
+        stats = GCStats()
+        pending: Dict[str, int] = {}  # 待删除的键 -> 字节数
+        db = SessionLocal()
+        try:
+            async for page in rustfs_client.iter_objects(prefix, LIST_PAGE_SIZE):
+                stats.scanned += len(page)
+                candidates = {}
+                for obj in page:
+                    stats.scanned_bytes += obj['size']
+                    if obj['last_modified'] and obj['last_modified'] >= cutoff:
+                        stats.recent += 1
+                    else:
+                        candidates[obj['key']] = obj['size']
+
+                referenced = self._referenced(db, candidates) if candidates else set()
+                for key, size in candidates.items():
+                    if key in referenced:
+                        continue
+                    stats.orphans += 1
+                    stats.orphan_bytes += size
+                    if not dry_run:
+                        pending[key] = size
+
+                if len(pending) >= DELETE_BATCH_SIZE:
+                    await self._delete(db, pending, stats)
+                    pending = {}
+                if on_page:
+                    on_page(stats)
+
+            if pending:
+                await self._delete(db, pending, stats)
+        finally:
+            db.close()
+        return stats
+
+    @staticmethod
+    def _referenced(db: Session, keys: Iterable[str]) -> Set[str]:
+        """批量查询被记录引用的存储键（原图、衍生图和仍有引用的内容寻址对象，每张表一次查询）"""
+        keys = list(keys)
+        referenced = set()
+        for column in (LogAsset.file_key, AssetRendition.rendition_key):
+            referenced.update(key for (key,) in db.query(column).filter(column.in_(keys)).distinct())
+        # ref_count 为 0 的是释放后尚未删除对象的待删除记录（删除失败或进程退出时留下），不算引用
+        referenced.update(
+            key for (key,) in db.query(StorageBlob.file_key).filter(
+                StorageBlob.file_key.in_(keys), StorageBlob.ref_count > 0
+            )
+        )
+        # 结束只读事务，下一批查询读取最新提交的数据
+        db.commit()
+        return referenced
+
+    async def _delete(self, db: Session, pending: Dict[str, int], stats: GCStats) -> None:
+        """重新核对引用后批量删除"""
+        referenced = self._referenced(db, pending)
+        keys: List[str] = [key for key in pending if key not in referenced]
+        if referenced:
+            logger.info(f"孤立对象在删除前被引用，保留: {len(referenced)} 个")
+        deleted, failed = await rustfs_client.delete_files(keys)
+        for key in deleted:
+            stats.deleted += 1
+            stats.deleted_bytes += pending[key]
+            if key.startswith(f"{RENDITION_PREFIX}/"):
+                disk_cache.delete(key)
+        stats.failed += len(failed)
+        for key, error in list(failed.items())[:10]:
+            logger.warning(f"删除孤立对象失败: {key}, {error}")
+
+
+# 全局孤立对象清理实例
+orphan_collector = OrphanCollector()
@@ -0,0 +1,492 @@
+"""
+衍生图存储
+缩略图、中等尺寸等衍生图按 (原图, 尺寸, 格式, 编码版本) 只渲染一次，
+写回对象存储并登记到 asset_renditions 表，后续请求只读取小尺寸对象；
+同一衍生图的并发未命中只渲染一次：进程内共享同一个渲染任务，进程间通过 PostgreSQL advisory lock 互斥
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.models.asset_rendition import AssetRendition
+from app.services.image_executor import image_executor
+from app.services.rustfs_client import CircuitBreaker, rustfs_client
+from app.utils.disk_cache import disk_cache
+from app.utils.image_processor import (
+    FORMAT_CONTENT_TYPES, SPRITE_SIZE, compose_sprite, get_decode_pixels, get_encoder_version, is_rendition_size,
+    render_rendition, generate_rendition_pyramid
+)
+
+logger = logging.getLogger(__name__)
+
+# 衍生图在对象存储中的键前缀
+RENDITION_PREFIX = "renditions"
+
+# 拼图的虚拟原图键前缀（拼图按组成图片的存储键摘要登记，组成图片变化后摘要随之变化）
+SPRITE_PREFIX = "sprites"
+
+# 拼图使用的源图尺寸
+SPRITE_SOURCE_SIZE = "medium"
+
+# 等待其他进程渲染同一衍生图时的轮询间隔（秒）
+RENDER_LOCK_POLL_INTERVAL = 0.2
+
+# 输出格式对应的文件扩展名
+FORMAT_EXTENSIONS = {
+    'avif': 'avif',
+    'webp': 'webp',
+    'jpeg': 'jpg',
+}
+
+
+class RenditionStore:
+    """衍生图存储"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}  # 进行中的渲染任务（按衍生图）
+
+    def build_key(self, file_key: str, size: str, output_format: str) -> str:
+        """
+        生成衍生图存储键
+
+        Args:
+            file_key: 原图存储键
+            size: 尺寸标识
+            output_format: 输出格式
+
+        Returns:
+            衍生图存储键，格式: renditions/<原图键>/<尺寸>-<编码版本>.<扩展名>
+        """
+        ext = FORMAT_EXTENSIONS.get(output_format, output_format)
+        return f"{RENDITION_PREFIX}/{file_key}/{size}-{get_encoder_version(size)}.{ext}"
+
+    def open_cached(self, file_key: str, size: str, output_format: str) -> Optional[Tuple[BinaryIO, str]]:
+        """
+        打开本机磁盘缓存中的衍生图（不访问数据库和对象存储，调用方负责关闭文件）
+
+        Returns:
+            (已打开的缓存文件, Content-Type)，未命中返回 None
+        """
+        f = disk_cache.open(self.build_key(file_key, size, output_format))
+        if f is None:
+            return None
+        return f, FORMAT_CONTENT_TYPES[output_format]
+
+    async def _cache_locally(self, file_key: str, size: str, output_format: str, content: bytes) -> None:
+        """写入本机磁盘缓存（失败不影响请求）"""
+        if disk_cache.enabled:
+            await asyncio.to_thread(disk_cache.put, self.build_key(file_key, size, output_format), content)
+
+    @staticmethod
+    def sprite_digest(file_keys: Sequence[str]) -> str:
+        """拼图摘要：由组成图片的存储键（按显示顺序）计算，用作拼图的版本号"""
+        return hashlib.sha1("\n".join(file_keys).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def sprite_source_key(digest: str) -> str:
+        """拼图在衍生图存储中登记的虚拟原图键"""
+        return f"{SPRITE_PREFIX}/{digest}"
+
+    def lookup(self, db: Session, file_key: str, size: str, output_format: str) -> Optional[AssetRendition]:
+        """查询已登记的衍生图"""
+        return db.query(AssetRendition).filter(
+            AssetRendition.file_key == file_key,
+            AssetRendition.size == size,
+            AssetRendition.format == output_format,
+            AssetRendition.encoder_version == get_encoder_version(size)
+        ).first()
+
+    async def save(
+        self,
+        db: Session,
+        file_key: str,
+        size: str,
+        output_format: str,
+        content: bytes,
+        content_type: str,
+        commit: bool = True
+    ) -> Optional[AssetRendition]:
+        """
+        写入衍生图并登记
+
+        Args:
+            db: 数据库会话
+            file_key: 原图存储键
+            size: 尺寸标识
+            output_format: 输出格式
+            content: 衍生图内容（字节）
+            content_type: MIME 类型
+            commit: 是否立即提交事务（在创建记录的事务中调用时传 False，随记录一起提交）
+
+        Returns:
+            衍生图记录，上传失败返回 None
+        """
+        rendition_key = self.build_key(file_key, size, output_format)
+        success = await rustfs_client.put_file(rendition_key, content, content_type)
+        if not success:
+            return None
+
+        rendition = AssetRendition(
+            file_key=file_key,
+            size=size,
+            format=output_format,
+            encoder_version=get_encoder_version(size),
+            rendition_key=rendition_key,
+            content_type=content_type,
+            byte_size=len(content)
+        )
+        try:
+            with db.begin_nested():
+                db.add(rendition)
+        except IntegrityError:
+            # 并发请求已登记同一衍生图（存储键相同，对象内容一致）
+            return self.lookup(db, file_key, size, output_format)
+        if commit:
+            db.commit()
+
+        logger.info(f"衍生图已持久化: {file_key} -> {rendition_key}, 大小: {len(content)} bytes")
+        return rendition
+
+    async def render_and_save(
+        self,
+        db: Session,
+        file_key: str,
+        original: bytes,
+        size: str,
+        output_format: str = None,
+        commit: bool = True
+    ) -> Tuple[bytes, str]:
+        """
+        从原图渲染衍生图并持久化（持久化失败不影响返回渲染结果）
+
+        Raises:
+            ValueError: 如果图片无法处理
+            ImageExecutorBusy: 图片处理进程池繁忙
+            ImageTaskTimeout: 图片处理超时
+        """
+        output_format = output_format or settings.IMAGE_OUTPUT_FORMAT
+        content, content_type = await image_executor.run(
+            render_rendition, original, size, output_format, pixels=get_decode_pixels(original)
+        )
+        try:
+            await self.save(db, file_key, size, output_format, content, content_type, commit=commit)
+        except Exception as e:
+            if commit:
+                db.rollback()
+            logger.warning(f"衍生图持久化失败: {file_key} ({size}), {e}")
+        return content, content_type
+
+    async def render_all_and_save(
+        self,
+        db: Session,
+        file_key: str,
+        original: bytes,
+        sizes: Sequence[str],
+        output_format: str = None
+    ) -> Dict[str, Tuple[bytes, str]]:
+        """
+        一次解码原图生成多个尺寸的衍生图并持久化（占位图等非衍生图尺寸只返回，不持久化）
+
+        Returns:
+            {尺寸标识: (衍生图内容（字节）, Content-Type)}
+
+        Raises:
+            ValueError: 如果图片无法处理
+            ImageExecutorBusy: 图片处理进程池繁忙
+            ImageTaskTimeout: 图片处理超时
+        """
+        output_format = output_format or settings.IMAGE_OUTPUT_FORMAT
+        results = await image_executor.run(
+            generate_rendition_pyramid, original, list(sizes), output_format, pixels=get_decode_pixels(original)
+        )
+        for size, (content, content_type) in results.items():
+            if not is_rendition_size(size):
+                continue
+            try:
+                await self.save(db, file_key, size, output_format, content, content_type)
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"衍生图持久化失败: {file_key} ({size}), {e}")
+        return results
+
+    async def get_or_create(
+        self,
+        db: Session,
+        file_key: str,
+        size: str,
+        output_format: str = None
+    ) -> Optional[Tuple[bytes, str]]:
+        """
+        获取衍生图，不存在时从原图渲染并持久化
+
+        Args:
+            db: 数据库会话
+            file_key: 原图存储键
+            size: 尺寸标识
+            output_format: 输出格式，默认使用配置值
+
+        Returns:
+            (衍生图内容（字节）, Content-Type)，原图不存在返回 None
+
+        Raises:
+            ValueError: 如果图片无法处理
+            ImageExecutorBusy: 图片处理进程池繁忙
+            ImageTaskTimeout: 图片处理超时
+        """
+        output_format = output_format or settings.IMAGE_OUTPUT_FORMAT
+
+        persisted = await self._load_persisted(db, file_key, size, output_format)
+        if persisted:
+            return persisted
+
+        self._release_caller(db)
+        return await self._single_flight((file_key, size, output_format), self._create, file_key, size, output_format)
+
+    async def _create(self, file_key: str, size: str, output_format: str) -> Optional[Tuple[bytes, str]]:
+        """渲染并持久化衍生图（由并发请求共享，使用渲染锁所在连接上的会话）"""
+        async with self._render_session(self.build_key(file_key, size, output_format)) as db:
+            # 等待锁期间其他进程可能已生成
+            persisted = await self._load_persisted(db, file_key, size, output_format)
+            if persisted:
+                return persisted
+
+            original = await rustfs_client.download_file(file_key)
+            if not original:
+                return None
+
+            content, content_type = await self.render_and_save(db, file_key, original, size, output_format)
+        await self._cache_locally(file_key, size, output_format, content)
+        return content, content_type
+
+    async def get_or_create_sprite(
+        self,
+        db: Session,
+        file_keys: List[str],
+        output_format: str = None
+    ) -> Optional[Tuple[bytes, str]]:
+        """
+        获取列表卡片拼图，不存在时从各图片的中等尺寸衍生图合成并持久化
+
+        拼图以组成图片存储键的摘要登记，组成图片变化后摘要随之变化，旧拼图不再被引用
+
+        Args:
+            db: 数据库会话
+            file_keys: 组成图片的原图存储键（按显示顺序，最多 4 张）
+            output_format: 输出格式，默认使用配置值
+
+        Returns:
+            (拼图内容（字节）, Content-Type)，组成图片不存在返回 None
+
+        Raises:
+            ValueError: 如果图片无法处理
+            ImageExecutorBusy: 图片处理进程池繁忙
+            ImageTaskTimeout: 图片处理超时
+        """
+        output_format = output_format or settings.IMAGE_OUTPUT_FORMAT
+        source_key = self.sprite_source_key(self.sprite_digest(file_keys))
+
+        persisted = await self._load_persisted(db, source_key, SPRITE_SIZE, output_format)
+        if persisted:
+            return persisted
+
+        self._release_caller(db)
+        return await self._single_flight(
+            (source_key, SPRITE_SIZE, output_format), self._create_sprite, source_key, list(file_keys), output_format
+        )
+
+    async def _create_sprite(
+        self,
+        source_key: str,
+        file_keys: List[str],
+        output_format: str
+    ) -> Optional[Tuple[bytes, str]]:
+        """
+        合成并持久化拼图（由并发请求共享，使用渲染锁所在连接上的会话）
+
+        源图在获取拼图渲染锁之前准备：源图未命中时的渲染各自签出连接，
+        不与拼图渲染锁的连接同时占用，每个拼图任务同一时间只占用一个连接池连接
+        """
+        sources = await self._load_sprite_sources(file_keys)
+        if sources is None:
+            return None
+
+        async with self._render_session(self.build_key(source_key, SPRITE_SIZE, output_format)) as db:
+            persisted = await self._load_persisted(db, source_key, SPRITE_SIZE, output_format)
+            if persisted:
+                return persisted
+
+            content, content_type = await image_executor.run(
+                compose_sprite, sources, output_format, pixels=sum(get_decode_pixels(source) for source in sources)
+            )
+            try:
+                await self.save(db, source_key, SPRITE_SIZE, output_format, content, content_type)
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"拼图持久化失败: {source_key}, {e}")
+        await self._cache_locally(source_key, SPRITE_SIZE, output_format, content)
+        return content, content_type
+
+    async def _load_sprite_sources(self, file_keys: List[str]) -> Optional[List[bytes]]:
+        """
+        读取拼图的源图：后台预生成的中等尺寸衍生图，不下载原图（未生成时渲染）
+
+        每张源图使用独立的短会话，读取或渲染完成后即归还连接
+
+        Returns:
+            源图内容（按显示顺序），任一源图不存在返回 None
+        """
+        sources = []
+        for file_key in file_keys:
+            db = SessionLocal()
+            try:
+                rendition = await self.get_or_create(db, file_key, SPRITE_SOURCE_SIZE, settings.IMAGE_OUTPUT_FORMAT)
+            finally:
+                db.close()
+            if not rendition:
+                return None
+            sources.append(rendition[0])
+        return sources
+
+    def release_sprite(self, db: Session, digest: str) -> List[str]:
+        """
+        删除不再使用的拼图登记（所有格式和编码版本），返回需要在提交事务后删除的对象
+
+        记录的输出图片变化或删除后，旧摘要的拼图不再被列表引用；登记随调用方的事务删除，
+        调用方提交后通过 blob_store.delete_objects 删除对象和本机磁盘缓存
+
+        Args:
+            db: 数据库会话（调用方负责提交）
+            digest: 旧拼图的摘要
+
+        Returns:
+            拼图的对象存储键
+        """
+        source_key = self.sprite_source_key(digest)
+        rendition_keys = [
+            key for (key,) in db.query(AssetRendition.rendition_key).filter(AssetRendition.file_key == source_key)
+        ]
+        if rendition_keys:
+            db.query(AssetRendition).filter(AssetRendition.file_key == source_key).delete(synchronize_session=False)
+            db.flush()
+        return rendition_keys
+
+    async def _single_flight(self, key: Hashable, factory: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """
+        同一衍生图的并发调用只执行一次 factory，其他调用等待同一结果（包括异常）
+
+        渲染在独立任务中执行：某个请求被取消（如客户端断开）不影响其他等待的请求，
+        已开始的渲染会完成并持久化
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(factory(*args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._on_flight_done(key, done))
+        return await asyncio.shield(task)
+
+    def _on_flight_done(self, key: Hashable, task: asyncio.Task) -> None:
+        """渲染任务结束：移出进行中的任务，并取回无人等待时的异常，避免未处理异常告警"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    @staticmethod
+    def _release_caller(db: Session) -> None:
+        """结束调用方会话的只读事务，等待渲染期间其连接归还连接池（会话有未提交的修改时不处理）"""
+        if not (db.new or db.dirty or db.deleted):
+            db.commit()
+
+    @asynccontextmanager
+    async def _render_session(self, rendition_key: str):
+        """
+        渲染使用的数据库会话及跨进程渲染锁（PostgreSQL 会话级 advisory lock）
+
+        锁和会话共用同一个连接，每个渲染任务只占用一个连接池连接，会话提交不影响会话级锁；
+        签出连接、加锁、轮询和释放在线程中执行，不阻塞事件循环。其他进程持有锁时轮询等待，
+        超过 RENDITION_LOCK_TIMEOUT 或数据库不支持时直接渲染（结果相同，只是重复计算）
+        """
+        conn = await asyncio.to_thread(engine.connect)
+        lock_id = None
+        try:
+            if settings.RENDITION_LOCK_TIMEOUT > 0 and engine.dialect.name == 'postgresql':
+                lock_id = int.from_bytes(hashlib.sha1(rendition_key.encode('utf-8')).digest()[:8], 'big', signed=True)
+                if not await self._acquire_lock(conn, rendition_key, lock_id):
+                    lock_id = None
+            db = SessionLocal(bind=conn)
+            try:
+                yield db
+            finally:
+                db.close()
+        finally:
+            await asyncio.to_thread(self._release_lock, conn, rendition_key, lock_id)
+
+    @staticmethod
+    async def _acquire_lock(conn, rendition_key: str, lock_id: int) -> bool:
+        """在连接上获取渲染锁，超时或失败返回 False"""
+        def try_lock() -> bool:
+            locked = conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": lock_id}).scalar()
+            # 结束查询开启的事务，会话在该连接上自行开启和提交事务
+            conn.commit()
+            return locked
+
+        deadline = time.monotonic() + settings.RENDITION_LOCK_TIMEOUT
+        try:
+            while not await asyncio.to_thread(try_lock):
+                if time.monotonic() >= deadline:
+                    logger.warning(f"等待其他进程渲染超时，直接渲染: {rendition_key}")
+                    return False
+                await asyncio.sleep(RENDER_LOCK_POLL_INTERVAL)
+            return True
+        except Exception as e:
+            logger.warning(f"获取渲染锁失败，直接渲染: {rendition_key}, {e}")
+            await asyncio.to_thread(conn.rollback)
+            return False
+
+    @staticmethod
+    def _release_lock(conn, rendition_key: str, lock_id: Optional[int]) -> None:
+        """释放渲染锁并归还连接（连接异常时服务端随连接断开释放锁）"""
+        try:
+            if lock_id is not None:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": lock_id})
+                conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.warning(f"释放渲染锁失败: {rendition_key}, {e}")
+            conn.invalidate()
+
+    async def _load_persisted(
+        self,
+        db: Session,
+        file_key: str,
+        size: str,
+        output_format: str
+    ) -> Optional[Tuple[bytes, str]]:
+        """读取已持久化的衍生图并写入本机磁盘缓存，未登记或对象已丢失返回 None"""
+        rendition = self.lookup(db, file_key, size, output_format)
+        if not rendition:
+            return None
+        content = await rustfs_client.download_file(rendition.rendition_key)
+        if content:
+            await self._cache_locally(file_key, size, output_format, content)
+            return content, rendition.content_type
+        if rustfs_client.breaker.state != CircuitBreaker.CLOSED:
+            # 存储服务不可用时无法判断对象是否丢失，保留登记
+            return None
+        # 对象已丢失，删除登记后重新渲染
+        logger.warning(f"衍生图对象缺失，重新渲染: {rendition.rendition_key}")
+        db.delete(rendition)
+        db.commit()
+        return None
+
+
+# 全局衍生图存储实例
+rendition_store = RenditionStore()
@@ -0,0 +1,220 @@
+"""
+衍生图后台生成任务
+创建记录时只上传原图并写入元数据，缩略图、中等尺寸等衍生图由后台任务生成，
+每张图片的生成状态记录在 log_assets.rendition_status 中；
+启动时及每隔 RENDITION_STALE_SECONDS 重新入队 pending 和认领已超时的资源（包括其他进程退出时中断的任务）
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import or_, and_
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.log_asset import LogAsset
+from app.services.image_executor import image_executor, ImageExecutorBusy
+from app.services.rendition_store import rendition_store
+from app.services.rustfs_client import rustfs_client
+from app.services.similarity_index import similarity_index
+from app.utils.image_processor import LQIP_SIZE, RENDITION_SIZES, compute_phash, get_decode_pixels, get_image_info, to_data_uri
+
+logger = logging.getLogger(__name__)
+
+# 衍生图生成状态
+STATUS_PENDING = 'pending'        # 已入队，等待生成
+STATUS_PROCESSING = 'processing'  # 生成中
+STATUS_READY = 'ready'            # 所有尺寸已生成
+STATUS_FAILED = 'failed'          # 生成失败（访问时仍会按需渲染）
+
+
+class RenditionWorker:
+    """衍生图后台生成任务"""
+
+    def __init__(self, concurrency: int = None):
+        self.concurrency = settings.RENDITION_WORKER_CONCURRENCY if concurrency is None else concurrency
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: Set[int] = set()  # 已入队未取出的资源，定期恢复时不重复入队
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """启动后台任务，并定期恢复未完成的任务（包括上次退出时中断的任务）"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        for i in range(max(self.concurrency, 1)):
+            self._tasks.append(asyncio.create_task(self._run(), name=f"rendition-worker-{i}"))
+        self._tasks.append(asyncio.create_task(self._sweep(), name="rendition-sweep"))
+        logger.info(f"衍生图后台任务已启动: concurrency={self.concurrency}")
+
+    async def stop(self) -> None:
+        """停止后台任务（未完成的任务保持 pending 状态，下次启动时恢复）"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._queued.clear()
+
+    def enqueue(self, asset_ids: Iterable[int]) -> None:
+        """将资源加入衍生图生成队列（需在资源记录提交后调用）"""
+        if self._queue is None:
+            # 后台任务未启动（如脚本环境），衍生图将在访问时按需生成
+            return
+        for asset_id in asset_ids:
+            if asset_id not in self._queued:
+                self._queued.add(asset_id)
+                self._queue.put_nowait(asset_id)
+
+    @staticmethod
+    def _claimable():
+        """可认领的资源条件：pending，或进程退出时中断（认领后超时仍为 processing）的任务"""
+        stale_before = datetime.now() - timedelta(seconds=settings.RENDITION_STALE_SECONDS)
+        return or_(
+            LogAsset.rendition_status == STATUS_PENDING,
+            and_(
+                LogAsset.rendition_status == STATUS_PROCESSING,
+                or_(LogAsset.rendition_claimed_at.is_(None), LogAsset.rendition_claimed_at < stale_before)
+            )
+        )
+
+    async def _sweep(self) -> None:
+        """
+        定期恢复任务主循环（启动时立即执行一次）
+
+        认领后进程退出的任务在认领超时前不能被重新认领，进程快速重启时启动恢复会跳过它们，
+        因此每隔 RENDITION_STALE_SECONDS 重新查询一次；查询在线程中执行，不阻塞事件循环
+        """
+        while True:
+            self.enqueue(await asyncio.to_thread(self._recover_pending))
+            await asyncio.sleep(max(settings.RENDITION_STALE_SECONDS, 1))
+
+    def _recover_pending(self) -> List[int]:
+        """查询等待生成的资源（包括进程退出时中断的任务）"""
+        db = SessionLocal()
+        try:
+            rows = db.query(LogAsset.id).filter(self._claimable()).order_by(LogAsset.id).all()
+            if rows:
+                logger.info(f"恢复待生成衍生图的资源: {len(rows)} 个")
+            return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f"恢复衍生图任务失败: {e}")
+            return []
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        """后台任务主循环"""
+        while True:
+            asset_id = await self._queue.get()
+            self._queued.discard(asset_id)
+            try:
+                await self.process(asset_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"生成衍生图异常: asset_id={asset_id}, {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def process(self, asset_id: int) -> None:
+        """为单个资源生成所有尺寸的衍生图"""
+        db = SessionLocal()
+        try:
+            # 认领任务：只有状态仍可认领时才处理，避免多个进程重复生成
+            claimed = db.query(LogAsset).filter(
+                LogAsset.id == asset_id,
+                self._claimable()
+            ).update(
+                {LogAsset.rendition_status: STATUS_PROCESSING, LogAsset.rendition_claimed_at: datetime.now()},
+                synchronize_session=False
+            )
+            db.commit()
+            if not claimed:
+                return
+
+            asset = db.query(LogAsset).filter(LogAsset.id == asset_id).first()
+            original = await rustfs_client.download_file(asset.file_key)
+            if not original:
+                self._set_status(db, asset, STATUS_FAILED)
+                return
+
+            # 旧数据补充宽高等元数据（只读取图片头部）
+            if asset.width is None:
+                self._fill_metadata(asset, original)
+            
+            # 感知哈希（用于查找近似重复图片）
+            if asset.phash is None:
+                asset.phash = await self._compute_phash(original)
+            
+            need_lqip = asset.lqip is None
+            for output_format in settings.RENDITION_PREGENERATE_FORMATS:
+                # 一次解码生成该格式下所有缺失的尺寸（占位图随第一个格式一起生成）
+                missing_sizes = [
+                    size for size in RENDITION_SIZES
+                    if not rendition_store.lookup(db, asset.file_key, size, output_format)
+                ]
+                if need_lqip:
+                    missing_sizes.append(LQIP_SIZE)
+                while missing_sizes:
+                    try:
+                        results = await rendition_store.render_all_and_save(db, asset.file_key, original, missing_sizes, output_format)
+                        break
+                    except ImageExecutorBusy:
+                        # 进程池繁忙时让出给在线请求，稍后重试
+                        await asyncio.sleep(1)
+                if need_lqip:
+                    asset.lqip = to_data_uri(*results[LQIP_SIZE])
+                    need_lqip = False
+
+            self._set_status(db, asset, STATUS_READY)
+            if asset.asset_type == 'output':
+                similarity_index.add(asset.id, asset.phash)
+            logger.info(f"衍生图生成完成: asset_id={asset_id}, file_key={asset.file_key}")
+        except asyncio.CancelledError:
+            # 停止时恢复为 pending，下次启动时继续
+            db.rollback()
+            db.query(LogAsset).filter(LogAsset.id == asset_id).update(
+                {LogAsset.rendition_status: STATUS_PENDING}, synchronize_session=False
+            )
+            db.commit()
+            raise
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"生成衍生图失败: asset_id={asset_id}, {e}")
+            db.query(LogAsset).filter(LogAsset.id == asset_id).update(
+                {LogAsset.rendition_status: STATUS_FAILED}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    async def _compute_phash(original: bytes) -> int:
+        """在图片处理进程池中计算感知哈希（进程池繁忙时让出给在线请求，稍后重试）"""
+        while True:
+            try:
+                return await image_executor.run(compute_phash, original, pixels=get_decode_pixels(original))
+            except ImageExecutorBusy:
+                await asyncio.sleep(1)
+
+    @staticmethod
+    def _fill_metadata(asset: LogAsset, original: bytes) -> None:
+        """补充资源的宽高、大小和格式（随状态一起提交）"""
+        info = get_image_info(original)
+        asset.width = info['width'] or None
+        asset.height = info['height'] or None
+        asset.byte_size = len(original)
+        if info['format'] and info['format'] != 'unknown':
+            asset.format = info['format'].lower()
+
+    @staticmethod
+    def _set_status(db, asset: LogAsset, status: str) -> None:
+        """更新资源的衍生图生成状态"""
+        asset.rendition_status = status
+        db.commit()
+
+
+# 全局衍生图后台任务实例
+rendition_worker = RenditionWorker()
@@ -2,17 +2,196 @@
 RustFS/S3 客户端封装
 用于与 S3 兼容的对象存储服务交互（上传、下载、删除文件）
 
-支持 MinIO 和其他 S3 兼容的对象存储
+支持 MinIO 和其他 S3 兼容的对象存储；
+服务运行期间所有请求共享一个长期存在的客户端（连接池复用 TCP 连接），未启动时（如脚本）每次操作使用临时客户端。
+每次操作有超时，幂等操作失败后按带抖动的指数退避重试；连续失败时熔断，存储服务不可用期间直接失败，不再等待超时
 """
 import aioboto3
+import asyncio
+import io
 import logging
 import base64
-from typing import Optional
+import random
+import time
+from collections import OrderedDict
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable, Iterable, List, Optional, Dict, Tuple
 from datetime import datetime, timedelta
+from aiobotocore.config import AioConfig
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# S3 分片上传限制：除最后一片外每片至少 5MB，最多 10000 片
+MULTIPART_MIN_PART_SIZE = 5 * 1024 * 1024
+MULTIPART_MAX_PARTS = 10000
+
+# 重试的初始退避时间（秒），每次重试翻倍，实际等待时间在 [0, 退避时间] 内随机（避免多个请求同时重试）
+RETRY_BACKOFF = 0.2
+MULTIPART_RETRY_BACKOFF = 0.5
+RETRY_BACKOFF_MAX = 5.0
+
+# 批量删除每次请求的最大键数（S3 DeleteObjects 限制）
+DELETE_BATCH_SIZE = 1000
+
+# 预签名 GET URL 缓存的最大条目数，以及剩余有效期低于该比例时重新签名
+PRESIGN_CACHE_MAX_ENTRIES = 10000
+PRESIGN_REFRESH_RATIO = 0.2
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BACKOFF) -> float:
+    """第 attempt 次重试前的等待时间（full jitter 指数退避）"""
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, base * (2 ** attempt)))
+
+
+def _is_client_error(error: Exception) -> bool:
+    """存储服务正常拒绝的请求（对象不存在、无权限、范围无效等 4xx），不是服务故障，不重试也不计入熔断"""
+    response = getattr(error, 'response', None)
+    if not isinstance(response, dict):
+        return False
+    status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+class StorageUnavailable(Exception):
+    """熔断器打开，存储服务暂不可用（不发起请求，直接失败）"""
+    
+    def __init__(self, retry_after: float):
+        super().__init__(f"存储服务暂不可用，{retry_after:.0f}s 后重试")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    熔断器
+    连续失败达到阈值后打开，打开期间请求直接失败；冷却时间过后进入半开状态，只放行一个探测请求，
+    成功则关闭，失败则重新打开。状态只在本进程内有效
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold  # 0 表示不熔断
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0            # 连续失败次数
+        self._opened_at = 0.0
+        self._probe_started = None    # 半开状态下探测请求的开始时间
+        self.open_count = 0           # 累计打开次数
+    
+    @property
+    def state(self) -> str:
+        """当前状态（打开超过冷却时间后视为半开）"""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+    
+    def retry_after(self) -> float:
+        """距离放行探测请求的秒数"""
+        if self._state != self.OPEN:
+            return 0.0
+        return max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.0)
+    
+    def allow(self) -> bool:
+        """是否放行请求（半开状态下同时只放行一个探测请求，探测请求被取消时冷却时间后再放行下一个）"""
+        state = self.state
+        if self.failure_threshold <= 0 or state == self.CLOSED:
+            return True
+        if state == self.OPEN:
+            return False
+        now = time.monotonic()
+        if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+            return False
+        self._state = self.HALF_OPEN
+        self._probe_started = now
+        return True
+    
+    def record_success(self) -> None:
+        """请求成功（存储服务有响应），关闭熔断器"""
+        self._failures = 0
+        self._probe_started = None
+        if self._state != self.CLOSED:
+            self._state = self.CLOSED
+            logger.info("存储服务已恢复，熔断器关闭")
+    
+    def record_failure(self) -> None:
+        """请求失败（超时、连接错误、5xx），连续失败达到阈值或探测失败时打开熔断器"""
+        self._failures += 1
+        self._probe_started = None
+        if self.failure_threshold <= 0:
+            return
+        if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self._failures >= self.failure_threshold):
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+            self.open_count += 1
+            logger.error(f"存储服务连续失败 {self._failures} 次，熔断器打开，{self.reset_timeout:.0f}s 后探测")
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """状态快照（用于健康检查）"""
+        return {
+            'state': self.state,
+            'consecutive_failures': self._failures,
+            'retry_after': round(self.retry_after(), 1),
+            'open_count': self.open_count,
+        }
+
+
+class RangeNotSatisfiable(Exception):
+    """请求的字节范围超出对象大小"""
+    
+    def __init__(self, object_size: Optional[int]):
+        super().__init__(f"请求范围无效，对象大小: {object_size}")
+        self.object_size = object_size
+
+
+class ObjectStream:
+    """
+    对象下载流
+    持有 S3 客户端上下文和响应体，按块读取；每次只读取一块，下游发送完成后才读取下一块，
+    内存占用以块大小为上限
+    """
+    
+    def __init__(
+        self,
+        client_context,
+        body,
+        content_length: Optional[int],
+        content_type: Optional[str],
+        chunk_size: int,
+        content_range: Optional[str] = None
+    ):
+        self._client_context = client_context
+        self._body = body
+        self.content_length = content_length  # 本次返回的字节数（范围请求时为区间长度）
+        self.content_type = content_type
+        self.chunk_size = chunk_size
+        self.content_range = content_range  # 范围请求时的 Content-Range，如 "bytes 0-99/1000"
+        self._closed = False
+    
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        """按块读取对象内容，读取结束或中断时释放连接"""
+        try:
+            while True:
+                chunk = await self._body.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            await self.close()
+    
+    async def close(self) -> None:
+        """释放响应体和连接（可重复调用）"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._body.close()
+        finally:
+            await self._client_context.__aexit__(None, None, None)
+
+
 class RustFSClient:
     """RustFS/S3 客户端（使用 S3 兼容接口）"""
     
@@ -36,7 +215,152 @@ class RustFSClient:
             'region_name': self.region,
             'use_ssl': self.use_ssl,
             'verify': False,  # MinIO 通常使用自签名证书，设为 False
+            'config': AioConfig(
+                max_pool_connections=settings.RUSTFS_MAX_POOL_CONNECTIONS,
+                connect_timeout=settings.RUSTFS_CONNECT_TIMEOUT,
+                read_timeout=settings.RUSTFS_READ_TIMEOUT,
+                tcp_keepalive=True,
+                connector_args={'keepalive_timeout': settings.RUSTFS_KEEPALIVE_TIMEOUT}
+            ),
         }
+        
+        # 共享客户端（start 后创建，close 时关闭）
+        self._exit_stack: Optional[AsyncExitStack] = None
+        self._client = None
+        
+        # 熔断器（所有操作共享）和对冲读取次数
+        self.breaker = CircuitBreaker(settings.RUSTFS_BREAKER_FAILURES, settings.RUSTFS_BREAKER_RESET_SECONDS)
+        self.hedged_reads = 0
+        
+        # 预签名客户端（首次使用时创建）
+        self._presigner = None
+        # 预签名 GET URL 缓存：(存储键, 有效期, Content-Type) -> (URL, 可复用截止时间)，按最近使用淘汰
+        self._presigned: "OrderedDict[Tuple[str, int, Optional[str]], Tuple[str, float]]" = OrderedDict()
+    
+    async def start(self) -> None:
+        """创建共享客户端（应用启动时调用，之后所有操作复用同一个连接池）"""
+        if self._client is not None:
+            return
+        exit_stack = AsyncExitStack()
+        self._client = await exit_stack.enter_async_context(self.session.client(**self.s3_config))
+        self._exit_stack = exit_stack
+        logger.info(f"S3 客户端已创建: {self.endpoint_url}, max_pool_connections={settings.RUSTFS_MAX_POOL_CONNECTIONS}")
+    
+    async def close(self) -> None:
+        """关闭共享客户端及其连接池（应用关闭时调用）"""
+        if self._exit_stack is None:
+            return
+        exit_stack, self._exit_stack, self._client = self._exit_stack, None, None
+        await exit_stack.aclose()
+        logger.info("S3 客户端已关闭")
+    
+    @asynccontextmanager
+    async def _s3(self):
+        """获取 S3 客户端：已启动时使用共享客户端，否则创建临时客户端（退出时关闭）"""
+        if self._client is not None:
+            yield self._client
+            return
+        async with self.session.client(**self.s3_config) as s3:
+            yield s3
+    
+    async def _call(
+        self,
+        operation: str,
+        func: Callable[[Any], Awaitable[Any]],
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        s3=None,
+        backoff: float = RETRY_BACKOFF
+    ) -> Any:
+        """
+        执行一次 S3 操作：熔断检查、单次尝试超时，失败后按带抖动的指数退避重试
+        
+        Args:
+            operation: 操作名（用于日志）
+            func: 接收 S3 客户端并发起请求的协程函数（重试时重新调用，必须幂等）
+            timeout: 单次尝试的超时（秒），默认 RUSTFS_OPERATION_TIMEOUT，0 表示不限制
+            retries: 最大重试次数，默认 RUSTFS_RETRIES；非幂等操作传 0
+            s3: 使用指定的 S3 客户端（默认使用共享客户端或临时客户端）
+            backoff: 初始退避时间（秒）
+            
+        Raises:
+            StorageUnavailable: 熔断器打开
+            asyncio.TimeoutError: 超时（重试后仍超时）
+            ClientError: 请求失败；对象不存在等 4xx 错误不重试
+        """
+        timeout = settings.RUSTFS_OPERATION_TIMEOUT if timeout is None else timeout
+        retries = settings.RUSTFS_RETRIES if retries is None else retries
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise StorageUnavailable(self.breaker.retry_after())
+            try:
+                if s3 is not None:
+                    result = await asyncio.wait_for(func(s3), timeout or None)
+                else:
+                    async with self._s3() as client:
+                        result = await asyncio.wait_for(func(client), timeout or None)
+            except Exception as e:
+                if _is_client_error(e):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= retries:
+                    raise
+                delay = backoff_delay(attempt, backoff)
+                logger.warning(f"{operation}失败，{delay:.2f}s 后重试（第 {attempt + 1} 次）: {type(e).__name__}: {e}")
+                await asyncio.sleep(delay)
+                attempt += 1
+            else:
+                self.breaker.record_success()
+                return result
+    
+    async def _hedged(
+        self,
+        factory: Callable[[], Awaitable[Any]],
+        discard: Optional[Callable[[Any], None]] = None
+    ) -> Any:
+        """
+        对冲读取：请求超过 RUSTFS_HEDGE_DELAY_MS 仍未返回时再发起一个相同的请求，使用先成功的结果并取消另一个
+        
+        熔断器未关闭时不对冲，避免给不健康的存储增加负载
+        
+        Args:
+            factory: 发起一次请求的协程函数
+            discard: 释放未被使用的结果（如关闭响应体）
+        """
+        delay = settings.RUSTFS_HEDGE_DELAY_MS / 1000
+        if delay <= 0 or self.breaker.state != CircuitBreaker.CLOSED:
+            return await factory()
+        
+        def release(task: asyncio.Task) -> None:
+            # 未被使用的请求：读取异常避免告警，成功的结果交给 discard 释放
+            if task.cancelled() or task.exception() is not None:
+                return
+            if discard:
+                discard(task.result())
+        
+        tasks = [asyncio.ensure_future(factory())]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedged_reads += 1
+                tasks.append(asyncio.ensure_future(factory()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        return task.result()
+            # 全部失败：抛出首个请求的异常
+            raise tasks[0].exception()
+        finally:
+            for task in tasks:
+                if task is not winner:
+                    task.cancel()
+                    task.add_done_callback(release)
     
     def _generate_file_key(self, filename: str) -> str:
         """
@@ -84,41 +408,321 @@ class RustFSClient:
         Returns:
             file_key: 文件在存储中的键（路径），失败返回 None
         """
-        try:
-            # 生成存储键
-            file_key = self._generate_file_key(filename)
-            
-            # 确定内容类型
+        # 生成存储键
+        file_key = self._generate_file_key(filename)
+        
+        # 确定内容类型
+        if not content_type:
+            import mimetypes
+            content_type, _ = mimetypes.guess_type(filename)
             if not content_type:
-                import mimetypes
-                content_type, _ = mimetypes.guess_type(filename)
-                if not content_type:
-                    content_type = 'application/octet-stream'
+                content_type = 'application/octet-stream'
+        
+        # S3 metadata 只支持 ASCII 字符，需要对中文文件名进行编码
+        # 使用 base64 编码，保留原始文件名的完整信息
+        encoded_filename = base64.b64encode(filename.encode('utf-8')).decode('ascii')
+        
+        success = await self.put_file(
+            file_key,
+            file_content,
+            content_type,
+            metadata={
+                'original-filename-encoded': encoded_filename,
+                'upload-time': datetime.now().isoformat()
+            }
+        )
+        if not success:
+            return None
+        
+        logger.info(f"文件上传成功: {filename} -> {file_key}")
+        return file_key
+    
+    async def put_file(
+        self,
+        file_key: str,
+        file_content: bytes,
+        content_type: str,
+        metadata: Optional[Dict[str, str]] = None
+    ) -> bool:
+        """
+        以指定的存储键写入文件（用于衍生图等由调用方决定路径的对象）
+        
+        Args:
+            file_key: 存储键
+            file_content: 文件内容（字节）
+            content_type: MIME 类型
+            metadata: 自定义元数据（仅支持 ASCII）
             
-            async with self.session.client(**self.s3_config) as s3:
-                # S3 metadata 只支持 ASCII 字符，需要对中文文件名进行编码
-                # 使用 base64 编码，保留原始文件名的完整信息
-                encoded_filename = base64.b64encode(filename.encode('utf-8')).decode('ascii')
-                
-                # 上传文件
-                await s3.put_object(
+        Returns:
+            成功返回 True，失败返回 False
+        """
+        if 0 < settings.RUSTFS_MULTIPART_THRESHOLD < len(file_content):
+            return await self.put_fileobj(file_key, io.BytesIO(file_content), len(file_content), content_type, metadata)
+        return await self._put_object(file_key, file_content, content_type, metadata)
+    
+    async def _put_object(
+        self,
+        file_key: str,
+        file_content: bytes,
+        content_type: str,
+        metadata: Optional[Dict[str, str]] = None
+    ) -> bool:
+        """单次请求写入文件（同一存储键重复写入相同内容是幂等的，失败时重试）"""
+        try:
+            await self._call(
+                '上传文件',
+                lambda s3: s3.put_object(
                     Bucket=self.bucket,
                     Key=file_key,
                     Body=file_content,
                     ContentType=content_type,
-                    Metadata={
-                        'original-filename-encoded': encoded_filename,
-                        'upload-time': datetime.now().isoformat()
-                    }
+                    Metadata=metadata or {}
+                ),
+                timeout=settings.RUSTFS_TRANSFER_TIMEOUT
+            )
+            return True
+        except Exception as e:
+            logger.error(f"上传文件异常: {file_key}, {e}", exc_info=True)
+            return False
+    
+    async def put_fileobj(
+        self,
+        file_key: str,
+        fileobj: BinaryIO,
+        size: int,
+        content_type: str,
+        metadata: Optional[Dict[str, str]] = None
+    ) -> bool:
+        """
+        从可定位的文件对象写入文件（如 SpooledTemporaryFile，不需要把整个文件读入内存）
+        
+        超过 RUSTFS_MULTIPART_THRESHOLD 时使用分片上传：分片并发上传，单个分片失败时重试，
+        最终失败时中止分片上传，不留下未完成的分片
+        
+        Args:
+            file_key: 存储键
+            fileobj: 文件对象（需支持 seek/read，上传期间调用方不能读写）
+            size: 文件大小（字节）
+            content_type: MIME 类型
+            metadata: 自定义元数据（仅支持 ASCII）
+            
+        Returns:
+            成功返回 True，失败返回 False
+        """
+        threshold = settings.RUSTFS_MULTIPART_THRESHOLD
+        if threshold <= 0 or size <= threshold:
+            fileobj.seek(0)
+            return await self._put_object(file_key, await asyncio.to_thread(fileobj.read), content_type, metadata)
+        
+        part_size = max(settings.RUSTFS_MULTIPART_PART_SIZE, MULTIPART_MIN_PART_SIZE, -(-size // MULTIPART_MAX_PARTS))
+        part_count = -(-size // part_size)
+        semaphore = asyncio.Semaphore(max(settings.RUSTFS_MULTIPART_CONCURRENCY, 1))
+        read_lock = asyncio.Lock()
+        
+        def read_at(offset: int) -> bytes:
+            fileobj.seek(offset)
+            return fileobj.read(part_size)
+        
+        async def upload_part(s3, upload_id: str, part_number: int) -> Dict:
+            # 同时读取的分片数受并发数限制，内存占用不超过 并发数 x 分片大小
+            async with semaphore:
+                async with read_lock:
+                    body = await asyncio.to_thread(read_at, (part_number - 1) * part_size)
+                response = await self._call(
+                    f"上传分片 {file_key} 第 {part_number} 片",
+                    lambda s3: s3.upload_part(
+                        Bucket=self.bucket,
+                        Key=file_key,
+                        UploadId=upload_id,
+                        PartNumber=part_number,
+                        Body=body
+                    ),
+                    timeout=settings.RUSTFS_TRANSFER_TIMEOUT,
+                    retries=settings.RUSTFS_MULTIPART_RETRIES,
+                    s3=s3,
+                    backoff=MULTIPART_RETRY_BACKOFF
+                )
+                return {'PartNumber': part_number, 'ETag': response['ETag']}
+        
+        try:
+            async with self._s3() as s3:
+                upload = await self._call(
+                    '创建分片上传',
+                    lambda s3: s3.create_multipart_upload(
+                        Bucket=self.bucket,
+                        Key=file_key,
+                        ContentType=content_type,
+                        Metadata=metadata or {}
+                    ),
+                    retries=0,
+                    s3=s3
                 )
-                
-                logger.info(f"文件上传成功: {filename} -> {file_key}")
-                return file_key
-                        
+                upload_id = upload['UploadId']
+                tasks = [asyncio.create_task(upload_part(s3, upload_id, n)) for n in range(1, part_count + 1)]
+                try:
+                    parts = await asyncio.gather(*tasks)
+                    await self._call(
+                        '完成分片上传',
+                        lambda s3: s3.complete_multipart_upload(
+                            Bucket=self.bucket,
+                            Key=file_key,
+                            UploadId=upload_id,
+                            MultipartUpload={'Parts': parts}
+                        ),
+                        retries=0,
+                        s3=s3
+                    )
+                except BaseException:
+                    # 停止其余分片后中止上传，释放已上传分片占用的存储
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    await asyncio.shield(self._abort_multipart(s3, file_key, upload_id))
+                    raise
+            logger.info(f"分片上传完成: {file_key}, {size} bytes, {part_count} 片")
+            return True
         except Exception as e:
-            logger.error(f"上传文件异常: {e}", exc_info=True)
+            logger.error(f"分片上传失败: {file_key}, {e}", exc_info=True)
+            return False
+    
+    def _get_presigner(self):
+        """
+        预签名客户端（只在本地计算签名，不发起网络请求，创建一次后复用）
+        
+        使用浏览器可访问的 RUSTFS_PUBLIC_ENDPOINT_URL 签名：签名包含主机名，必须与浏览器请求的地址一致
+        """
+        if self._presigner is None:
+            import boto3
+            from botocore.config import Config
+            self._presigner = boto3.client(
+                's3',
+                endpoint_url=settings.RUSTFS_PUBLIC_ENDPOINT_URL,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+                region_name=self.region,
+                use_ssl=settings.RUSTFS_PUBLIC_ENDPOINT_URL.startswith('https://'),
+                verify=False,
+                config=Config(signature_version='s3v4', s3={'addressing_style': 'path'})
+            )
+        return self._presigner
+    
+    def presign_post(self, file_key: str, content_type: str, max_size: int, expires_in: int) -> Dict:
+        """
+        生成浏览器直传的预签名 POST 表单（存储服务按策略限制 Content-Type 和文件大小）
+        
+        Returns:
+            {'url': 表单提交地址, 'fields': 需要随文件一起提交的表单字段}
+        """
+        return self._get_presigner().generate_presigned_post(
+            Bucket=self.bucket,
+            Key=file_key,
+            Fields={'Content-Type': content_type},
+            Conditions=[{'Content-Type': content_type}, ['content-length-range', 1, max_size]],
+            ExpiresIn=expires_in
+        )
+    
+    def presign_upload_part(self, file_key: str, upload_id: str, part_number: int, expires_in: int) -> str:
+        """生成分片上传中单个分片的预签名 PUT URL"""
+        return self._get_presigner().generate_presigned_url(
+            'upload_part',
+            Params={'Bucket': self.bucket, 'Key': file_key, 'UploadId': upload_id, 'PartNumber': part_number},
+            ExpiresIn=expires_in
+        )
+    
+    def presign_get(self, file_key: str, expires_in: int, content_type: Optional[str] = None) -> Tuple[str, int]:
+        """
+        生成对象的预签名 GET URL（只在本地计算签名，不访问对象存储）
+        
+        同一对象的 URL 在剩余有效期低于 PRESIGN_REFRESH_RATIO 之前重复使用，
+        浏览器按 URL 缓存的内容不会因为重新签名而失效
+        
+        Args:
+            file_key: 存储键
+            expires_in: URL 有效期（秒）
+            content_type: 覆盖响应的 Content-Type（可选）
+            
+        Returns:
+            (预签名 URL, 还可以继续分发该 URL 的秒数)
+        """
+        cache_key = (file_key, expires_in, content_type)
+        now = time.monotonic()
+        cached = self._presigned.get(cache_key)
+        if cached and cached[1] > now:
+            self._presigned.move_to_end(cache_key)
+            return cached[0], int(cached[1] - now)
+        
+        params = {'Bucket': self.bucket, 'Key': file_key}
+        if content_type:
+            params['ResponseContentType'] = content_type
+        url = self._get_presigner().generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+        reuse_until = now + expires_in * (1 - PRESIGN_REFRESH_RATIO)
+        self._presigned[cache_key] = (url, reuse_until)
+        self._presigned.move_to_end(cache_key)
+        while len(self._presigned) > PRESIGN_CACHE_MAX_ENTRIES:
+            self._presigned.popitem(last=False)
+        return url, int(reuse_until - now)
+    
+    async def create_multipart_upload(self, file_key: str, content_type: str) -> Optional[str]:
+        """
+        创建分片上传（分片由浏览器通过预签名 URL 上传）
+        
+        Returns:
+            UploadId，失败返回 None
+        """
+        try:
+            response = await self._call(
+                '创建分片上传',
+                lambda s3: s3.create_multipart_upload(Bucket=self.bucket, Key=file_key, ContentType=content_type),
+                retries=0
+            )
+            return response['UploadId']
+        except Exception as e:
+            logger.error(f"创建分片上传异常: {file_key}, {e}")
             return None
     
+    async def complete_multipart_upload(self, file_key: str, upload_id: str, parts: List[Dict]) -> bool:
+        """
+        完成分片上传
+        
+        Args:
+            file_key: 存储键
+            upload_id: 分片上传 ID
+            parts: [{'PartNumber': 分片号, 'ETag': 分片 ETag}]，按分片号排列
+            
+        Returns:
+            成功返回 True，失败返回 False
+        """
+        try:
+            await self._call(
+                '完成分片上传',
+                lambda s3: s3.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=file_key,
+                    UploadId=upload_id,
+                    MultipartUpload={'Parts': parts}
+                ),
+                retries=0
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"完成分片上传失败: {file_key}, {e}")
+            return False
+    
+    async def abort_multipart_upload(self, file_key: str, upload_id: str) -> None:
+        """中止分片上传，释放已上传分片占用的存储"""
+        await self._abort_multipart(None, file_key, upload_id)
+    
+    async def _abort_multipart(self, s3, file_key: str, upload_id: str) -> None:
+        """中止分片上传（失败只记录日志，未完成的分片由存储的生命周期规则清理）"""
+        try:
+            await self._call(
+                '中止分片上传',
+                lambda s3: s3.abort_multipart_upload(Bucket=self.bucket, Key=file_key, UploadId=upload_id),
+                s3=s3
+            )
+        except Exception as e:
+            logger.warning(f"中止分片上传失败: {file_key}, upload_id={upload_id}, {e}")
+    
     async def get_file_url(self, file_key: str, expires_in: int = 3600) -> str:
         """
         获取文件的访问 URL（预签名 URL）
@@ -130,44 +734,16 @@ class RustFSClient:
         Returns:
             文件的预签名访问 URL
             
-        注意：S3 兼容存储通常使用预签名 URL 来访问私有文件
+        注意：S3 兼容存储通常使用预签名 URL 来访问私有文件；签名客户端只创建一次，URL 缓存到临近过期
         """
         try:
-            import asyncio
-            import boto3
-            from botocore.config import Config
-            
-            # 使用同步 boto3 客户端生成预签名 URL（这个操作很快，不需要异步）
-            # 在事件循环中运行同步方法
-            def _generate_url():
-                s3_client = boto3.client(
-                    's3',
-                    endpoint_url=self.endpoint_url,
-                    aws_access_key_id=self.access_key,
-                    aws_secret_access_key=self.secret_key,
-                    region_name=self.region,
-                    use_ssl=self.use_ssl,
-                    verify=False,
-                    config=Config(signature_version='s3v4')
-                )
-                return s3_client.generate_presigned_url(
-                    'get_object',
-                    Params={
-                        'Bucket': self.bucket,
-                        'Key': file_key
-                    },
-                    ExpiresIn=expires_in
-                )
-            
-            loop = asyncio.get_event_loop()
-            url = await loop.run_in_executor(None, _generate_url)
+            url, _ = self.presign_get(file_key, expires_in)
             logger.debug(f"生成预签名 URL 成功: {file_key[:50]}...")
             return url
         except Exception as e:
             logger.warning(f"生成预签名 URL 异常: {e}，使用公开 URL")
             # 如果生成预签名 URL 失败，返回直接访问 URL（如果存储桶是公开的）
-            fallback_url = f"{self.endpoint_url.rstrip('/')}/{self.bucket}/{file_key}"
-            return fallback_url
+            return self.get_public_url(file_key)
     
     def get_public_url(self, file_key: str) -> str:
         """
@@ -181,30 +757,41 @@ class RustFSClient:
         """
         return f"{self.endpoint_url.rstrip('/')}/{self.bucket}/{file_key}"
     
-    async def download_file(self, file_key: str) -> Optional[bytes]:
+    async def download_file(self, file_key: str, byte_range: Optional[str] = None) -> Optional[bytes]:
         """
         从 S3 存储下载文件
         
         Args:
             file_key: 文件标识符
+            byte_range: HTTP Range 值（如 "bytes=0-99"），只下载该区间
             
         Returns:
             文件内容（字节），失败返回 None
+            
+        读取超过 RUSTFS_HEDGE_DELAY_MS 未完成时发起对冲请求
         """
+        params = {'Bucket': self.bucket, 'Key': file_key}
+        if byte_range:
+            params['Range'] = byte_range
+        
+        async def get_object(s3) -> bytes:
+            response = await s3.get_object(**params)
+            # 读取文件内容
+            async with response['Body'] as stream:
+                return await stream.read()
+        
         try:
-            async with self.session.client(**self.s3_config) as s3:
-                response = await s3.get_object(
-                    Bucket=self.bucket,
-                    Key=file_key
-                )
-                
-                # 读取文件内容
-                async with response['Body'] as stream:
-                    content = await stream.read()
-                    
-                logger.info(f"文件下载成功: {file_key}")
-                return content
-                
+            content = await self._hedged(
+                lambda: self._call('下载文件', get_object, timeout=settings.RUSTFS_TRANSFER_TIMEOUT)
+            )
+            logger.info(f"文件下载成功: {file_key}")
+            return content
+        except StorageUnavailable as e:
+            logger.warning(f"下载文件失败: {file_key}, {e}")
+            return None
+        except asyncio.TimeoutError:
+            logger.error(f"下载文件超时: {file_key}")
+            return None
         except Exception as e:
             error_code = getattr(e, 'response', {}).get('Error', {}).get('Code', '')
             if error_code == 'NoSuchKey' or 'NoSuchKey' in str(e):
@@ -213,6 +800,118 @@ class RustFSClient:
                 logger.error(f"下载文件异常: {e}", exc_info=True)
             return None
     
+    async def open_stream(
+        self,
+        file_key: str,
+        chunk_size: int = None,
+        byte_range: Optional[str] = None
+    ) -> Optional[ObjectStream]:
+        """
+        打开对象下载流（不把整个文件读入内存）
+        
+        Args:
+            file_key: 文件标识符
+            chunk_size: 每次读取的字节数，默认使用配置值
+            byte_range: HTTP Range 值（如 "bytes=0-99"），只读取该区间
+            
+        Returns:
+            下载流（调用方需迭代完 iter_chunks() 或调用 close()），失败返回 None
+            
+        Raises:
+            RangeNotSatisfiable: 请求的字节范围超出对象大小
+            StorageUnavailable: 熔断器打开，存储服务暂不可用
+        
+        超时和对冲只作用于收到响应头之前，之后的读取受 RUSTFS_READ_TIMEOUT 限制
+        """
+        params = {'Bucket': self.bucket, 'Key': file_key}
+        if byte_range:
+            params['Range'] = byte_range
+        
+        client_context = self._s3()
+        s3 = await client_context.__aenter__()
+        try:
+            response = await self._hedged(
+                lambda: self._call('打开下载流', lambda s3: s3.get_object(**params), s3=s3),
+                discard=lambda response: response['Body'].close()
+            )
+        except StorageUnavailable:
+            await client_context.__aexit__(None, None, None)
+            raise
+        except asyncio.TimeoutError:
+            await client_context.__aexit__(None, None, None)
+            logger.error(f"打开下载流超时: {file_key}")
+            return None
+        except Exception as e:
+            await client_context.__aexit__(None, None, None)
+            error_code = getattr(e, 'response', {}).get('Error', {}).get('Code', '')
+            if error_code == 'InvalidRange':
+                info = await self.get_object_info(file_key)
+                raise RangeNotSatisfiable(info['content_length'] if info else None)
+            if error_code == 'NoSuchKey' or 'NoSuchKey' in str(e):
+                logger.error(f"文件不存在: {file_key}")
+            else:
+                logger.error(f"打开下载流异常: {e}", exc_info=True)
+            return None
+        
+        return ObjectStream(
+            client_context,
+            response['Body'],
+            response.get('ContentLength'),
+            response.get('ContentType'),
+            chunk_size or settings.RUSTFS_STREAM_CHUNK_SIZE,
+            response.get('ContentRange')
+        )
+    
+    async def get_object_info(self, file_key: str) -> Optional[Dict]:
+        """
+        读取对象元数据（HEAD 请求，不传输内容）
+        
+        Args:
+            file_key: 文件标识符
+            
+        Returns:
+            {'content_length', 'content_type', 'etag', 'last_modified'}，对象不存在或失败返回 None
+        """
+        try:
+            response = await self._call('读取文件元数据', lambda s3: s3.head_object(Bucket=self.bucket, Key=file_key))
+            return {
+                'content_length': response.get('ContentLength'),
+                'content_type': response.get('ContentType'),
+                'etag': response.get('ETag'),
+                'last_modified': response.get('LastModified'),
+            }
+        except Exception as e:
+            error_code = getattr(e, 'response', {}).get('Error', {}).get('Code', '')
+            if error_code not in ('404', 'NoSuchKey'):
+                logger.error(f"读取文件元数据异常: {e}")
+            return None
+    
+    async def iter_objects(self, prefix: str = '', page_size: int = 1000) -> AsyncIterator[List[Dict]]:
+        """
+        分页列出对象（ListObjectsV2），每次产出一页，内存占用与对象总数无关
+        
+        Args:
+            prefix: 只列出该前缀下的对象
+            page_size: 每页对象数（最多 1000）
+            
+        Yields:
+            [{'key', 'size', 'last_modified'}]
+        
+        每页单独超时和重试，中途失败时抛出异常
+        """
+        params = {'Bucket': self.bucket, 'Prefix': prefix, 'MaxKeys': page_size}
+        while True:
+            page = await self._call('列出对象', lambda s3: s3.list_objects_v2(**params))
+            contents = page.get('Contents', [])
+            if contents:
+                yield [
+                    {'key': obj['Key'], 'size': obj.get('Size', 0), 'last_modified': obj.get('LastModified')}
+                    for obj in contents
+                ]
+            if not page.get('IsTruncated'):
+                return
+            params['ContinuationToken'] = page['NextContinuationToken']
+    
     async def delete_file(self, file_key: str) -> bool:
         """
         从 S3 存储删除文件
@@ -224,19 +923,59 @@ class RustFSClient:
             成功返回 True，失败返回 False
         """
         try:
-            async with self.session.client(**self.s3_config) as s3:
-                await s3.delete_object(
-                    Bucket=self.bucket,
-                    Key=file_key
-                )
-                
-                logger.info(f"文件删除成功: {file_key}")
-                return True
-                
+            await self._call('删除文件', lambda s3: s3.delete_object(Bucket=self.bucket, Key=file_key))
+            logger.info(f"文件删除成功: {file_key}")
+            return True
         except Exception as e:
             logger.error(f"删除文件异常: {e}", exc_info=True)
             return False
     
+    async def delete_files(self, file_keys: Iterable[str]) -> Tuple[List[str], Dict[str, str]]:
+        """
+        批量删除文件（DeleteObjects，每次请求最多 1000 个键，多批并发执行）
+        
+        Args:
+            file_keys: 文件标识符（重复的键只删除一次）
+            
+        Returns:
+            (已删除的键, {删除失败的键: 错误信息})；对象不存在视为删除成功
+        """
+        keys = list(dict.fromkeys(key for key in file_keys if key))
+        if not keys:
+            return [], {}
+        
+        async def delete_batch(batch: List[str]) -> Dict[str, str]:
+            try:
+                response = await self._call(
+                    '批量删除文件',
+                    lambda s3: s3.delete_objects(
+                        Bucket=self.bucket,
+                        Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+                    )
+                )
+            except Exception as e:
+                logger.error(f"批量删除文件异常: {len(batch)} 个, {e}")
+                return {key: str(e) for key in batch}
+            # Quiet 模式只返回删除失败的键
+            return {
+                error['Key']: f"{error.get('Code', '')}: {error.get('Message', '')}"
+                for error in response.get('Errors', [])
+                if error.get('Key') in batch
+            }
+        
+        failed: Dict[str, str] = {}
+        results = await asyncio.gather(*(
+            delete_batch(keys[i:i + DELETE_BATCH_SIZE]) for i in range(0, len(keys), DELETE_BATCH_SIZE)
+        ))
+        for errors in results:
+            failed.update(errors)
+        deleted = [key for key in keys if key not in failed]
+        
+        logger.info(f"批量删除文件: 成功 {len(deleted)} 个, 失败 {len(failed)} 个")
+        if failed:
+            logger.warning(f"部分文件删除失败: {failed}")
+        return deleted, failed
+    
     async def file_exists(self, file_key: str) -> bool:
         """
         检查文件是否存在
@@ -248,12 +987,8 @@ class RustFSClient:
             存在返回 True，否则返回 False
         """
         try:
-            async with self.session.client(**self.s3_config) as s3:
-                await s3.head_object(
-                    Bucket=self.bucket,
-                    Key=file_key
-                )
-                return True
+            await self._call('检查文件是否存在', lambda s3: s3.head_object(Bucket=self.bucket, Key=file_key))
+            return True
         except Exception as e:
             error_code = getattr(e, 'response', {}).get('Error', {}).get('Code', '')
             if error_code == '404' or error_code == 'NoSuchKey':
@@ -265,17 +1000,19 @@ class RustFSClient:
         """
         检查 S3 存储服务是否可用
         
+        不经过熔断器：熔断器打开时也发起请求，不占用半开状态的探测名额，结果也不改变熔断状态
+        （健康检查的频率由外部探针决定，不应影响业务请求的熔断）
+        
         Returns:
             可用返回 True，否则返回 False
         """
         try:
-            async with self.session.client(**self.s3_config) as s3:
-                # 尝试列出存储桶（只需要列表权限）
-                await s3.list_objects_v2(
-                    Bucket=self.bucket,
-                    MaxKeys=1
+            # 尝试列出存储桶（只需要列表权限）
+            async with self._s3() as s3:
+                await asyncio.wait_for(
+                    s3.list_objects_v2(Bucket=self.bucket, MaxKeys=1), settings.RUSTFS_OPERATION_TIMEOUT or None
                 )
-                return True
+            return True
         except Exception as e:
             error_code = getattr(e, 'response', {}).get('Error', {}).get('Code', '')
             if error_code == 'NoSuchBucket':
@@ -0,0 +1,227 @@
+"""
+近似重复图片索引
+输出图片的感知哈希（log_assets.phash）加载到内存，使用多索引哈希（multi-index hashing）
+按汉明距离检索相似图片：64 位哈希分成 4 段 16 位，汉明距离不超过 r 的两个哈希
+至少有一段的距离不超过 r // 4，只需在每段的有序数组中查找少量邻近值，再精确计算完整距离
+"""
+import asyncio
+import logging
+import threading
+import time
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.log_asset import LogAsset
+
+logger = logging.getLogger(__name__)
+
+# 哈希分段：段数和每段位数
+CHUNK_COUNT = 4
+CHUNK_BITS = 16
+
+# 支持的最大汉明距离（每段最多翻转 4 位，邻近值不超过 2517 个）
+MAX_DISTANCE = 16
+
+# 增量添加的哈希超过该数量时合并到主索引
+PENDING_MERGE_SIZE = 1024
+
+# 从数据库加载时每批读取的行数
+LOAD_BATCH_SIZE = 10000
+
+# 64 位无符号掩码（数据库中按有符号 BIGINT 存储）
+HASH_MASK = (1 << 64) - 1
+
+
+def _flip_masks(max_bits: int) -> np.ndarray:
+    """16 位内翻转不超过 max_bits 位的所有掩码"""
+    masks = [0]
+    for bits in range(1, max_bits + 1):
+        for positions in combinations(range(CHUNK_BITS), bits):
+            masks.append(sum(1 << p for p in positions))
+    return np.array(masks, dtype=np.uint64)
+
+
+# 按每段距离预先计算的翻转掩码
+FLIP_MASKS = [_flip_masks(bits) for bits in range(MAX_DISTANCE // CHUNK_COUNT + 1)]
+
+
+class _Snapshot:
+    """不可变的索引快照（整体替换，检索时无需加锁）"""
+
+    def __init__(self, ids: np.ndarray, hashes: np.ndarray):
+        self.ids = ids
+        self.hashes = hashes
+        # 每段：按段值排序后的段值数组和对应的行号
+        self.chunks: List[Tuple[np.ndarray, np.ndarray]] = []
+        for i in range(CHUNK_COUNT):
+            values = (hashes >> np.uint64(i * CHUNK_BITS)) & np.uint64((1 << CHUNK_BITS) - 1)
+            order = np.argsort(values, kind='stable')
+            self.chunks.append((values[order], order))
+
+    def candidates(self, query: int, chunk_distance: int) -> np.ndarray:
+        """返回至少一段的距离不超过 chunk_distance 的行号"""
+        found = []
+        masks = FLIP_MASKS[chunk_distance]
+        for i, (values, order) in enumerate(self.chunks):
+            neighbors = np.uint64((query >> (i * CHUNK_BITS)) & ((1 << CHUNK_BITS) - 1)) ^ masks
+            left = np.searchsorted(values, neighbors, side='left')
+            right = np.searchsorted(values, neighbors, side='right')
+            # 展开所有命中区间 [left, right) 的下标（向量化，避免逐个区间切片）
+            lengths = right - left
+            total = int(lengths.sum())
+            if total:
+                starts = np.repeat(left - (np.cumsum(lengths) - lengths), lengths)
+                found.append(order[starts + np.arange(total)])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+
+class SimilarityIndex:
+    """近似重复图片索引（进程内，定期从数据库全量重建）"""
+
+    def __init__(self, refresh_seconds: int = None):
+        self.refresh_seconds = settings.SIMILARITY_INDEX_REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+        self._snapshot: Optional[_Snapshot] = None
+        self._pending: Dict[int, int] = {}  # 资源ID -> 哈希（重建之间增量添加，线性扫描）
+        self._task: Optional[asyncio.Task] = None
+        self._rebuilding = False
+        # 重建在线程中执行，增量添加和检索在事件循环中执行：_snapshot 替换、_pending 和 _rebuilding 的读写需加锁
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        """索引是否已加载"""
+        return self._snapshot is not None
+
+    @property
+    def size(self) -> int:
+        """索引中的图片数"""
+        snapshot = self._snapshot
+        return (len(snapshot.ids) if snapshot else 0) + len(self._pending)
+
+    async def start(self) -> None:
+        """启动后台任务：加载索引并定期重建"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="similarity-index")
+
+    async def stop(self) -> None:
+        """停止后台任务"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        """后台任务主循环"""
+        while True:
+            try:
+                await asyncio.to_thread(self.rebuild)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"加载相似图片索引失败: {e}", exc_info=True)
+            if self.refresh_seconds <= 0:
+                return
+            await asyncio.sleep(self.refresh_seconds)
+
+    def rebuild(self) -> None:
+        """从数据库全量重建索引（其他进程写入和回填的哈希在重建时生效，已删除的图片随之移出）"""
+        started = time.monotonic()
+        # 读取数据库之前增量添加的哈希已包含在查询结果中，重建后从增量中移除
+        with self._lock:
+            pending_before = dict(self._pending)
+            self._rebuilding = True
+        ids, hashes = [], []
+        snapshot = None
+        db = SessionLocal()
+        try:
+            last_id = 0
+            while True:
+                rows = db.query(LogAsset.id, LogAsset.phash).filter(
+                    LogAsset.asset_type == 'output',
+                    LogAsset.phash.isnot(None),
+                    LogAsset.id > last_id
+                ).order_by(LogAsset.id).limit(LOAD_BATCH_SIZE).all()
+                if not rows:
+                    break
+                for asset_id, phash in rows:
+                    ids.append(asset_id)
+                    hashes.append(phash & HASH_MASK)
+                last_id = rows[-1][0]
+            snapshot = _Snapshot(np.array(ids, dtype=np.int64), np.array(hashes, dtype=np.uint64))
+        finally:
+            db.close()
+            with self._lock:
+                if snapshot is not None:
+                    self._snapshot = snapshot
+                    # 重建期间增量添加的哈希保留到下次重建
+                    for asset_id, value in pending_before.items():
+                        if self._pending.get(asset_id) == value:
+                            self._pending.pop(asset_id, None)
+                self._rebuilding = False
+        logger.info(f"相似图片索引已加载: {len(ids)} 张图片, 耗时 {time.monotonic() - started:.2f}s")
+
+    def add(self, asset_id: int, phash: int) -> None:
+        """增量添加图片（新上传的图片无需等待重建即可检索）"""
+        with self._lock:
+            self._pending[asset_id] = phash & HASH_MASK
+            snapshot = self._snapshot
+            if snapshot is not None and not self._rebuilding and len(self._pending) >= PENDING_MERGE_SIZE:
+                pending = dict(self._pending)
+                self._snapshot = _Snapshot(
+                    np.concatenate([snapshot.ids, np.fromiter(pending.keys(), dtype=np.int64, count=len(pending))]),
+                    np.concatenate([snapshot.hashes, np.fromiter(pending.values(), dtype=np.uint64, count=len(pending))])
+                )
+                self._pending.clear()
+
+    def search(
+        self,
+        phash: int,
+        max_distance: int,
+        limit: int,
+        exclude_ids: Tuple[int, ...] = ()
+    ) -> List[Tuple[int, int]]:
+        """
+        检索相似图片
+
+        Args:
+            phash: 查询图片的感知哈希
+            max_distance: 最大汉明距离（不超过 MAX_DISTANCE）
+            limit: 返回数量
+            exclude_ids: 排除的资源ID
+
+        Returns:
+            [(资源ID, 汉明距离)]，按距离从小到大排列
+        """
+        max_distance = min(max(max_distance, 0), MAX_DISTANCE)
+        query = phash & HASH_MASK
+        results: Dict[int, int] = {}
+
+        snapshot = self._snapshot
+        if snapshot is not None and len(snapshot.ids):
+            rows = snapshot.candidates(query, max_distance // CHUNK_COUNT)
+            if len(rows):
+                distances = np.bitwise_count(snapshot.hashes[rows] ^ np.uint64(query))
+                matched = distances <= max_distance
+                for asset_id, distance in zip(snapshot.ids[rows][matched].tolist(), distances[matched].tolist()):
+                    results[asset_id] = distance
+
+        with self._lock:
+            pending = list(self._pending.items())
+        for asset_id, value in pending:
+            distance = (value ^ query).bit_count()
+            if distance <= max_distance:
+                results[asset_id] = distance
+
+        for asset_id in exclude_ids:
+            results.pop(asset_id, None)
+        return sorted(results.items(), key=lambda item: (item[1], item[0]))[:limit]
+
+
+# 全局相似图片索引实例
+similarity_index = SimilarityIndex()
@@ -0,0 +1,420 @@
+"""
+本地磁盘 LRU 缓存
+衍生图按存储键缓存到本机磁盘，命中时打开文件直接返回（不经过对象存储），
+按字节预算做 LRU 淘汰；重启后从缓存目录重建索引，并根据访问日志预热热点衍生图。
+多个 worker 进程共用缓存目录时，每个进程占用一个独立的子目录（slot-0、slot-1…），
+索引、淘汰和访问日志都只作用于本进程的子目录
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Awaitable, BinaryIO, Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 访问日志文件名（位于缓存目录下，每行一个存储键）
+ACCESS_LOG_NAME = "access.log"
+
+# 访问日志超过该行数时压缩（只保留当前索引中的键，按访问顺序）
+ACCESS_LOG_COMPACT_LINES = 100000
+
+# 临时文件后缀（写入完成后原子重命名）
+TMP_SUFFIX = ".tmp"
+
+# 进程子目录名前缀、锁文件名和最多子目录数
+SLOT_PREFIX = "slot-"
+SLOT_LOCK_NAME = "slot.lock"
+MAX_SLOTS = 64
+
+
+def _try_lock_file(fd: int) -> bool:
+    """对文件加排他锁（不等待），进程退出时由系统释放"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+class DiskCache:
+    """本地磁盘 LRU 缓存"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        Args:
+            directory: 缓存目录
+            max_bytes: 缓存字节预算，0 表示禁用
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._slot_dir: Optional[str] = None  # 本进程占用的子目录
+        self._slot_fd: Optional[int] = None  # 子目录锁文件（持有期间其他进程不会占用该子目录）
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # 文件名 -> 字节数，按访问顺序（末尾最近）
+        self._keys: Dict[str, str] = {}  # 文件名 -> 存储键（仅记录本进程见过的键）
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._access_log = None
+        self._access_log_lines = 0
+        self._compacting: Optional[threading.Thread] = None  # 后台压缩访问日志的线程
+        self._compact_pending: List[str] = []  # 压缩期间新记录的访问，压缩完成后追加到新日志
+        self._started = False
+
+    @property
+    def enabled(self) -> bool:
+        """是否启用"""
+        return self.max_bytes > 0 and bool(self.directory)
+
+    @property
+    def total_bytes(self) -> int:
+        """当前缓存占用的字节数"""
+        return self._total_bytes
+
+    @staticmethod
+    def _file_name(key: str) -> str:
+        """存储键对应的缓存文件名"""
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _path(self, name: str, slot_dir: str = None) -> str:
+        """缓存文件路径（按文件名前两位分目录，避免单目录文件过多）"""
+        return os.path.join(slot_dir or self._slot_dir, name[:2], name)
+
+    def _claim_slot(self) -> str:
+        """
+        占用一个未被其他进程使用的子目录（按编号依次尝试，重启后通常占用原来的子目录）
+
+        Raises:
+            OSError: 没有可用的子目录
+        """
+        for index in range(MAX_SLOTS):
+            slot_dir = os.path.join(self.directory, f"{SLOT_PREFIX}{index}")
+            os.makedirs(slot_dir, exist_ok=True)
+            fd = os.open(os.path.join(slot_dir, SLOT_LOCK_NAME), os.O_RDWR | os.O_CREAT)
+            if _try_lock_file(fd):
+                self._slot_fd = fd
+                return slot_dir
+            os.close(fd)
+        raise OSError(f"磁盘缓存子目录已全部被占用（{MAX_SLOTS} 个）")
+
+    def start(self) -> List[str]:
+        """
+        初始化缓存目录并重建索引
+
+        Returns:
+            访问日志中记录、但当前不在缓存中的存储键（按最近访问排序，用于预热）
+        """
+        if not self.enabled or self._started:
+            return []
+        os.makedirs(self.directory, exist_ok=True)
+        self._slot_dir = self._claim_slot()
+
+        # 从子目录重建索引，按修改时间排序作为初始访问顺序
+        files = []
+        for prefix in os.scandir(self._slot_dir):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(TMP_SUFFIX):
+                    # 上次退出时未写完的临时文件
+                    self._remove_file(entry.path)
+                    continue
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        files.sort()
+        with self._lock:
+            for _, name, size in files:
+                self._entries[name] = size
+                self._total_bytes += size
+
+        # 按访问日志调整访问顺序，日志中有但磁盘上没有的键用于预热
+        missing = self._replay_access_log()
+        self._evict()
+        self._open_access_log()
+        self._started = True
+        logger.info(
+            f"磁盘缓存已加载: {self._slot_dir}, {len(self._entries)} 个文件, {self._total_bytes} bytes, "
+            f"预算 {self.max_bytes} bytes, 待预热 {len(missing)} 个"
+        )
+        return missing
+
+    def stop(self) -> None:
+        """关闭访问日志，释放占用的子目录"""
+        compacting = self._compacting
+        if compacting is not None:
+            compacting.join(timeout=5)
+        with self._lock:
+            if self._access_log is not None:
+                self._access_log.close()
+                self._access_log = None
+        if self._slot_fd is not None:
+            os.close(self._slot_fd)
+            self._slot_fd = None
+        self._started = False
+
+    def contains(self, key: str) -> bool:
+        """是否已缓存（只查询索引）"""
+        return self._started and self._file_name(key) in self._entries
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """
+        打开缓存文件
+
+        返回已打开的文件：之后文件被淘汰或删除不影响读取（调用方负责关闭）
+
+        Args:
+            key: 存储键
+
+        Returns:
+            以二进制只读方式打开的文件，未命中返回 None
+        """
+        if not self._started:
+            return None
+        name = self._file_name(key)
+        if name not in self._entries:
+            return None
+        try:
+            f = open(self._path(name), 'rb')
+        except OSError:
+            # 文件已被删除（如其他进程清理孤立对象时），移出索引
+            with self._lock:
+                self._total_bytes -= self._entries.pop(name, 0)
+                self._keys.pop(name, None)
+            return None
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+            self._keys[name] = key
+            self._log_access(key)
+        return f
+
+    def put(self, key: str, content: bytes) -> Optional[str]:
+        """
+        写入缓存（先写临时文件再原子重命名，读取方不会看到半个文件）
+
+        Args:
+            key: 存储键
+            content: 文件内容
+
+        Returns:
+            缓存文件路径，未启用或超出预算返回 None
+        """
+        if not self._started or len(content) > self.max_bytes:
+            return None
+        name = self._file_name(key)
+        path = self._path(name)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=TMP_SUFFIX)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入磁盘缓存失败: {key}, {e}")
+            return None
+
+        with self._lock:
+            self._total_bytes += len(content) - self._entries.pop(name, 0)
+            self._entries[name] = len(content)
+            self._keys[name] = key
+            self._log_access(key)
+        self._evict()
+        return path
+
+    def delete(self, key: str) -> None:
+        """删除缓存文件（包括其他进程子目录中的副本，其他进程下次打开时移出索引）"""
+        if not self._started:
+            return
+        name = self._file_name(key)
+        with self._lock:
+            self._total_bytes -= self._entries.pop(name, 0)
+            self._keys.pop(name, None)
+        try:
+            slots = [entry.path for entry in os.scandir(self.directory) if entry.name.startswith(SLOT_PREFIX)]
+        except OSError:
+            slots = [self._slot_dir]
+        for slot_dir in slots:
+            self._remove_file(self._path(name, slot_dir))
+
+    async def warm(self, keys: List[str], fetch: Callable[[str], Awaitable[Optional[bytes]]]) -> int:
+        """
+        预热缓存：依次下载访问日志中的热点键（最近访问的优先），写满预算即停止
+
+        Args:
+            keys: 待预热的存储键（按最近访问排序）
+            fetch: 下载函数，如 rustfs_client.download_file
+
+        Returns:
+            预热的文件数
+        """
+        warmed = 0
+        for key in keys:
+            if not self._started or self._total_bytes >= self.max_bytes:
+                break
+            if self.contains(key):
+                continue
+            try:
+                content = await fetch(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"预热磁盘缓存失败: {key}, {e}")
+                continue
+            if content and await asyncio.to_thread(self.put, key, content):
+                warmed += 1
+        if warmed:
+            logger.info(f"磁盘缓存预热完成: {warmed} 个文件")
+        return warmed
+
+    def _evict(self) -> None:
+        """超出预算时淘汰最久未访问的文件"""
+        victims = []
+        with self._lock:
+            while self._total_bytes > self.max_bytes and self._entries:
+                name, size = self._entries.popitem(last=False)
+                self._keys.pop(name, None)
+                self._total_bytes -= size
+                victims.append(name)
+        for name in victims:
+            self._remove_file(self._path(name))
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        """删除文件（已不存在时忽略）"""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _replay_access_log(self) -> List[str]:
+        """
+        重放访问日志：已缓存的文件按日志顺序更新访问顺序，
+        返回日志中有但不在缓存中的键（最近访问的在前）
+        """
+        log_path = os.path.join(self._slot_dir, ACCESS_LOG_NAME)
+        try:
+            with open(log_path, 'r', encoding='utf-8') as f:
+                lines = [line.strip() for line in f]
+        except OSError:
+            return []
+
+        # 只保留每个键的最后一次访问
+        last_seen: "OrderedDict[str, None]" = OrderedDict()
+        for key in lines:
+            if key:
+                last_seen.pop(key, None)
+                last_seen[key] = None
+
+        missing = []
+        with self._lock:
+            for key in last_seen:
+                name = self._file_name(key)
+                self._keys[name] = key
+                if name in self._entries:
+                    self._entries.move_to_end(name)
+                else:
+                    missing.append(key)
+        missing.reverse()
+
+        # 压缩访问日志
+        if len(lines) > ACCESS_LOG_COMPACT_LINES:
+            self._rewrite_access_log(list(last_seen))
+        else:
+            self._access_log_lines = len(lines)
+        return missing
+
+    def _open_access_log(self) -> None:
+        """以追加模式打开本进程子目录下的访问日志（行缓冲）"""
+        try:
+            self._access_log = open(
+                os.path.join(self._slot_dir, ACCESS_LOG_NAME), 'a', encoding='utf-8', buffering=1
+            )
+        except OSError as e:
+            logger.warning(f"打开磁盘缓存访问日志失败: {e}")
+            self._access_log = None
+
+    def _write_access_log(self, keys: List[str]) -> Optional[str]:
+        """把给定的键写入临时文件，返回临时文件路径，失败返回 None"""
+        tmp_path = os.path.join(self._slot_dir, ACCESS_LOG_NAME + TMP_SUFFIX)
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for key in keys:
+                    f.write(key + "\n")
+            return tmp_path
+        except OSError as e:
+            logger.warning(f"压缩磁盘缓存访问日志失败: {e}")
+            return None
+
+    def _rewrite_access_log(self, keys: List[str]) -> None:
+        """用给定的键重写访问日志（启动时调用，访问日志尚未打开）"""
+        tmp_path = self._write_access_log(keys)
+        if tmp_path is None:
+            return
+        try:
+            os.replace(tmp_path, os.path.join(self._slot_dir, ACCESS_LOG_NAME))
+            self._access_log_lines = len(keys)
+        except OSError as e:
+            logger.warning(f"压缩磁盘缓存访问日志失败: {e}")
+
+    def _compact_access_log(self, keys: List[str]) -> None:
+        """后台线程：写入压缩后的访问日志，替换当前日志并追加压缩期间新记录的访问"""
+        tmp_path = self._write_access_log(keys)
+        with self._lock:
+            # 压缩期间新记录的访问在替换后重新写入（此时不再进入待追加列表）
+            pending, self._compact_pending = self._compact_pending, []
+            self._compacting = None
+            if tmp_path is None:
+                # 写入失败：重新计数，再累积一轮后重试
+                self._access_log_lines = 0
+                return
+            reopen = self._access_log is not None
+            if reopen:
+                self._access_log.close()
+                self._access_log = None
+            try:
+                os.replace(tmp_path, os.path.join(self._slot_dir, ACCESS_LOG_NAME))
+            except OSError as e:
+                logger.warning(f"压缩磁盘缓存访问日志失败: {e}")
+            self._access_log_lines = len(keys)
+            if reopen:
+                self._open_access_log()
+                for key in pending:
+                    self._log_access(key)
+
+    def _log_access(self, key: str) -> None:
+        """记录访问（调用方需持有锁）；超过行数时在后台线程压缩，不阻塞调用方"""
+        if self._access_log is None:
+            return
+        try:
+            self._access_log.write(key + "\n")
+        except OSError:
+            return
+        self._access_log_lines += 1
+        if self._compacting is not None:
+            self._compact_pending.append(key)
+        elif self._access_log_lines > ACCESS_LOG_COMPACT_LINES:
+            # 只保留当前缓存中的键，按访问顺序
+            keys = [self._keys[name] for name in self._entries if name in self._keys]
+            self._compacting = threading.Thread(
+                target=self._compact_access_log, args=(keys,), name="disk-cache-compact", daemon=True
+            )
+            self._compacting.start()
+
+
+# 全局衍生图磁盘缓存实例
+disk_cache = DiskCache(settings.RENDITION_DISK_CACHE_DIR, settings.RENDITION_DISK_CACHE_MAX_MB * 1024 * 1024)
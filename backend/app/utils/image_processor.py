@@ -2,183 +2,438 @@
 图片处理工具
 用于生成缩略图、验证图片格式等
 """
+import base64
 import io
-from PIL import Image
-from typing import Tuple, Optional
+import numpy as np
+from PIL import Image, ImageOps
+from typing import Any, Dict, Optional, Sequence, Tuple
 import logging
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
-def compress_image(
-    image_content: bytes,
-    max_width: int = 1920,
-    max_height: int = 1920,
-    quality: int = 85,
-    output_format: str = None
-) -> Tuple[bytes, str]:
+# 编码器版本：修改缩放算法或编码参数时递增，已持久化的衍生图会随之失效
+ENCODER_VERSION = 1
+
+# 支持持久化的衍生图尺寸
+RENDITION_SIZES = ('thumb', 'medium')
+
+# 低质量占位图（LQIP）：长边像素、质量和格式（以 data URI 内联到列表接口中，不持久化到衍生图存储）
+LQIP_SIZE = 'lqip'
+LQIP_MAX_SIZE = 16
+LQIP_QUALITY = 40
+LQIP_FORMAT = 'webp'
+
+# 列表卡片拼图（sprite）：前 4 张输出图片拼成一张方形图片（1 张占满，2 张左右并排，3-4 张 2x2），
+# 图块之间的间隔和背景色与列表卡片的网格预览一致，只持久化到衍生图存储，不能通过 size 参数请求
+SPRITE_SIZE = 'sprite'
+SPRITE_MAX_TILES = 4
+SPRITE_GAP = 4
+SPRITE_BACKGROUND = (240, 240, 240)
+
+# 感知哈希（dHash）：缩小到 (PHASH_SIZE + 1) x PHASH_SIZE 的灰度图，比较相邻像素得到 64 位哈希
+PHASH_SIZE = 8
+
+# JPEG 解码阶段支持的缩小倍数（Image.draft）
+DRAFT_SCALES = (2, 4, 8)
+
+# Pillow 默认的解压炸弹上限（约 8900 万像素），IMAGE_MAX_PIXELS=0 时用作单张解码像素上限
+PILLOW_MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS
+
+
+def get_max_pixels() -> int:
+    """单张图片的解码像素上限（IMAGE_MAX_PIXELS 为 0 时使用 Pillow 默认上限，不关闭解压炸弹保护）"""
+    return settings.IMAGE_MAX_PIXELS if settings.IMAGE_MAX_PIXELS > 0 else PILLOW_MAX_IMAGE_PIXELS
+
+
+# 单张图片的解码像素上限由 get_max_pixels 显式检查（超限的 JPEG 可以缩小解码）；
+# Pillow 的解压炸弹检查放宽到 JPEG 最大倍数缩小解码后仍在上限内的尺寸，更大的图片在读取头部时即被拒绝
+Image.MAX_IMAGE_PIXELS = get_max_pixels() * DRAFT_SCALES[-1] ** 2
+
+# 输出格式对应的 MIME 类型
+FORMAT_CONTENT_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+
+def is_format_supported(output_format: str) -> bool:
+    """检查当前 Pillow 是否支持编码指定格式（AVIF 需要 Pillow 11.3+ 或 libavif 支持）"""
+    if output_format == 'avif':
+        try:
+            from PIL import features
+            return bool(features.check('avif'))
+        except Exception:
+            return False
+    return output_format in FORMAT_CONTENT_TYPES
+
+
+def negotiate_output_format(accept: Optional[str]) -> str:
     """
-    压缩图片（用于列表显示的中等尺寸）
+    根据请求的 Accept 头选择衍生图输出格式
+    
+    只有 Accept 中明确列出的 AVIF/WebP 才会被选用（*/* 不代表客户端能解码新格式），
+    多个格式可用时按 q 值优先，q 值相同按 IMAGE_NEGOTIATED_FORMATS 的顺序；
+    都不可用时回退为 JPEG
     
     Args:
-        image_content: 原始图片内容（字节）
-        max_width: 最大宽度
-        max_height: 最大高度
-        quality: 图片质量（1-100）
-        output_format: 输出格式（'webp' 或 'jpeg'），默认使用配置值
+        accept: 请求的 Accept 头
         
     Returns:
-        (压缩后的图片内容（字节）, Content-Type)
+        输出格式（'avif'、'webp' 或 'jpeg'）
     """
-    output_format = output_format or settings.IMAGE_OUTPUT_FORMAT
-    try:
-        image = Image.open(io.BytesIO(image_content))
+    if not accept:
+        return 'jpeg'
+    
+    # 解析 Accept 头中各 MIME 类型的 q 值
+    accepted = {}
+    for part in accept.split(','):
+        fields = [f.strip() for f in part.split(';')]
+        mime = fields[0].lower()
+        q = 1.0
+        for param in fields[1:]:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        accepted[mime] = q
+    
+    best_format, best_q = 'jpeg', 0.0
+    for output_format in settings.IMAGE_NEGOTIATED_FORMATS:
+        if output_format == 'jpeg' or not is_format_supported(output_format):
+            continue
+        q = accepted.get(FORMAT_CONTENT_TYPES.get(output_format), 0.0)
+        if q > best_q:
+            best_format, best_q = output_format, q
+    return best_format
+
+
+def snap_width(width: int) -> int:
+    """
+    将请求宽度向上取整到宽度档位（超出最大档位时使用最大档位）
+    
+    Args:
+        width: 请求的宽度（像素）
         
-        # 对于 GIF 格式，只使用第一帧
-        if image.format == 'GIF':
-            try:
-                image.seek(0)
-            except EOFError:
-                pass
+    Returns:
+        档位宽度
+    """
+    ladder = settings.RENDITION_WIDTH_LADDER
+    for step in ladder:
+        if step >= width:
+            return step
+    return ladder[-1]
+
+
+def width_size_label(width: int) -> str:
+    """宽度档位对应的尺寸标识，如 640 -> 'w640'"""
+    return f"w{snap_width(width)}"
+
+
+def _parse_width_label(size: str) -> Optional[int]:
+    """解析宽度档位尺寸标识，不是合法档位时返回 None"""
+    if size.startswith('w') and size[1:].isdigit():
+        width = int(size[1:])
+        if width in settings.RENDITION_WIDTH_LADDER:
+            return width
+    return None
+
+
+def is_rendition_size(size: Optional[str]) -> bool:
+    """检查尺寸标识是否为衍生图尺寸（thumb、medium 或宽度档位 w<N>）"""
+    return bool(size) and (size in RENDITION_SIZES or _parse_width_label(size) is not None)
+
+
+def get_rendition_spec(size: str) -> Tuple[int, int]:
+    """
+    获取衍生图的尺寸参数
+    
+    Args:
+        size: 尺寸标识（'thumb'、'medium' 或宽度档位 'w<N>'）
         
-        # 转换为 RGB
-        if image.mode in ('RGBA', 'LA', 'P'):
-            rgb_image = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                if 'transparency' in image.info:
-                    image = image.convert('RGBA')
-                else:
-                    image = image.convert('RGBA')
-            if image.mode == 'RGBA':
-                rgb_image.paste(image, mask=image.split()[-1])
-            else:
-                rgb_image.paste(image)
-            image = rgb_image
-        elif image.mode != 'RGB':
-            image = image.convert('RGB')
+    Returns:
+        (最大边长（宽度档位为最大宽度）, 图片质量)
         
-        # 计算新尺寸（保持宽高比）
-        width, height = image.size
-        if width > max_width or height > max_height:
-            ratio = min(max_width / width, max_height / height)
-            new_width = int(width * ratio)
-            new_height = int(height * ratio)
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # 保存为指定格式（WebP 或 JPEG）
-        output = io.BytesIO()
-        if output_format == 'webp':
-            # WebP 格式：减少 25-35% 文件大小
-            image.save(output, format='WEBP', quality=quality, method=6)  # method=6 是最高压缩质量
-            content_type = 'image/webp'
-        else:
-            # JPEG 格式（兼容旧版本）
-            image.save(output, format='JPEG', quality=quality, optimize=True)
-            content_type = 'image/jpeg'
-        output.seek(0)
+    Raises:
+        ValueError: 如果尺寸标识不支持
+    """
+    if size == 'thumb':
+        return settings.THUMBNAIL_SIZE, settings.THUMBNAIL_QUALITY
+    if size == 'medium':
+        return settings.MEDIUM_IMAGE_SIZE, settings.MEDIUM_IMAGE_QUALITY
+    width = _parse_width_label(size)
+    if width is not None:
+        return width, settings.MEDIUM_IMAGE_QUALITY
+    if size == LQIP_SIZE:
+        return LQIP_MAX_SIZE, LQIP_QUALITY
+    if size == SPRITE_SIZE:
+        return settings.SPRITE_TILE_SIZE, settings.SPRITE_QUALITY
+    raise ValueError(f"不支持的衍生图尺寸: {size}")
+
+
+def get_encoder_version(size: str) -> str:
+    """
+    获取衍生图的编码版本标识（包含编码器版本和尺寸参数，配置变化后自动区分）
+    
+    Args:
+        size: 尺寸标识
         
-        compressed_bytes = output.read()
-        logger.info(f"图片压缩成功: {width}x{height} -> {image.size[0]}x{image.size[1]}, 格式: {output_format}, 大小: {len(compressed_bytes)} bytes")
+    Returns:
+        编码版本字符串，如 'v1-300q85'
+    """
+    max_size, quality = get_rendition_spec(size)
+    return f"v{ENCODER_VERSION}-{max_size}q{quality}"
+
+
+def render_rendition(
+    image_content: bytes,
+    size: str,
+    output_format: str = None
+) -> Tuple[bytes, str]:
+    """
+    按尺寸标识渲染单个衍生图
+    
+    Args:
+        image_content: 原始图片内容（字节）
+        size: 尺寸标识（'thumb' 或 'medium'）
+        output_format: 输出格式（'avif'、'webp' 或 'jpeg'），默认使用配置值
         
-        return compressed_bytes, content_type
+    Returns:
+        (衍生图内容（字节）, Content-Type)
         
-    except Exception as e:
-        logger.error(f"图片压缩失败: {e}")
-        raise ValueError(f"无法压缩图片: {str(e)}")
+    Raises:
+        ValueError: 如果尺寸不支持或图片无法处理
+    """
+    return generate_rendition_pyramid(image_content, [size], output_format)[size]
 
 
-def generate_thumbnail(
+def generate_rendition_pyramid(
     image_content: bytes,
-    size: int = None,
-    quality: int = None,
+    sizes: Sequence[str] = RENDITION_SIZES,
     output_format: str = None
-) -> Tuple[bytes, str]:
+) -> Dict[str, Tuple[bytes, str]]:
     """
-    生成图片缩略图
+    一次解码生成多个尺寸的衍生图
+    
+    - JPEG 使用 Image.draft 在解码阶段按 1/2、1/4、1/8 缩小，减少解码开销
+    - 大图使用 reducing_gap 先按整数倍 reduce 再精细缩放
+    - 从大到小依次缩放，每个尺寸基于上一级结果生成，不重复解码原图
     
     Args:
         image_content: 原始图片内容（字节）
-        size: 缩略图大小（宽度，保持比例），默认使用配置值
-        quality: 图片质量（1-100），默认使用配置值
-        output_format: 输出格式（'webp' 或 'jpeg'），默认使用配置值
+        sizes: 尺寸标识列表
+        output_format: 输出格式（'avif'、'webp' 或 'jpeg'），默认使用配置值
         
     Returns:
-        (缩略图内容（字节）, Content-Type)
+        {尺寸标识: (衍生图内容（字节）, Content-Type)}
         
     Raises:
-        ValueError: 如果图片格式不支持或损坏
+        ValueError: 如果尺寸不支持或图片无法处理
     """
     output_format = output_format or settings.IMAGE_OUTPUT_FORMAT
-    size = size or settings.THUMBNAIL_SIZE
-    quality = quality or settings.THUMBNAIL_QUALITY
+    specs = {size: get_rendition_spec(size) for size in sizes}
     
     try:
-        # 打开图片
         image = Image.open(io.BytesIO(image_content))
+        source_format = image.format
+        width, height = image.size
         
-        # 对于 GIF 格式，只使用第一帧（静态 GIF 已经是单帧）
-        if image.format == 'GIF':
-            # 如果 GIF 是动画，seek(0) 会定位到第一帧
+        # 计算每个尺寸的目标宽高，按面积从大到小排列
+        targets = sorted(
+            ((size, _get_target_size(size, width, height, specs[size][0])) for size in sizes),
+            key=lambda item: item[1][0] * item[1][1],
+            reverse=True
+        )
+        
+        # JPEG：解码阶段直接缩小到不小于最大目标尺寸的 1/2^n
+        _limit_decode_size(image, 'RGB', targets[0][1] if targets else None)
+        
+        # 对于 GIF 格式，只使用第一帧
+        if source_format == 'GIF':
             try:
                 image.seek(0)
             except EOFError:
-                # 如果 seek 失败，说明图片可能有问题，继续使用当前帧
                 pass
         
-        # 转换为 RGB（如果是 RGBA 或其他格式）
-        if image.mode in ('RGBA', 'LA', 'P'):
-            # 创建白色背景
-            rgb_image = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                # 对于调色板模式（包括 GIF），转换为 RGBA 以保留透明度
-                if 'transparency' in image.info:
-                    image = image.convert('RGBA')
-                else:
-                    image = image.convert('RGBA')
-            if image.mode == 'RGBA':
-                rgb_image.paste(image, mask=image.split()[-1])
-            else:
-                rgb_image.paste(image)
-            image = rgb_image
-        elif image.mode != 'RGB':
-            image = image.convert('RGB')
+        image = _flatten_to_rgb(image)
         
-        # 计算缩放尺寸（保持宽高比）
-        width, height = image.size
-        if width > height:
-            # 横向图片
-            new_width = size
-            new_height = int(height * (size / width))
-        else:
-            # 纵向图片
-            new_height = size
-            new_width = int(width * (size / height))
-        
-        # 生成缩略图（使用高质量缩放）
-        thumbnail = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # 保存为指定格式（WebP 或 JPEG）
-        output = io.BytesIO()
-        if output_format == 'webp':
-            # WebP 格式：减少 25-35% 文件大小
-            thumbnail.save(output, format='WEBP', quality=quality, method=6)  # method=6 是最高压缩质量
-            content_type = 'image/webp'
-        else:
-            # JPEG 格式（兼容旧版本）
-            thumbnail.save(output, format='JPEG', quality=quality, optimize=True)
-            content_type = 'image/jpeg'
-        output.seek(0)
+        results = {}
+        current = image
+        for size, target in targets:
+            if current.size != target:
+                # reducing_gap：缩小倍数较大时先用 reduce 快速缩小，再用 LANCZOS 精细缩放
+                current = current.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+            # 占位图固定使用 LQIP_FORMAT，保证浏览器都能内联显示
+            size_format = LQIP_FORMAT if size == LQIP_SIZE else output_format
+            results[size] = _encode_image(current, size_format, specs[size][1])
+            logger.info(f"衍生图生成成功: {width}x{height} -> {target[0]}x{target[1]} ({size}), 格式: {output_format}, 大小: {len(results[size][0])} bytes")
         
-        thumbnail_bytes = output.read()
-        logger.info(f"缩略图生成成功: {width}x{height} -> {new_width}x{new_height}, 格式: {output_format}, 大小: {len(thumbnail_bytes)} bytes, 原始格式: {image.format}")
+        return results
         
-        return thumbnail_bytes, content_type
+    except Exception as e:
+        logger.error(f"生成衍生图失败: {e}")
+        raise ValueError(f"无法处理图片: {str(e)}")
+
+
+def sprite_layout(count: int) -> Dict[str, Any]:
+    """
+    计算拼图布局（列表接口据此返回图块坐标，无需先生成拼图）
+    
+    Args:
+        count: 图片数量（超过 SPRITE_MAX_TILES 时只取前几张）
+        
+    Returns:
+        {width, height, tiles: [{x, y, width, height}]}，坐标单位为拼图像素
+    """
+    tile_size = settings.SPRITE_TILE_SIZE
+    count = min(count, SPRITE_MAX_TILES)
+    side = tile_size * 2 + SPRITE_GAP
+    columns = 1 if count <= 1 else 2
+    rows = 1 if count <= 2 else 2
+    tile_width = side if columns == 1 else tile_size
+    tile_height = side if rows == 1 else tile_size
+    tiles = [
+        {
+            'x': (i % columns) * (tile_size + SPRITE_GAP),
+            'y': (i // columns) * (tile_size + SPRITE_GAP),
+            'width': tile_width,
+            'height': tile_height,
+        }
+        for i in range(count)
+    ]
+    return {'width': side, 'height': side, 'tiles': tiles}
+
+
+def compose_sprite(images: Sequence[bytes], output_format: str = None) -> Tuple[bytes, str]:
+    """
+    将多张图片居中裁剪后拼成一张拼图（布局见 sprite_layout）
+    
+    Args:
+        images: 图片内容列表（按显示顺序，通常为中等尺寸衍生图）
+        output_format: 输出格式（'avif'、'webp' 或 'jpeg'），默认使用配置值
+        
+    Returns:
+        (拼图内容（字节）, Content-Type)
+        
+    Raises:
+        ValueError: 如果图片无法处理
+    """
+    output_format = output_format or settings.IMAGE_OUTPUT_FORMAT
+    layout = sprite_layout(len(images))
+    _, quality = get_rendition_spec(SPRITE_SIZE)
+    
+    try:
+        sprite = Image.new('RGB', (layout['width'], layout['height']), SPRITE_BACKGROUND)
+        for content, tile in zip(images, layout['tiles']):
+            target = (tile['width'], tile['height'])
+            image = Image.open(io.BytesIO(content))
+            _limit_decode_size(image, 'RGB', target)
+            image = _flatten_to_rgb(image)
+            # 与列表卡片的 object-fit: cover 一致：等比缩放后居中裁剪
+            image = ImageOps.fit(image, target, Image.Resampling.LANCZOS)
+            sprite.paste(image, (tile['x'], tile['y']))
+        
+        result = _encode_image(sprite, output_format, quality)
+        logger.info(f"拼图生成成功: {len(layout['tiles'])} 张, {layout['width']}x{layout['height']}, 格式: {output_format}, 大小: {len(result[0])} bytes")
+        return result
         
     except Exception as e:
-        logger.error(f"生成缩略图失败: {e}")
+        logger.error(f"生成拼图失败: {e}")
         raise ValueError(f"无法处理图片: {str(e)}")
 
 
+def _get_target_size(size: str, width: int, height: int, max_size: int) -> Tuple[int, int]:
+    """
+    计算衍生图目标宽高（保持宽高比）
+    
+    - thumb、lqip：长边缩放到 max_size
+    - 宽度档位（w<N>）：宽度超出 max_size 时按宽度缩小（用于 srcset 的 w 描述符）
+    - 其他尺寸：仅当超出 max_size 时缩小
+    """
+    if size in ('thumb', LQIP_SIZE):
+        if width > height:
+            return max_size, max(1, int(height * (max_size / width)))
+        return max(1, int(width * (max_size / height))), max_size
+    if _parse_width_label(size) is not None:
+        if width > max_size:
+            return max_size, max(1, int(height * (max_size / width)))
+        return width, height
+    if width > max_size or height > max_size:
+        ratio = min(max_size / width, max_size / height)
+        return max(1, int(width * ratio)), max(1, int(height * ratio))
+    return width, height
+
+
+def _within_pixel_limit(image: Image.Image) -> bool:
+    """图片（只读取头部）能否在单张解码像素上限内处理（超限的 JPEG 允许缩小解码时视为可处理）"""
+    limit = get_max_pixels()
+    width, height = image.size
+    if width * height <= limit:
+        return True
+    scale = DRAFT_SCALES[-1]
+    return image.format == 'JPEG' and settings.IMAGE_OVERSIZE_DRAFT and (width // scale) * (height // scale) <= limit
+
+
+def _limit_decode_size(image: Image.Image, mode: str = 'RGB', target: Optional[Tuple[int, int]] = None) -> None:
+    """
+    在解码像素之前限制解码尺寸（Image.open 之后、访问像素之前调用）
+    
+    - JPEG 指定 target 时在解码阶段缩小到不小于 target 的 1/2^n
+    - 解码尺寸仍超过单张解码像素上限时，JPEG 按 1/2、1/4、1/8 中最小满足上限的倍数缩小解码，其他格式直接拒绝
+    
+    Raises:
+        ValueError: 图片像素超过上限且无法缩小解码
+    """
+    limit = get_max_pixels()
+    width, height = image.size
+    draft_size = target
+    if width * height > limit and image.format == 'JPEG' and settings.IMAGE_OVERSIZE_DRAFT:
+        # draft 不可叠加：目标尺寸和上限取较小者，一次缩小到位
+        scale = next((s for s in DRAFT_SCALES if (width // s) * (height // s) <= limit), DRAFT_SCALES[-1])
+        reduced = (width // scale, height // scale)
+        draft_size = (min(target[0], reduced[0]), min(target[1], reduced[1])) if target else reduced
+        logger.info(f"图片像素超过上限，缩小解码: {width}x{height} -> 1/{scale}")
+    if image.format == 'JPEG' and draft_size:
+        image.draft(mode, draft_size)
+    if image.width * image.height > limit:
+        raise ValueError(f"图片像素过多（{width}x{height}），最大允许 {limit / 1000000:g} 百万像素")
+
+
+def _flatten_to_rgb(image: Image.Image) -> Image.Image:
+    """转换为 RGB（透明区域使用白色背景）"""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # 创建白色背景
+        rgb_image = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode != 'RGBA':
+            # 调色板模式（包括 GIF）和 LA 转换为 RGBA 以保留透明度
+            image = image.convert('RGBA')
+        rgb_image.paste(image, mask=image.split()[-1])
+        return rgb_image
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def _encode_image(image: Image.Image, output_format: str, quality: int) -> Tuple[bytes, str]:
+    """按指定格式编码图片，返回 (内容（字节）, Content-Type)"""
+    output = io.BytesIO()
+    if output_format == 'avif' and is_format_supported('avif'):
+        # AVIF 格式：相同质量下通常比 WebP 再小 20-30%
+        image.save(output, format='AVIF', quality=quality)
+        content_type = 'image/avif'
+    elif output_format == 'webp':
+        # WebP 格式：减少 25-35% 文件大小
+        image.save(output, format='WEBP', quality=quality, method=6)  # method=6 是最高压缩质量
+        content_type = 'image/webp'
+    else:
+        # JPEG 格式（兼容旧版本）
+        image.save(output, format='JPEG', quality=quality, optimize=True)
+        content_type = 'image/jpeg'
+    return output.getvalue(), content_type
+
+
 def validate_image(image_content: bytes, filename: str = None) -> Tuple[bool, Optional[str]]:
     """
     验证图片格式和大小
@@ -200,6 +455,9 @@ def validate_image(image_content: bytes, filename: str = None) -> Tuple[bool, Op
         # 打开图片
         image = Image.open(io.BytesIO(image_content))
         format_info = image.format  # 在 verify 之前获取格式信息
+        if not _within_pixel_limit(image):
+            width, height = image.size
+            return False, f"图片像素过多（{width}x{height}），最大允许 {get_max_pixels() / 1000000:g} 百万像素"
         image.verify()  # 验证图片完整性（verify 后图片对象不可用，但我们已经获取了格式信息）
         
         # 检查格式
@@ -222,6 +480,84 @@ def validate_image(image_content: bytes, filename: str = None) -> Tuple[bool, Op
         return False, f"无效的图片文件: {str(e)}"
 
 
+def validate_image_header(header: bytes) -> Tuple[bool, Optional[str]]:
+    """
+    根据文件开头的字节验证图片（直传到对象存储的文件只读取开头部分）
+    
+    只检查格式和像素数，不校验完整性：损坏的图片在后台生成衍生图时标记为失败
+    
+    Args:
+        header: 文件开头的字节（需包含完整的图片头部）
+        
+    Returns:
+        (是否有效, 错误信息)
+    """
+    try:
+        image = Image.open(io.BytesIO(header))
+    except Exception as e:
+        return False, f"无法识别图片: {str(e)}"
+    if (image.format or '').lower() not in ('png', 'jpeg', 'webp', 'gif'):
+        return False, f"不支持的图片格式: {image.format}，仅支持 PNG, JPEG, WEBP, GIF"
+    if not _within_pixel_limit(image):
+        width, height = image.size
+        return False, f"图片像素过多（{width}x{height}），最大允许 {get_max_pixels() / 1000000:g} 百万像素"
+    return True, None
+
+
+def compute_phash(image_content: bytes) -> int:
+    """
+    计算图片的感知哈希（dHash，64 位）
+    
+    内容相近的图片（如只改变随机种子、轻微压缩或缩放）哈希的汉明距离很小，用于查找近似重复图片
+    
+    Args:
+        image_content: 图片内容（字节）
+        
+    Returns:
+        有符号 64 位整数（可直接写入 BIGINT 列）
+        
+    Raises:
+        ValueError: 如果图片无法处理
+    """
+    try:
+        image = Image.open(io.BytesIO(image_content))
+        # JPEG：解码阶段直接缩小，哈希只需要很小的灰度图
+        _limit_decode_size(image, 'L', (PHASH_SIZE * 8, PHASH_SIZE * 8))
+        if image.format == 'GIF':
+            try:
+                image.seek(0)
+            except EOFError:
+                pass
+        image = _flatten_to_rgb(image).convert('L')
+        image = image.resize((PHASH_SIZE + 1, PHASH_SIZE), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        
+        pixels = np.asarray(image, dtype=np.int16)
+        bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+        value = int(np.packbits(bits).view('>u8')[0])
+        return value - (1 << 64) if value >= (1 << 63) else value
+    except Exception as e:
+        logger.error(f"计算感知哈希失败: {e}")
+        raise ValueError(f"无法处理图片: {str(e)}")
+
+
+def to_data_uri(content: bytes, content_type: str) -> str:
+    """将图片内容编码为 data URI（用于内联占位图）"""
+    return f"data:{content_type};base64,{base64.b64encode(content).decode('ascii')}"
+
+
+def get_decode_pixels(image_content: bytes) -> int:
+    """
+    估算解码图片占用的像素数（只读取图片头部），用于分配进程池的解码像素预算
+    
+    超过单张上限的图片会缩小解码或被拒绝，按上限计算；无法识别时返回 0
+    """
+    try:
+        width, height = Image.open(io.BytesIO(image_content)).size
+    except Exception:
+        return 0
+    return min(width * height, get_max_pixels())
+
+
 def get_image_info(image_content: bytes) -> dict:
     """
     获取图片信息
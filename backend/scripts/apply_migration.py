@@ -1,6 +1,8 @@
 """
 应用数据库迁移脚本
-用于执行 add_comparison_group.sql
+默认执行 add_comparison_group.sql，也可以指定迁移文件：
+
+    python scripts/apply_migration.py migrations/add_asset_renditions.sql
 """
 import sys
 import os
@@ -12,18 +14,23 @@ from sqlalchemy import text
 from app.database import engine
 from app.config import settings
 
-def apply_migration():
-    """执行对比组迁移脚本"""
+def resolve_sql_file(sql_path=None):
+    """解析迁移文件路径（相对路径依次按当前目录、项目根目录查找）"""
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if not sql_path:
+        return os.path.join(project_root, 'migrations', 'add_comparison_group.sql')
+    if os.path.isabs(sql_path) or os.path.exists(sql_path):
+        return sql_path
+    return os.path.join(project_root, sql_path)
+
+def apply_migration(sql_path=None):
+    """执行迁移脚本"""
     print("=" * 60)
-    print("应用数据库迁移：添加对比组功能")
+    print(f"应用数据库迁移：{os.path.basename(sql_path) if sql_path else '添加对比组功能'}")
     print("=" * 60)
     
     # 读取 SQL 文件
-    sql_file = os.path.join(
-        os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-        'migrations',
-        'add_comparison_group.sql'
-    )
+    sql_file = resolve_sql_file(sql_path)
     
     if not os.path.exists(sql_file):
         print(f"[ERROR] SQL 文件不存在: {sql_file}")
@@ -68,6 +75,6 @@ def apply_migration():
         return False
 
 if __name__ == "__main__":
-    success = apply_migration()
+    success = apply_migration(sys.argv[1] if len(sys.argv) > 1 else None)
     sys.exit(0 if success else 1)
 
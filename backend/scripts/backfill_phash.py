@@ -0,0 +1,99 @@
+"""
+回填资源感知哈希（log_assets.phash）
+新上传的图片由衍生图后台任务计算，旧数据使用此脚本回填：
+
+    python scripts/backfill_phash.py
+    python scripts/backfill_phash.py --batch-size 500 --concurrency 8
+
+按 id 分批读取未计算的资源，同一原图（相同存储键）只下载和计算一次；
+可重复执行，中断后重新运行会从未完成的资源继续
+"""
+import sys
+import os
+import argparse
+import asyncio
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.models.log_asset import LogAsset
+from app.services.image_executor import image_executor, ImageExecutorBusy
+from app.services.rustfs_client import rustfs_client
+from app.utils.image_processor import compute_phash, get_decode_pixels
+
+
+async def compute_for_key(file_key, semaphore):
+    """下载原图并计算感知哈希，失败返回 None"""
+    async with semaphore:
+        content = await rustfs_client.download_file(file_key)
+        if not content:
+            print(f"  [WARN] 下载失败: {file_key}")
+            return None
+        while True:
+            try:
+                return await image_executor.run(compute_phash, content, pixels=get_decode_pixels(content))
+            except ImageExecutorBusy:
+                await asyncio.sleep(0.1)
+            except Exception as e:
+                print(f"  [WARN] 计算失败: {file_key}, {e}")
+                return None
+
+
+async def backfill_phash(batch_size, concurrency):
+    """分批回填感知哈希"""
+    print("=" * 60)
+    print("回填资源感知哈希")
+    print("=" * 60)
+
+    image_executor.start()
+    await rustfs_client.start()
+    semaphore = asyncio.Semaphore(concurrency)
+    db = SessionLocal()
+    started = time.monotonic()
+    last_id = 0
+    updated = 0
+    failed = 0
+    try:
+        while True:
+            rows = db.query(LogAsset.id, LogAsset.file_key).filter(
+                LogAsset.phash.is_(None),
+                LogAsset.id > last_id
+            ).order_by(LogAsset.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            file_keys = list(dict.fromkeys(file_key for _, file_key in rows))
+            hashes = await asyncio.gather(*(compute_for_key(key, semaphore) for key in file_keys))
+
+            for file_key, phash in zip(file_keys, hashes):
+                if phash is None:
+                    failed += 1
+                    continue
+                updated += db.query(LogAsset).filter(
+                    LogAsset.file_key == file_key,
+                    LogAsset.phash.is_(None)
+                ).update({LogAsset.phash: phash}, synchronize_session=False)
+            db.commit()
+
+            elapsed = time.monotonic() - started
+            print(f"  已处理至 id={last_id}: 更新 {updated} 条, 失败 {failed} 个原图, {updated / max(elapsed, 0.001):.1f} 条/秒")
+    finally:
+        db.close()
+        image_executor.shutdown()
+        await rustfs_client.close()
+
+    print(f"\n[OK] 回填完成: 更新 {updated} 条, 失败 {failed} 个原图, 耗时 {time.monotonic() - started:.1f}s")
+    print("运行中的服务会在下次重建相似图片索引时加载新的哈希")
+    return failed == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="回填资源感知哈希（log_assets.phash）")
+    parser.add_argument("--batch-size", type=int, default=200, help="每批读取的资源数（默认 200）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时下载的原图数（默认 4）")
+    args = parser.parse_args()
+    success = asyncio.run(backfill_phash(args.batch_size, args.concurrency))
+    sys.exit(0 if success else 1)
@@ -0,0 +1,243 @@
+"""
+批量生成存量图片的衍生图
+按 id 分批读取 log_assets，为缺失的尺寸渲染衍生图并写回衍生图存储：
+
+    python scripts/backfill_renditions.py
+    python scripts/backfill_renditions.py --sizes thumb,medium --formats webp,avif
+    python scripts/backfill_renditions.py --dry-run
+
+- 同一原图（相同存储键）只下载和解码一次，每种格式一次解码生成所有缺失的尺寸
+- 渲染在多进程进程池中执行，下载/上传的并发数有上限
+- 每批完成后把进度写入检查点文件，中断后重新运行会从检查点继续（--restart 从头开始）
+"""
+import sys
+import os
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.asset_rendition import AssetRendition
+from app.models.log_asset import LogAsset
+from app.services.image_executor import ImageExecutor
+from app.services.rendition_store import rendition_store
+from app.services.rustfs_client import rustfs_client
+from app.utils.image_processor import (
+    RENDITION_SIZES, generate_rendition_pyramid, get_decode_pixels, get_encoder_version, is_format_supported,
+    is_rendition_size
+)
+
+DEFAULT_CHECKPOINT = os.path.join(tempfile.gettempdir(), "aigc_vault_backfill_renditions.checkpoint")
+
+
+class Stats:
+    """进度统计"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.originals = 0        # 已处理的原图数
+        self.renditions = 0       # 已写入的衍生图数
+        self.failed = 0           # 处理失败的原图数
+        self.bytes_in = 0         # 下载的原图字节数
+        self.bytes_out = 0        # 上传的衍生图字节数
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 0.001)
+        return (
+            f"原图 {self.originals} 张, 衍生图 {self.renditions} 个, 失败 {self.failed} 张 | "
+            f"{self.originals / elapsed:.1f} 张/秒, "
+            f"下载 {self.bytes_in / elapsed / 1024 / 1024:.1f} MB/s, "
+            f"上传 {self.bytes_out / elapsed / 1024 / 1024:.1f} MB/s"
+        )
+
+
+def load_checkpoint(path, signature):
+    """读取检查点，参数与上次不同时从头开始"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if data.get("signature") != signature:
+        print(f"[WARN] 检查点的尺寸/格式与本次参数不同，从头开始: {path}")
+        return 0
+    return int(data.get("last_id", 0))
+
+
+def save_checkpoint(path, signature, last_id):
+    """写入检查点（先写临时文件再原子重命名）"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"signature": signature, "last_id": last_id}, f)
+    os.replace(tmp_path, path)
+
+
+def find_missing(db, file_keys, sizes, formats):
+    """
+    批量查询缺失的衍生图
+
+    Returns:
+        {原图存储键: {格式: [缺失的尺寸]}}，不缺失的原图不包含在结果中
+    """
+    existing = set()
+    rows = db.query(
+        AssetRendition.file_key, AssetRendition.size, AssetRendition.format, AssetRendition.encoder_version
+    ).filter(
+        AssetRendition.file_key.in_(file_keys),
+        AssetRendition.size.in_(sizes),
+        AssetRendition.format.in_(formats)
+    ).all()
+    for file_key, size, output_format, encoder_version in rows:
+        if encoder_version == get_encoder_version(size):
+            existing.add((file_key, size, output_format))
+
+    missing = {}
+    for file_key in file_keys:
+        for output_format in formats:
+            sizes_missing = [size for size in sizes if (file_key, size, output_format) not in existing]
+            if sizes_missing:
+                missing.setdefault(file_key, {})[output_format] = sizes_missing
+    return missing
+
+
+async def process_original(file_key, missing_by_format, executor, item_semaphore, upload_semaphore, stats):
+    """下载一张原图，渲染并上传所有缺失的衍生图"""
+    async with item_semaphore:
+        original = await rustfs_client.download_file(file_key)
+        if not original:
+            print(f"  [WARN] 下载原图失败: {file_key}")
+            stats.failed += 1
+            return
+        stats.bytes_in += len(original)
+
+        db = SessionLocal()
+        try:
+            for output_format, sizes in missing_by_format.items():
+                results = await executor.run(
+                    generate_rendition_pyramid, original, sizes, output_format, pixels=get_decode_pixels(original)
+                )
+                uploads = []
+                for size, (content, content_type) in results.items():
+                    uploads.append(upload(db, file_key, size, output_format, content, content_type, upload_semaphore, stats))
+                await asyncio.gather(*uploads)
+            stats.originals += 1
+        except Exception as e:
+            db.rollback()
+            print(f"  [WARN] 处理失败: {file_key}, {e}")
+            stats.failed += 1
+        finally:
+            db.close()
+
+
+async def upload(db, file_key, size, output_format, content, content_type, upload_semaphore, stats):
+    """上传并登记一个衍生图（上传并发数受限）"""
+    async with upload_semaphore:
+        rendition = await rendition_store.save(db, file_key, size, output_format, content, content_type)
+    if rendition is None:
+        raise RuntimeError(f"上传衍生图失败: {size}/{output_format}")
+    stats.renditions += 1
+    stats.bytes_out += len(content)
+
+
+async def backfill_renditions(args):
+    """分批生成缺失的衍生图"""
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+    for size in sizes:
+        if not is_rendition_size(size):
+            print(f"[ERROR] 不支持的尺寸: {size}（可选 thumb、medium 或宽度档位 w<N>）")
+            return False
+    for output_format in formats:
+        if not is_format_supported(output_format):
+            print(f"[ERROR] 当前环境不支持的输出格式: {output_format}")
+            return False
+
+    print("=" * 60)
+    print("批量生成衍生图" + ("（试运行）" if args.dry_run else ""))
+    print("=" * 60)
+    print(f"尺寸: {', '.join(sizes)}  格式: {', '.join(formats)}")
+
+    signature = f"{','.join(sorted(sizes))}|{','.join(sorted(formats))}"
+    last_id = 0
+    if not args.dry_run and not args.restart:
+        last_id = load_checkpoint(args.checkpoint, signature)
+        if last_id:
+            print(f"从检查点继续: id > {last_id}")
+
+    executor = ImageExecutor(max_workers=args.workers, max_queue=args.concurrency, task_timeout=0)
+    if not args.dry_run:
+        executor.start()
+        await rustfs_client.start()
+        print(f"进程数: {args.workers}  并发处理: {args.concurrency}  并发上传: {args.upload_concurrency}\n")
+    item_semaphore = asyncio.Semaphore(args.concurrency)
+    upload_semaphore = asyncio.Semaphore(args.upload_concurrency)
+    stats = Stats()
+    seen = set()
+    missing_total = {size: 0 for size in sizes}
+    originals_missing = 0
+
+    db = SessionLocal()
+    try:
+        while True:
+            rows = db.query(LogAsset.id, LogAsset.file_key).filter(
+                LogAsset.id > last_id
+            ).order_by(LogAsset.id).limit(args.batch_size).all()
+            if not rows:
+                break
+            batch_last_id = rows[-1][0]
+
+            # 同一原图可能被多条记录引用，只处理一次
+            file_keys = [key for key in dict.fromkeys(key for _, key in rows) if key not in seen]
+            seen.update(file_keys)
+            missing = find_missing(db, file_keys, sizes, formats) if file_keys else {}
+            db.commit()
+
+            if args.dry_run:
+                originals_missing += len(missing)
+                for missing_by_format in missing.values():
+                    for sizes_missing in missing_by_format.values():
+                        for size in sizes_missing:
+                            missing_total[size] += 1
+            else:
+                await asyncio.gather(*(
+                    process_original(key, missing[key], executor, item_semaphore, upload_semaphore, stats)
+                    for key in file_keys if key in missing
+                ))
+                save_checkpoint(args.checkpoint, signature, batch_last_id)
+                print(f"  已处理至 id={batch_last_id}: {stats.summary()}")
+            last_id = batch_last_id
+    finally:
+        db.close()
+        executor.shutdown()
+        await rustfs_client.close()
+
+    if args.dry_run:
+        print(f"\n需要生成衍生图的原图: {originals_missing} 张（共检查 {len(seen)} 张）")
+        for size, count in missing_total.items():
+            print(f"  {size}: 缺失 {count} 个")
+        return True
+
+    print(f"\n[OK] 完成: {stats.summary()}, 耗时 {time.monotonic() - stats.started:.1f}s")
+    return stats.failed == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量生成存量图片的衍生图（可中断后继续）")
+    parser.add_argument("--sizes", default=",".join(RENDITION_SIZES), help="尺寸，逗号分隔（默认 thumb,medium，可包含宽度档位如 w640）")
+    parser.add_argument("--formats", default=",".join(settings.RENDITION_PREGENERATE_FORMATS), help="输出格式，逗号分隔（默认 RENDITION_PREGENERATE_FORMATS）")
+    parser.add_argument("--batch-size", type=int, default=200, help="每批读取的记录数（默认 200）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="渲染进程数（默认 CPU 核数）")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时处理的原图数（默认 8）")
+    parser.add_argument("--upload-concurrency", type=int, default=16, help="同时上传的衍生图数（默认 16）")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="检查点文件路径")
+    parser.add_argument("--restart", action="store_true", help="忽略检查点，从头开始")
+    parser.add_argument("--dry-run", action="store_true", help="只统计缺失的衍生图，不下载和渲染")
+    args = parser.parse_args()
+    success = asyncio.run(backfill_renditions(args))
+    sys.exit(0 if success else 1)
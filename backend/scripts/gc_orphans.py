@@ -0,0 +1,68 @@
+"""
+清理存储桶中的孤立对象
+分页列出存储桶中的对象，删除超过宽限期且未被 log_assets、asset_renditions、storage_blobs 引用的对象：
+
+    python scripts/gc_orphans.py --dry-run
+    python scripts/gc_orphans.py
+    python scripts/gc_orphans.py --grace-hours 72 --prefix uploads/
+
+- 每次只处理一页（1000 个）对象，数据库按批查询，内存占用与对象总数无关
+- --dry-run 只统计孤立对象的数量和可回收的字节数
+- 服务进程设置 ORPHAN_GC_INTERVAL_HOURS 后也会定期执行同样的清理
+"""
+import sys
+import os
+import argparse
+import asyncio
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.services.orphan_gc import orphan_collector
+from app.services.rustfs_client import rustfs_client
+
+
+async def gc_orphans(args):
+    """扫描并清理孤立对象"""
+    print("=" * 60)
+    print("清理孤立对象" + ("（试运行）" if args.dry_run else ""))
+    print("=" * 60)
+    print(f"存储桶: {settings.RUSTFS_BUCKET}  前缀: {args.prefix or '(全部)'}  宽限期: {args.grace_hours} 小时\n")
+
+    pages = 0
+
+    def on_page(stats):
+        nonlocal pages
+        pages += 1
+        if pages % args.report_every == 0:
+            print(f"  {stats.summary()}")
+
+    await rustfs_client.start()
+    try:
+        stats = await orphan_collector.collect(
+            dry_run=args.dry_run,
+            grace_hours=args.grace_hours,
+            prefix=args.prefix,
+            on_page=on_page
+        )
+    finally:
+        await rustfs_client.close()
+
+    if args.dry_run:
+        print(f"\n[OK] 可回收: {stats.orphans} 个对象, {stats.orphan_bytes / 1024 / 1024:.1f} MB（共扫描 {stats.scanned} 个）")
+        return True
+
+    print(f"\n[OK] 完成: {stats.summary()}")
+    return stats.failed == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="清理存储桶中未被任何记录引用的对象")
+    parser.add_argument("--dry-run", action="store_true", help="只统计孤立对象和可回收的字节数，不删除")
+    parser.add_argument("--grace-hours", type=float, default=settings.ORPHAN_GC_GRACE_HOURS, help="宽限期（小时），只删除更早创建的对象（默认 ORPHAN_GC_GRACE_HOURS）")
+    parser.add_argument("--prefix", default="", help="只扫描该前缀下的对象")
+    parser.add_argument("--report-every", type=int, default=50, help="每处理多少页输出一次进度（默认 50）")
+    args = parser.parse_args()
+    success = asyncio.run(gc_orphans(args))
+    sys.exit(0 if success else 1)
@@ -0,0 +1,47 @@
+"""
+测试公共夹具
+使用内存 SQLite 数据库（ARRAY 列按 TEXT 建表，测试数据不使用这些列）
+"""
+import os
+import sys
+
+import pytest
+from sqlalchemy import ARRAY, create_engine, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import Base
+import app.models  # noqa: F401  注册所有模型
+
+
+@compiles(ARRAY, 'sqlite')
+def _compile_array_sqlite(type_, compiler, **kw):
+    return "TEXT"
+
+
+@pytest.fixture
+def db_engine():
+    """内存 SQLite 引擎（启用外键约束，所有连接共享同一个数据库）"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    @event.listens_for(engine, "connect")
+    def _enable_foreign_keys(dbapi_connection, _):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db_session(db_engine, monkeypatch):
+    """数据库会话；服务中使用 SessionLocal 创建的独立会话也连接到同一个测试数据库"""
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+    monkeypatch.setattr("app.services.blob_store.SessionLocal", factory)
+    session = factory()
+    yield session
+    session.close()
@@ -0,0 +1,129 @@
+"""
+资源访问接口测试
+"""
+import asyncio
+from collections import OrderedDict
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.api import assets
+from app.models import GenLog, LogAsset
+from app.services.rendition_store import rendition_store
+from app.services.rustfs_client import ObjectStream, RangeNotSatisfiable, rustfs_client
+
+
+def test_original_etag_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(assets, "ETAG_CACHE_MAX_ENTRIES", 2)
+    monkeypatch.setattr(assets, "_etag_cache", OrderedDict())
+    for name in ("a", "b", "c"):
+        assets._original_etag(LogAsset(file_key=f"2026/10/17/{name}.png", content_hash=name * 64))
+
+    assert assets._cached_original_etag("2026/10/17/a.png") is None
+    assert assets._cached_original_etag("2026/10/17/c.png") == f'"{"c" * 64}"'
+    assert len(assets._etag_cache) == 2
+
+
+def test_head_missing_rendition_matches_get_headers(db_session, monkeypatch):
+    async def fail_get_or_create(*args, **kwargs):
+        raise AssertionError("HEAD 请求不应渲染衍生图")
+
+    async def fail_get_object_info(file_key):
+        raise AssertionError("衍生图的 HEAD 请求不应返回原图的元数据")
+
+    monkeypatch.setattr(rendition_store, "get_or_create", fail_get_or_create)
+    monkeypatch.setattr(rustfs_client, "get_object_info", fail_get_object_info)
+    log = GenLog(title="A", log_type="txt2img")
+    db_session.add(log)
+    db_session.flush()
+    db_session.add(LogAsset(log_id=log.id, asset_type="output", file_key="2026/10/17/a.png"))
+    db_session.commit()
+
+    request = Request({"type": "http", "method": "HEAD", "headers": [(b"accept", b"image/webp")]})
+    response = asyncio.run(assets.head_stream_file(request, "2026/10/17/a.png", size="thumb", w=None, db=db_session))
+
+    # 衍生图尚未生成：与 GET 返回的衍生图相同的类型和 ETag，大小未知
+    expected = assets._rendition_headers("2026/10/17/a.png", "thumb", "webp")
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["etag"] == expected["ETag"]
+    assert "content-length" not in response.headers
+
+
+def test_cached_file_response_survives_deletion(tmp_path):
+    path = tmp_path / "thumb.webp"
+    path.write_bytes(b"cached")
+    response = assets._cached_file_response((open(path, 'rb'), "image/webp"), {"ETag": '"abc"'})
+    # 查询缓存后文件被淘汰
+    path.unlink()
+    sent = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "headers": [], "asgi": {"spec_version": "2.4"}}
+    asyncio.run(response(scope, receive, send))
+
+    headers = dict(sent[0]["headers"])
+    assert sent[0]["status"] == 200
+    assert headers[b"content-length"] == b"6"
+    assert headers[b"etag"] == b'"abc"'
+    assert b"".join(message.get("body", b"") for message in sent[1:]) == b"cached"
+
+
+def _range_request(value, if_range=None):
+    headers = [(b"range", value.encode())]
+    if if_range is not None:
+        headers.append((b"if-range", if_range.encode()))
+    return Request({"type": "http", "method": "GET", "headers": headers})
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("bytes=0-99", "bytes=0-99"),
+    ("bytes=100-", "bytes=100-"),
+    ("bytes=-500", "bytes=-500"),
+    ("bytes = 5 - 10", "bytes=5-10"),
+    ("BYTES=0-0", "bytes=0-0"),
+    ("bytes=-0", None),           # 空后缀区间
+    ("bytes=10-5", None),         # 结束位置小于开始位置
+    ("bytes=0-1,5-6", None),      # 多区间按完整内容响应
+    ("bytes=a-b", None),
+    ("bytes=5", None),
+    ("items=0-1", None),
+])
+def test_parse_range(value, expected):
+    assert assets._parse_range(_range_request(value)) == expected
+
+
+def test_parse_range_ignores_stale_if_range():
+    assert assets._parse_range(_range_request("bytes=0-9", '"old"'), '"new"') is None
+    assert assets._parse_range(_range_request("bytes=0-9", '"new"'), '"new"') == "bytes=0-9"
+
+
+def test_stream_original_returns_partial_content(monkeypatch):
+    async def fake_open_stream(file_key, byte_range=None):
+        assert byte_range == "bytes=0-9"
+        return ObjectStream(None, None, 10, "image/png", 1024, content_range="bytes 0-9/100")
+
+    monkeypatch.setattr(rustfs_client, "open_stream", fake_open_stream)
+    response = asyncio.run(assets._stream_original("2026/10/17/a.png", "image/png", {}, "bytes=0-9"))
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 0-9/100"
+    assert response.headers["content-length"] == "10"
+    assert response.headers["accept-ranges"] == "bytes"
+
+
+def test_stream_original_rejects_unsatisfiable_range(monkeypatch):
+    async def fake_open_stream(file_key, byte_range=None):
+        raise RangeNotSatisfiable(100)
+
+    monkeypatch.setattr(rustfs_client, "open_stream", fake_open_stream)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(assets._stream_original("2026/10/17/a.png", "image/png", {}, "bytes=200-"))
+
+    assert exc_info.value.status_code == 416
+    assert exc_info.value.headers["Content-Range"] == "bytes */100"
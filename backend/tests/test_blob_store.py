@@ -0,0 +1,55 @@
+"""
+内容寻址存储测试
+"""
+import asyncio
+
+from app.models import StorageBlob
+from app.services.blob_store import blob_store
+from app.services.rustfs_client import rustfs_client
+
+
+def _fake_delete(monkeypatch):
+    deleted_keys = []
+
+    async def fake_delete_files(keys):
+        keys = list(keys)
+        deleted_keys.extend(keys)
+        return keys, {}
+
+    monkeypatch.setattr(rustfs_client, "delete_files", fake_delete_files)
+    return deleted_keys
+
+
+def test_release_does_not_delete_before_commit(db_session, monkeypatch):
+    deleted_keys = _fake_delete(monkeypatch)
+    db_session.add(StorageBlob(content_hash="abcd", file_key="blobs/ab/cd/abcd.png", byte_size=10, ref_count=1))
+    db_session.commit()
+
+    doomed = blob_store.release(db_session, ["blobs/ab/cd/abcd.png"])
+    assert doomed == ["blobs/ab/cd/abcd.png"]
+    # 事务回滚：引用和对象都保持原样
+    db_session.rollback()
+    assert deleted_keys == []
+    assert db_session.query(StorageBlob).one().ref_count == 1
+
+    doomed = blob_store.release(db_session, ["blobs/ab/cd/abcd.png"])
+    db_session.commit()
+    deleted, failed = asyncio.run(blob_store.delete_objects(doomed))
+    assert deleted == ["blobs/ab/cd/abcd.png"] and failed == []
+    assert db_session.query(StorageBlob).count() == 0
+
+
+def test_delete_objects_keeps_revived_blob(db_session, monkeypatch):
+    deleted_keys = _fake_delete(monkeypatch)
+    db_session.add(StorageBlob(content_hash="abcd", file_key="blobs/ab/cd/abcd.png", byte_size=10, ref_count=1))
+    db_session.commit()
+
+    doomed = blob_store.release(db_session, ["blobs/ab/cd/abcd.png"])
+    db_session.commit()
+    # 提交后、删除对象前同一内容被重新引用
+    db_session.query(StorageBlob).one().ref_count = 1
+    db_session.commit()
+
+    asyncio.run(blob_store.delete_objects(doomed))
+    assert deleted_keys == []
+    assert db_session.query(StorageBlob).one().ref_count == 1
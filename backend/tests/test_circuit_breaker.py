@@ -0,0 +1,124 @@
+"""
+存储服务熔断器测试
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.services import rustfs_client as rustfs_client_module
+from app.services.rustfs_client import CircuitBreaker, rustfs_client
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的单调时钟"""
+    now = [1000.0]
+    monkeypatch.setattr(rustfs_client_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    # 成功后重新计数
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+    clock[0] += 10
+    assert breaker.retry_after() == 20
+    assert breaker.open_count == 1
+
+
+def test_half_open_allows_one_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock[0] += 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # 只放行一个探测请求
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock[0] += 30
+    assert breaker.allow()
+    # 探测失败立即重新打开（不需要再次达到阈值），冷却时间重新计算
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.open_count == 2
+    clock[0] += 29
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()
+
+
+def test_abandoned_probe_released_after_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock[0] += 30
+    # 探测请求被取消（既未成功也未失败）：冷却时间后放行下一个探测请求
+    assert breaker.allow()
+    clock[0] += 29
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()
+
+
+def test_disabled_breaker_never_opens(clock):
+    breaker = CircuitBreaker(failure_threshold=0, reset_timeout=30)
+    for _ in range(100):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_health_check_bypasses_breaker(clock, monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    monkeypatch.setattr(rustfs_client, "breaker", breaker)
+    healthy = [False]
+
+    class FakeS3:
+        async def list_objects_v2(self, **kwargs):
+            if not healthy[0]:
+                raise ConnectionError("unreachable")
+            return {}
+
+    @asynccontextmanager
+    async def fake_s3():
+        yield FakeS3()
+
+    monkeypatch.setattr(rustfs_client, "_s3", fake_s3)
+    _open(breaker)
+
+    # 熔断器打开时仍然检查，失败不重新计算冷却时间
+    clock[0] += 20
+    assert not asyncio.run(rustfs_client.health_check())
+    assert breaker.retry_after() == 10
+
+    # 半开状态下健康检查不占用探测名额，也不关闭熔断器
+    clock[0] += 10
+    healthy[0] = True
+    assert asyncio.run(rustfs_client.health_check())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
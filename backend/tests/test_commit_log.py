@@ -0,0 +1,61 @@
+"""
+直传提交测试
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import logs
+from app.models import GenLog, LogAsset
+from app.services.direct_upload import DirectUploadError, direct_upload
+
+PLANNED = [{'k': "2026/10/17/plan.png", 'n': "plan.png", 's': 10}]
+
+
+def _commit_concurrently(db, monkeypatch, verify_error=None):
+    """提交计划；验证期间模拟并发请求已提交同一计划"""
+    discarded = []
+
+    async def fake_verify(planned, parts=None):
+        log = GenLog(title="winner", log_type="txt2img")
+        db.add(log)
+        db.flush()
+        db.add(LogAsset(log_id=log.id, asset_type="output", file_key=PLANNED[0]['k']))
+        db.commit()
+        if verify_error:
+            raise verify_error
+        return [{"file_key": PLANNED[0]['k'], "format": "png"}]
+
+    async def fake_discard(planned):
+        discarded.extend(planned)
+
+    monkeypatch.setattr(direct_upload, "parse_token", lambda token, user_id: PLANNED)
+    monkeypatch.setattr(direct_upload, "verify", fake_verify)
+    monkeypatch.setattr(direct_upload, "discard", fake_discard)
+
+    body = logs.CommitLogRequest(
+        plan_token="token", title="loser", log_type="txt2img",
+        output_groups=[logs.CommitOutputGroup(files=[0])]
+    )
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(logs.commit_log(body, current_user=SimpleNamespace(id=1), db=db))
+    return exc_info.value, discarded
+
+
+def test_concurrent_commit_creates_one_log(db_session, monkeypatch):
+    error, discarded = _commit_concurrently(db_session, monkeypatch)
+
+    assert error.status_code == 409
+    assert discarded == []
+    assert db_session.query(GenLog).count() == 1
+
+
+def test_failed_commit_keeps_files_of_committed_plan(db_session, monkeypatch):
+    # 并发请求完成分片上传后，本请求完成同一分片上传失败
+    error, discarded = _commit_concurrently(db_session, monkeypatch, DirectUploadError("完成分片上传失败"))
+
+    assert error.status_code == 400
+    assert discarded == []
+    assert db_session.query(LogAsset).filter(LogAsset.file_key == PLANNED[0]['k']).count() == 1
@@ -0,0 +1,60 @@
+"""
+衍生图磁盘缓存测试
+"""
+import os
+
+from app.utils import disk_cache as disk_cache_module
+from app.utils.disk_cache import ACCESS_LOG_NAME, DiskCache
+
+
+def test_opened_file_survives_eviction(tmp_path):
+    cache = DiskCache(str(tmp_path), 10)
+    cache.start()
+    cache.put("renditions/a.png/thumb.webp", b"aaaaaa")
+    f = cache.open("renditions/a.png/thumb.webp")
+    assert f is not None
+
+    # 写入新文件超出预算，淘汰已打开的文件
+    cache.put("renditions/b.png/thumb.webp", b"bbbbbb")
+    assert not cache.contains("renditions/a.png/thumb.webp")
+    with f:
+        assert f.read() == b"aaaaaa"
+    assert cache.open("renditions/a.png/thumb.webp") is None
+    cache.stop()
+
+
+def test_processes_use_separate_slots(tmp_path):
+    first = DiskCache(str(tmp_path), 100)
+    second = DiskCache(str(tmp_path), 100)
+    first.start()
+    second.start()
+    assert first._slot_dir != second._slot_dir
+
+    first.put("renditions/a.png/thumb.webp", b"aaaa")
+    assert second.open("renditions/a.png/thumb.webp") is None
+    # 删除时同时删除其他进程子目录中的副本
+    second.delete("renditions/a.png/thumb.webp")
+    assert first.open("renditions/a.png/thumb.webp") is None
+    first.stop()
+    second.stop()
+
+
+def test_access_log_compacts_in_background(tmp_path, monkeypatch):
+    monkeypatch.setattr(disk_cache_module, "ACCESS_LOG_COMPACT_LINES", 5)
+    cache = DiskCache(str(tmp_path), 100)
+    cache.start()
+    cache.put("renditions/a.png/thumb.webp", b"aaaa")
+    cache.put("renditions/b.png/thumb.webp", b"bbbb")
+    for _ in range(4):
+        f = cache.open("renditions/a.png/thumb.webp")
+        f.close()
+    # 压缩在后台线程中执行，可能已经完成
+    compacting = cache._compacting
+    if compacting is not None:
+        compacting.join()
+    cache.stop()
+
+    with open(os.path.join(cache._slot_dir, ACCESS_LOG_NAME), encoding='utf-8') as f:
+        lines = [line.strip() for line in f]
+    assert lines[:2] == ["renditions/b.png/thumb.webp", "renditions/a.png/thumb.webp"]
+    assert len(lines) < 6
@@ -0,0 +1,52 @@
+"""
+图片处理执行器测试
+"""
+import asyncio
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.services.image_executor import ImageExecutor, ImageTaskTimeout
+
+
+def test_run_recovers_after_worker_exit():
+    executor = ImageExecutor(max_workers=1, max_queue=4, task_timeout=60, decode_budget=100)
+
+    async def scenario():
+        # 子进程在执行任务时退出，进程池损坏
+        with pytest.raises(BrokenProcessPool):
+            await executor.run(os._exit, 1, pixels=10)
+        assert executor.pending == 0
+        assert executor.budget_in_use == 0
+        return await executor.run(pow, 2, 10, pixels=10)
+
+    try:
+        assert asyncio.run(scenario()) == 1024
+        assert executor.pending == 0
+        assert executor.budget_in_use == 0
+    finally:
+        executor.shutdown()
+
+
+def test_timeout_keeps_slot_until_task_finishes():
+    executor = ImageExecutor(max_workers=1, max_queue=4, task_timeout=60, decode_budget=100)
+
+    async def scenario():
+        # 预热：启动子进程，避免启动时间计入超时
+        await executor.run(pow, 2, 2)
+        with pytest.raises(ImageTaskTimeout):
+            await executor.run(time.sleep, 1.5, timeout=0.3, pixels=10)
+        await asyncio.sleep(0.1)
+        # 超时后子进程仍在执行：名额和解码预算不释放
+        assert executor.pending == 1
+        assert executor.budget_in_use == 10
+        await asyncio.sleep(2)
+        assert executor.pending == 0
+        assert executor.budget_in_use == 0
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
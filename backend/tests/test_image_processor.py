@@ -0,0 +1,90 @@
+"""
+图片处理测试
+"""
+import io
+import struct
+import zlib
+
+import pytest
+from PIL import Image
+
+from app.config import settings
+from app.utils import image_processor
+from app.utils.image_processor import (
+    PILLOW_MAX_IMAGE_PIXELS, compose_sprite, get_max_pixels, negotiate_output_format, sprite_layout,
+    validate_image_header
+)
+
+
+def _png_header(width: int, height: int) -> bytes:
+    """只包含 IHDR 的 PNG 头部（不需要分配像素即可声明任意尺寸）"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) + chunk(b"IDAT", b"")
+
+
+def test_pixel_limit_keeps_pillow_default_when_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_MAX_PIXELS", 0)
+    assert get_max_pixels() == PILLOW_MAX_IMAGE_PIXELS
+
+    valid, error = validate_image_header(_png_header(20000, 20000))
+    assert not valid and "像素过多" in error
+    assert validate_image_header(_png_header(4000, 3000)) == (True, None)
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, "jpeg"),
+    ("*/*", "jpeg"),                                        # 通配不代表客户端能解码新格式
+    ("image/webp,*/*", "webp"),
+    ("image/avif,image/webp,*/*", "avif"),                  # q 值相同按配置顺序
+    ("image/avif;q=0.5,image/webp", "webp"),                # q 值高的优先
+    ("image/avif;q=0,image/webp;q=0.1", "webp"),            # q=0 表示不接受
+    ("image/avif;q=0, image/webp;q=0", "jpeg"),
+    ("IMAGE/WEBP ; q=0.8", "webp"),
+    ("image/avif;q=abc,image/webp;q=0.2", "webp"),          # 无效 q 值视为不接受
+])
+def test_negotiate_output_format(accept, expected, monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_NEGOTIATED_FORMATS", ["avif", "webp", "jpeg"])
+    monkeypatch.setattr(image_processor, "is_format_supported", lambda output_format: True)
+    assert negotiate_output_format(accept) == expected
+
+
+def test_negotiate_skips_unsupported_format(monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_NEGOTIATED_FORMATS", ["avif", "webp", "jpeg"])
+    monkeypatch.setattr(image_processor, "is_format_supported", lambda output_format: output_format != "avif")
+    assert negotiate_output_format("image/avif,image/webp") == "webp"
+
+
+@pytest.mark.parametrize("count, expected", [
+    (1, [(0, 0, 24, 24)]),                                                  # 单张占满拼图（图块间距 4）
+    (2, [(0, 0, 10, 24), (14, 0, 10, 24)]),                                 # 左右两列
+    (3, [(0, 0, 10, 10), (14, 0, 10, 10), (0, 14, 10, 10)]),                # 2x2 留空一格
+    (4, [(0, 0, 10, 10), (14, 0, 10, 10), (0, 14, 10, 10), (14, 14, 10, 10)]),
+    (6, [(0, 0, 10, 10), (14, 0, 10, 10), (0, 14, 10, 10), (14, 14, 10, 10)]),  # 最多 4 张
+])
+def test_sprite_layout(count, expected, monkeypatch):
+    monkeypatch.setattr(settings, "SPRITE_TILE_SIZE", 10)
+    layout = sprite_layout(count)
+    assert (layout['width'], layout['height']) == (24, 24)
+    assert [(t['x'], t['y'], t['width'], t['height']) for t in layout['tiles']] == expected
+
+
+def test_compose_sprite_matches_layout(monkeypatch):
+    monkeypatch.setattr(settings, "SPRITE_TILE_SIZE", 10)
+    colors = [(255, 0, 0), (0, 0, 255), (0, 255, 0)]
+    images = []
+    for i, color in enumerate(colors):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40 + i * 20, 30), color).save(buffer, format='PNG')
+        images.append(buffer.getvalue())
+
+    content, content_type = compose_sprite(images, 'jpeg')
+    sprite = Image.open(io.BytesIO(content)).convert('RGB')
+
+    layout = sprite_layout(len(images))
+    assert sprite.size == (layout['width'], layout['height'])
+    # 每个图块中心是对应图片的颜色（有损编码允许少量误差）
+    for tile, color in zip(layout['tiles'], colors):
+        center = sprite.getpixel((tile['x'] + tile['width'] // 2, tile['y'] + tile['height'] // 2))
+        assert all(abs(a - b) < 40 for a, b in zip(center, color))
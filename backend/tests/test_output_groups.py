@@ -0,0 +1,84 @@
+"""
+输出组删除测试
+"""
+import asyncio
+
+from app.api import logs
+from app.models import AssetRendition, GenLog, LogAsset, OutputGroup, StorageBlob
+from app.services.rendition_store import rendition_store
+from app.services.rustfs_client import rustfs_client
+from app.utils.image_processor import SPRITE_SIZE, get_encoder_version
+
+
+def _setup_shared_blob(db):
+    """两条记录引用同一个内容寻址对象：记录 A 的输出组和记录 B 各引用一次"""
+    shared_key = "blobs/ab/cd/abcd.png"
+    db.add(StorageBlob(content_hash="abcd", file_key=shared_key, byte_size=10, ref_count=2))
+    log_a = GenLog(title="A", log_type="txt2img")
+    log_b = GenLog(title="B", log_type="txt2img")
+    db.add_all([log_a, log_b])
+    db.flush()
+    group = OutputGroup(log_id=log_a.id, sort_order=0)
+    db.add(group)
+    db.flush()
+    db.add_all([
+        LogAsset(log_id=log_a.id, asset_type="output", file_key=shared_key, output_group_id=group.id),
+        LogAsset(log_id=log_b.id, asset_type="output", file_key=shared_key),
+    ])
+    db.commit()
+    return shared_key, log_a.id, log_b.id, group.id
+
+
+def test_delete_group_then_log_keeps_shared_blob(db_session, monkeypatch):
+    deleted_keys = []
+
+    async def fake_delete_files(keys):
+        keys = list(keys)
+        deleted_keys.extend(keys)
+        return keys, {}
+
+    monkeypatch.setattr(rustfs_client, "delete_files", fake_delete_files)
+    shared_key, log_a_id, log_b_id, group_id = _setup_shared_blob(db_session)
+
+    asyncio.run(logs.delete_output_group(log_a_id, group_id, current_user=None, db=db_session))
+    assert db_session.query(LogAsset).filter(LogAsset.log_id == log_a_id).count() == 0
+
+    asyncio.run(logs.delete_log(log_a_id, current_user=None, db=db_session))
+
+    blob = db_session.query(StorageBlob).filter(StorageBlob.file_key == shared_key).one()
+    assert blob.ref_count == 1
+    assert shared_key not in deleted_keys
+    assert db_session.query(LogAsset).filter(LogAsset.log_id == log_b_id).count() == 1
+
+
+def test_delete_group_releases_stale_sprite(db_session, monkeypatch):
+    deleted_keys = []
+
+    async def fake_delete_files(keys):
+        keys = list(keys)
+        deleted_keys.extend(keys)
+        return keys, {}
+
+    monkeypatch.setattr(rustfs_client, "delete_files", fake_delete_files)
+    log = GenLog(title="A", log_type="txt2img")
+    db_session.add(log)
+    db_session.flush()
+    groups = [OutputGroup(log_id=log.id, sort_order=i) for i in range(2)]
+    db_session.add_all(groups)
+    db_session.flush()
+    file_keys = ["2026/10/17/a.png", "2026/10/17/b.png"]
+    for group, file_key in zip(groups, file_keys):
+        db_session.add(LogAsset(log_id=log.id, asset_type="output", file_key=file_key, output_group_id=group.id))
+    # 两张输出图片合成的拼图
+    source_key = rendition_store.sprite_source_key(rendition_store.sprite_digest(file_keys))
+    sprite_key = rendition_store.build_key(source_key, SPRITE_SIZE, "webp")
+    db_session.add(AssetRendition(
+        file_key=source_key, size=SPRITE_SIZE, format="webp", encoder_version=get_encoder_version(SPRITE_SIZE),
+        rendition_key=sprite_key, content_type="image/webp", byte_size=10
+    ))
+    db_session.commit()
+
+    asyncio.run(logs.delete_output_group(log.id, groups[1].id, current_user=None, db=db_session))
+
+    assert sprite_key in deleted_keys
+    assert db_session.query(AssetRendition).filter(AssetRendition.file_key == source_key).count() == 0
@@ -0,0 +1,143 @@
+"""
+衍生图存储测试
+"""
+import asyncio
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from app.database import Base
+from app.models import AssetRendition, GenLog, LogAsset
+from app.services import rendition_store as rendition_store_module
+from app.services.rendition_store import rendition_store
+from app.services.rustfs_client import rustfs_client
+
+
+def test_create_releases_caller_connection(db_session, db_engine, monkeypatch):
+    monkeypatch.setattr(rendition_store_module, "engine", db_engine)
+    monkeypatch.setattr(rendition_store_module, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=db_engine))
+    uploaded = {}
+
+    async def fake_download_file(key):
+        return b"original" if key == "2026/10/17/a.png" else None
+
+    async def fake_put_file(key, content, content_type):
+        uploaded[key] = content
+        return True
+
+    async def fake_run(func, *args, pixels=0):
+        # 渲染期间调用方会话不占用连接
+        assert not db_session.in_transaction()
+        return b"rendered", "image/webp"
+
+    monkeypatch.setattr(rustfs_client, "download_file", fake_download_file)
+    monkeypatch.setattr(rustfs_client, "put_file", fake_put_file)
+    monkeypatch.setattr(rendition_store_module.image_executor, "run", fake_run)
+    monkeypatch.setattr(rendition_store_module, "get_decode_pixels", lambda content: 1)
+
+    log = GenLog(title="A", log_type="txt2img")
+    db_session.add(log)
+    db_session.flush()
+    db_session.add(LogAsset(log_id=log.id, asset_type="output", file_key="2026/10/17/a.png"))
+    db_session.commit()
+    db_session.query(LogAsset).first()
+    assert db_session.in_transaction()
+
+    result = asyncio.run(rendition_store.get_or_create(db_session, "2026/10/17/a.png", "thumb", "webp"))
+
+    assert result == (b"rendered", "image/webp")
+    rendition = rendition_store.lookup(db_session, "2026/10/17/a.png", "thumb", "webp")
+    assert rendition is not None
+    assert uploaded == {rendition.rendition_key: b"rendered"}
+
+
+def _file_engine(tmp_path, monkeypatch, pool_size=1):
+    """文件 SQLite 测试数据库，连接池没有溢出连接：签出超过 pool_size 个连接时超时失败"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False},
+        poolclass=QueuePool, pool_size=pool_size, max_overflow=0, pool_timeout=1
+    )
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(rendition_store_module, "engine", engine)
+    monkeypatch.setattr(rendition_store_module, "SessionLocal", factory)
+    return engine, factory
+
+
+def _fake_rendering(monkeypatch, originals):
+    """原图只有 originals 中的键，渲染和拼图合成返回固定内容"""
+    async def fake_download_file(key):
+        return b"original" if key in originals else None
+
+    async def fake_put_file(key, content, content_type):
+        return True
+
+    async def fake_run(func, *args, pixels=0):
+        await asyncio.sleep(0.01)
+        return b"rendered", "image/webp"
+
+    monkeypatch.setattr(rustfs_client, "download_file", fake_download_file)
+    monkeypatch.setattr(rustfs_client, "put_file", fake_put_file)
+    monkeypatch.setattr(rendition_store_module.image_executor, "run", fake_run)
+    monkeypatch.setattr(rendition_store_module, "get_decode_pixels", lambda content: 1)
+
+
+def test_sprite_miss_uses_one_connection_at_a_time(tmp_path, monkeypatch):
+    engine, factory = _file_engine(tmp_path, monkeypatch)
+    file_keys = ["2026/10/17/a.png", "2026/10/17/b.png"]
+    _fake_rendering(monkeypatch, file_keys)
+
+    # 拼图和源图的中等尺寸衍生图都未生成
+    db = factory()
+    result = asyncio.run(rendition_store.get_or_create_sprite(db, file_keys, "webp"))
+    db.close()
+
+    assert result == (b"rendered", "image/webp")
+    with factory() as check:
+        assert check.query(AssetRendition).count() == len(file_keys) + 1
+    engine.dispose()
+
+
+def test_concurrent_sprite_misses(tmp_path, monkeypatch):
+    engine, factory = _file_engine(tmp_path, monkeypatch, pool_size=10)
+    _fake_rendering(monkeypatch, ["2026/10/17/a.png", "2026/10/17/b.png", "2026/10/17/c.png"])
+    checked_out = [0]
+    peak = [0]
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(*args):
+        checked_out[0] += 1
+        peak[0] = max(peak[0], checked_out[0])
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(*args):
+        checked_out[0] -= 1
+
+    # 三个拼图共用源图，第一个拼图同时被请求两次
+    sprites = [
+        ["2026/10/17/a.png", "2026/10/17/b.png"],
+        ["2026/10/17/b.png", "2026/10/17/c.png"],
+        ["2026/10/17/c.png", "2026/10/17/a.png"],
+        ["2026/10/17/a.png", "2026/10/17/b.png"],
+    ]
+
+    async def request(file_keys):
+        db = factory()
+        try:
+            return await rendition_store.get_or_create_sprite(db, file_keys, "webp")
+        finally:
+            db.close()
+
+    async def run():
+        return await asyncio.gather(*(request(file_keys) for file_keys in sprites))
+
+    results = asyncio.run(run())
+
+    assert results == [(b"rendered", "image/webp")] * len(sprites)
+    # 每个拼图任务同一时间只占用一个连接
+    assert peak[0] <= 3
+    with factory() as check:
+        assert check.query(AssetRendition).filter(AssetRendition.size == "medium").count() == 3
+        assert check.query(AssetRendition).filter(AssetRendition.size != "medium").count() == 3
+    engine.dispose()
@@ -0,0 +1,64 @@
+"""
+衍生图后台任务测试
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.models import GenLog, LogAsset
+from app.services import rendition_worker as rendition_worker_module
+from app.services.rendition_worker import STATUS_PROCESSING, RenditionWorker
+
+
+def test_processing_asset_claimable_only_after_claim_expires(db_session):
+    log = GenLog(title="A", log_type="txt2img", created_at=datetime(2020, 1, 1))
+    db_session.add(log)
+    db_session.flush()
+    stale = timedelta(seconds=settings.RENDITION_STALE_SECONDS + 60)
+    # 旧资源刚被认领：不能再次认领；认领已超时：视为中断，可以重新认领
+    fresh = LogAsset(
+        log_id=log.id, asset_type="output", file_key="2020/01/01/a.png", created_at=datetime(2020, 1, 1),
+        rendition_status=STATUS_PROCESSING, rendition_claimed_at=datetime.now()
+    )
+    expired = LogAsset(
+        log_id=log.id, asset_type="output", file_key="2020/01/01/b.png", created_at=datetime(2020, 1, 1),
+        rendition_status=STATUS_PROCESSING, rendition_claimed_at=datetime.now() - stale
+    )
+    db_session.add_all([fresh, expired])
+    db_session.commit()
+
+    claimable = [row[0] for row in db_session.query(LogAsset.id).filter(RenditionWorker._claimable())]
+    assert claimable == [expired.id]
+
+
+def test_sweep_requeues_claim_after_it_expires(db_session, db_engine, monkeypatch):
+    monkeypatch.setattr(rendition_worker_module, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=db_engine))
+    monkeypatch.setattr(settings, "RENDITION_STALE_SECONDS", 1)
+    log = GenLog(title="A", log_type="txt2img")
+    db_session.add(log)
+    db_session.flush()
+    # 进程退出前刚认领的任务：重启时认领尚未超时
+    asset = LogAsset(
+        log_id=log.id, asset_type="output", file_key="2026/10/17/a.png",
+        rendition_status=STATUS_PROCESSING, rendition_claimed_at=datetime.now() - timedelta(seconds=0.5)
+    )
+    db_session.add(asset)
+    db_session.commit()
+    processed = []
+
+    async def fake_process(asset_id):
+        processed.append(asset_id)
+
+    async def run():
+        worker = RenditionWorker(concurrency=1)
+        monkeypatch.setattr(worker, "process", fake_process)
+        await worker.start()
+        await asyncio.sleep(0.2)
+        assert processed == []
+        await asyncio.sleep(1.3)
+        await worker.stop()
+
+    asyncio.run(run())
+    assert processed == [asset.id]
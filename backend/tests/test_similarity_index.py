@@ -0,0 +1,84 @@
+"""
+相似图片索引测试
+"""
+import random
+
+import numpy as np
+from sqlalchemy.orm import sessionmaker
+
+from app.models import GenLog, LogAsset
+from app.services import similarity_index as similarity_index_module
+from app.services.similarity_index import HASH_MASK, MAX_DISTANCE, SimilarityIndex, _Snapshot
+
+
+def _brute_force(hashes, query, max_distance):
+    """逐个计算汉明距离"""
+    matched = [(asset_id, (value ^ query).bit_count()) for asset_id, value in hashes.items()]
+    return sorted((item for item in matched if item[1] <= max_distance), key=lambda item: (item[1], item[0]))
+
+
+def test_add_during_rebuild_keeps_new_hashes(db_session, db_engine, monkeypatch):
+    log = GenLog(title="A", log_type="txt2img")
+    db_session.add(log)
+    db_session.flush()
+    db_session.add(LogAsset(log_id=log.id, asset_type="output", file_key="2026/10/17/a.png", phash=0b1111))
+    db_session.commit()
+    asset_id = db_session.query(LogAsset.id).scalar()
+
+    index = SimilarityIndex(refresh_seconds=0)
+    index.add(asset_id, 0b1111)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+
+    def session_adding_during_query():
+        # 重建读取数据库期间，事件循环增量添加新图片并更新已有图片的哈希
+        session = factory()
+        query = session.query
+
+        def query_and_add(*args):
+            index.add(asset_id, 0b1110)
+            index.add(asset_id + 1, 0)
+            return query(*args)
+
+        session.query = query_and_add
+        return session
+
+    monkeypatch.setattr(similarity_index_module, "SessionLocal", session_adding_during_query)
+    index.rebuild()
+
+    assert index._pending == {asset_id: 0b1110, asset_id + 1: 0}
+    assert index.search(0, max_distance=1, limit=10) == [(asset_id + 1, 0)]
+
+
+def test_search_matches_brute_force():
+    rng = random.Random(1234)
+    queries = [rng.getrandbits(64) for _ in range(20)]
+    hashes = {}
+    # 随机哈希，以及每个查询附近翻转 0~20 位的哈希（覆盖检索上限内外的距离）
+    for i in range(2000):
+        hashes[i + 1] = rng.getrandbits(64)
+    for query in queries:
+        for _ in range(30):
+            value = query
+            for bit in rng.sample(range(64), rng.randint(0, 20)):
+                value ^= 1 << bit
+            hashes[len(hashes) + 1] = value
+
+    index = SimilarityIndex(refresh_seconds=0)
+    ids = list(hashes)
+    index._snapshot = _Snapshot(np.array(ids, dtype=np.int64), np.array([hashes[i] for i in ids], dtype=np.uint64))
+    # 增量添加的哈希同样参与检索
+    for query in queries[:5]:
+        hashes[len(hashes) + 1] = query ^ 0b101
+        index.add(len(hashes), query ^ 0b101)
+
+    for query in queries:
+        for max_distance in (0, 3, 4, 8, 12, MAX_DISTANCE):
+            expected = _brute_force(hashes, query, max_distance)
+            assert index.search(query, max_distance, limit=len(hashes)) == expected
+
+
+def test_search_handles_signed_hashes():
+    # 数据库中按有符号 BIGINT 存储，最高位为 1 的哈希为负数
+    index = SimilarityIndex(refresh_seconds=0)
+    index._snapshot = _Snapshot(np.array([1], dtype=np.int64), np.array([-1 & HASH_MASK], dtype=np.uint64))
+    assert index.search(-2, 1, limit=10) == [(1, 1)]
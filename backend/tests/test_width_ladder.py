@@ -0,0 +1,58 @@
+"""
+宽度档位和 srcset 测试
+"""
+import pytest
+
+from app.api.logs import get_srcset
+from app.config import settings
+from app.utils.image_processor import get_rendition_spec, is_rendition_size, snap_width, width_size_label
+
+LADDER = [320, 640, 1280]
+
+
+@pytest.fixture(autouse=True)
+def width_ladder(monkeypatch):
+    monkeypatch.setattr(settings, "RENDITION_WIDTH_LADDER", LADDER)
+
+
+@pytest.mark.parametrize("width, expected", [
+    (1, 320),
+    (320, 320),
+    (321, 640),
+    (1280, 1280),
+    (5000, 1280),  # 超出最大档位时使用最大档位
+])
+def test_snap_width(width, expected):
+    assert snap_width(width) == expected
+    assert width_size_label(width) == f"w{expected}"
+
+
+def test_width_labels_are_rendition_sizes():
+    assert is_rendition_size("w640")
+    assert get_rendition_spec("w640")[0] == 640
+    # 不在档位上的宽度不是合法尺寸，避免任意宽度造成缓存碎片
+    assert not is_rendition_size("w641")
+    assert not is_rendition_size("wabc")
+
+
+def test_srcset_covers_ladder():
+    assert get_srcset("a/b.png") == (
+        "/api/assets/a%2Fb.png/stream?w=320 320w, "
+        "/api/assets/a%2Fb.png/stream?w=640 640w, "
+        "/api/assets/a%2Fb.png/stream?w=1280 1280w"
+    )
+
+
+def test_srcset_stops_at_original_width():
+    # 原图宽度不在档位上：补充覆盖原图宽度的档位，描述符为原图实际宽度
+    assert get_srcset("a.png", max_width=900) == (
+        "/api/assets/a.png/stream?w=320 320w, "
+        "/api/assets/a.png/stream?w=640 640w, "
+        "/api/assets/a.png/stream?w=1280 900w"
+    )
+    assert get_srcset("a.png", max_width=640) == (
+        "/api/assets/a.png/stream?w=320 320w, "
+        "/api/assets/a.png/stream?w=640 640w"
+    )
+    # 原图比最小档位还窄
+    assert get_srcset("a.png", max_width=100) == "/api/assets/a.png/stream?w=320 100w"
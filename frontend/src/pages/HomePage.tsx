@@ -684,7 +684,7 @@ const HomePage: React.FC = () => {
                           position: 'relative',
                         }}
                       >
-                        {/* 多张图片时的网格预览 */}
+                        {/* 多张图片时的网格预览（有拼图时只请求一张服务端合成的拼图） */}
                         {log.preview_urls && log.preview_urls.length > 1 && log.output_count && log.output_count > 1 ? (
                           <div style={{ 
                             display: 'grid', 
@@ -694,7 +694,23 @@ const HomePage: React.FC = () => {
                             height: '100%',
                             gap: '2px',
                           }}>
-                            {log.preview_urls.slice(0, 4).map((url, idx) => (
+                            {log.sprite ? (
+                              <div style={{ gridColumn: '1 / -1', gridRow: '1 / -1', overflow: 'hidden', position: 'relative' }}>
+                                <NSFWImage
+                                  src={log.sprite.url}
+                                  alt={log.title}
+                                  isNSFW={log.is_nsfw || false}
+                                  disableModal={true}  // 网格视图中禁用Modal，点击卡片直接进入详情页
+                                  style={{ 
+                                    width: '100%', 
+                                    height: '100%', 
+                                    objectFit: 'cover',
+                                  }}
+                                  preview={false}
+                                  loading="lazy"
+                                />
+                              </div>
+                            ) : log.preview_urls.slice(0, 4).map((url, idx) => (
                               <div key={idx} style={{ overflow: 'hidden', position: 'relative' }}>
                                 <NSFWImage
                                   src={url}
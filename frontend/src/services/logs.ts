@@ -21,6 +21,20 @@ export interface CreateLogParams {
   isNsfw?: boolean  // 是否为NSFW内容
 }
 
+export interface SpriteTile {
+  x: number
+  y: number
+  width: number
+  height: number
+}
+
+export interface LogSprite {
+  url: string
+  width: number
+  height: number
+  tiles: SpriteTile[]  // 与 preview_urls 一一对应
+}
+
 export interface LogItem {
   id: number
   title: string
@@ -30,6 +44,7 @@ export interface LogItem {
   cover_url?: string
   output_count?: number  // 输出图片总数
   preview_urls?: string[]  // 预览图 URL（最多4张）
+  sprite?: LogSprite | null  // 预览图拼图（多张预览图时返回，一次请求显示网格预览）
   created_at: string
   is_nsfw?: boolean  // 是否为NSFW内容
 }
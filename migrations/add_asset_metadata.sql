@@ -0,0 +1,19 @@
+-- 添加资源图片元数据（列表接口直接返回，前端无需下载图片即可布局）
+-- 版本: 1.7
+-- 日期: 2026-10-17
+
+-- 上传时从图片头部读取的宽高、文件大小和格式
+ALTER TABLE log_assets ADD COLUMN IF NOT EXISTS width INTEGER;
+ALTER TABLE log_assets ADD COLUMN IF NOT EXISTS height INTEGER;
+ALTER TABLE log_assets ADD COLUMN IF NOT EXISTS byte_size INTEGER;
+ALTER TABLE log_assets ADD COLUMN IF NOT EXISTS format VARCHAR(10);
+
+-- 低质量占位图（LQIP），由衍生图后台任务生成
+ALTER TABLE log_assets ADD COLUMN IF NOT EXISTS lqip TEXT;
+
+-- 添加注释
+COMMENT ON COLUMN log_assets.width IS '原图宽度（像素）';
+COMMENT ON COLUMN log_assets.height IS '原图高度（像素）';
+COMMENT ON COLUMN log_assets.byte_size IS '原图文件大小（字节）';
+COMMENT ON COLUMN log_assets.format IS '原图格式: png, jpeg, webp, gif';
+COMMENT ON COLUMN log_assets.lqip IS '低质量占位图 data URI（约 16px），由衍生图后台任务生成';
@@ -0,0 +1,26 @@
+-- 添加衍生图存储
+-- 版本: 1.4
+-- 日期: 2026-10-17
+
+-- 衍生图表：每个 (原图, 尺寸, 格式, 编码版本) 只渲染一次，写回对象存储后在此登记
+CREATE TABLE IF NOT EXISTS asset_renditions (
+    id SERIAL PRIMARY KEY,
+    file_key TEXT NOT NULL,
+    size VARCHAR(32) NOT NULL,
+    format VARCHAR(10) NOT NULL,
+    encoder_version VARCHAR(32) NOT NULL,
+    rendition_key TEXT NOT NULL UNIQUE,
+    content_type VARCHAR(50) NOT NULL,
+    byte_size INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_asset_rendition UNIQUE (file_key, size, format, encoder_version)
+);
+
+-- 添加索引
+CREATE INDEX IF NOT EXISTS idx_asset_renditions_file_key ON asset_renditions (file_key);
+
+-- 添加注释
+COMMENT ON TABLE asset_renditions IS '衍生图表，记录已持久化的缩略图、中等尺寸等衍生图';
+COMMENT ON COLUMN asset_renditions.file_key IS '原图存储键';
+COMMENT ON COLUMN asset_renditions.encoder_version IS '编码参数版本，参数变化后旧衍生图不再命中';
+COMMENT ON COLUMN asset_renditions.rendition_key IS '衍生图在对象存储中的键';
@@ -0,0 +1,9 @@
+-- 添加原图内容哈希（用于稳定的 ETag）
+-- 版本: 1.6
+-- 日期: 2026-10-17
+
+-- 上传时计算的原图 SHA-256（十六进制），旧数据为空（ETag 退化为按存储键计算）
+ALTER TABLE log_assets ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+-- 添加注释
+COMMENT ON COLUMN log_assets.content_hash IS '原图内容 SHA-256（十六进制），用作 ETag；为空表示旧数据';
@@ -0,0 +1,9 @@
+-- 添加资源感知哈希（查找近似重复图片）
+-- 版本: 1.9
+-- 日期: 2026-10-17
+
+-- 64 位 dHash，由衍生图后台任务计算，旧数据使用 scripts/backfill_phash.py 回填
+ALTER TABLE log_assets ADD COLUMN IF NOT EXISTS phash BIGINT;
+
+-- 添加注释
+COMMENT ON COLUMN log_assets.phash IS '感知哈希（64 位 dHash，有符号存储），汉明距离越小图片越相似';
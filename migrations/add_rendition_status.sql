@@ -0,0 +1,17 @@
+-- 添加衍生图后台生成状态
+-- 版本: 1.5
+-- 日期: 2026-10-17
+
+-- 衍生图生成状态：pending（等待生成）、processing（生成中）、ready（已生成）、failed（生成失败）
+-- 旧数据保持为空，访问时按需生成
+ALTER TABLE log_assets ADD COLUMN IF NOT EXISTS rendition_status VARCHAR(20);
+
+-- 后台任务认领（开始生成）的时间：processing 状态超过 RENDITION_STALE_SECONDS 未完成视为进程退出时中断，可重新认领
+ALTER TABLE log_assets ADD COLUMN IF NOT EXISTS rendition_claimed_at TIMESTAMP;
+
+-- 后台任务启动时按状态恢复未完成的任务
+CREATE INDEX IF NOT EXISTS idx_assets_rendition_status ON log_assets (rendition_status) WHERE rendition_status IN ('pending', 'processing');
+
+-- 添加注释
+COMMENT ON COLUMN log_assets.rendition_status IS '衍生图生成状态: pending, processing, ready, failed；为空表示旧数据，访问时按需生成';
+COMMENT ON COLUMN log_assets.rendition_claimed_at IS '衍生图后台任务认领时间，用于判断生成中的任务是否已中断';
@@ -0,0 +1,19 @@
+-- 添加内容寻址存储对象表
+-- 版本: 1.8
+-- 日期: 2026-10-17
+
+-- 存储对象表：原图按内容哈希存储，相同内容只保存一份，ref_count 为引用该对象的资源数
+-- 旧数据（按 uuid 生成的存储键）不在此表中，删除时直接删除对象
+CREATE TABLE IF NOT EXISTS storage_blobs (
+    content_hash VARCHAR(64) PRIMARY KEY,
+    file_key TEXT NOT NULL UNIQUE,
+    byte_size INTEGER NOT NULL DEFAULT 0,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 添加注释
+COMMENT ON TABLE storage_blobs IS '内容寻址存储对象表，相同内容的原图只保存一份';
+COMMENT ON COLUMN storage_blobs.content_hash IS '内容 SHA-256（十六进制）';
+COMMENT ON COLUMN storage_blobs.file_key IS '对象存储键，格式: blobs/<哈希前2位>/<哈希次2位>/<哈希>.<扩展名>';
+COMMENT ON COLUMN storage_blobs.ref_count IS '引用该对象的资源数，减为 0 时删除对象';